@@ -0,0 +1,18 @@
+"""
+ASGI config for haal_centraal_proxy project.
+
+It exposes the ASGI callable as a module-level variable named ``application``.
+Set ``BRP_ASYNC_VIEWS=true`` to let the views await Haal Centraal without blocking a thread.
+"""
+
+import os
+
+from django.core.asgi import get_asgi_application
+
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "haal_centraal_proxy.settings")
+
+application = get_asgi_application()
+
+from haal_centraal_proxy.bevragingen.warmup import schedule_warm_up  # noqa: E402
+
+schedule_warm_up()
@@ -0,0 +1,401 @@
+"""Asyncio variant of the Haal Centraal API client, for ASGI deployments."""
+
+import asyncio
+import contextlib
+import logging
+import threading
+import time
+import weakref
+from collections.abc import Callable
+from functools import partial
+
+import httpx
+
+from .cache import CachedResponse
+from .client import USER_AGENT, BrpClient
+from .coalescing import AsyncSingleFlight, get_flight_key, get_key
+from .exceptions import DeadlineExceeded, GatewayTimeout, ServiceUnavailable
+from .transports import ConnectionStats
+
+logger = logging.getLogger(__name__)
+
+# The connections of an async client are bound to the event loop that created them.
+# Hence, the clients are shared per event loop instead of per process.
+_clients_per_loop: weakref.WeakKeyDictionary[
+    asyncio.AbstractEventLoop, dict[tuple[type, str], "AsyncBrpClient"]
+] = weakref.WeakKeyDictionary()
+_clients_lock = threading.Lock()
+
+
+class AsyncBrpClient(BrpClient):
+    """Haal Centraal API client that uses asyncio.
+
+    While waiting for the remote server, the event loop can handle other requests.
+    The retries, hedging, OAuth token handling and error translation are shared
+    with :class:`BrpClient`, only the I/O is replaced by the asyncio versions.
+    """
+
+    timeout_errors = (TimeoutError, httpx.TimeoutException)
+    connection_errors = (OSError, httpx.TransportError)
+
+    def __init__(
+        self,
+        endpoint_url,
+        *,
+        cert_file=None,
+        key_file=None,
+        ca_dir=None,
+        pool_maxsize: int = 10,
+        http2: bool = False,
+        transport: httpx.AsyncBaseTransport | None = None,
+        **kwargs,
+    ):
+        """Initialize the client configuration.
+        This takes the same parameters as :class:`BrpClient`.
+
+        :param transport: Optional custom transport (e.g. for testing).
+        """
+        super().__init__(
+            endpoint_url,
+            cert_file=cert_file,
+            key_file=key_file,
+            ca_dir=ca_dir,
+            pool_maxsize=pool_maxsize,
+            **kwargs,
+        )
+
+        # The synchronous session is only used for the OAuth calls.
+        # The connection statistics are tracked for the async session instead.
+        self._connection_stats = ConnectionStats() if http2 else None
+        self._async_session = httpx.AsyncClient(
+            http2=http2,
+            verify=self._ssl_context,
+            timeout=httpx.Timeout(self.timeout[1], connect=self.timeout[0]),
+            limits=httpx.Limits(max_connections=None, max_keepalive_connections=pool_maxsize),
+            headers={
+                "Accept": "application/json; charset=utf-8",
+                "Content-Type": "application/json; charset=utf-8",
+                "User-Agent": USER_AGENT,
+            },
+            transport=transport,
+        )
+
+    async def aclose(self):
+        """Close all connections of this client."""
+        await self._async_session.aclose()
+        self.close()
+
+    async def warm_up(
+        self,
+        hc_request: dict | None,
+        connections: int = 1,
+        timeout: tuple[float, float] | None = None,
+    ) -> None:
+        """Async version of :meth:`BrpClient.warm_up`.
+        The connections are opened for the event loop that runs this, as the client is bound to it.
+        """
+        timeout = timeout or self.timeout
+        connections = max(1, connections)
+        if self._token_store is not None:
+            await self._aget_token()
+
+        responses = await asyncio.gather(
+            *(self._acall_once(hc_request, timeout) for _ in range(connections))
+        )
+        for response in responses:
+            await response.aclose()
+        logger.info("Opened %d connections to %s", connections, self.endpoint_url)
+
+    def _get_single_flight(self) -> AsyncSingleFlight:
+        # The calls are shared within the event loop of this client.
+        return AsyncSingleFlight(str(self.endpoint_url))
+
+    def get_stats(self) -> dict:
+        """Provide statistics of the client, e.g. for health checks."""
+        stats = super().get_stats()
+        if self._connection_stats is not None:
+            stats["connections"] = self._connection_stats.as_dict()
+        return stats
+
+    async def call(
+        self,
+        hc_request: dict | None = None,
+        *,
+        timeout: tuple[float, float] | None = None,
+        deadline: float | None = None,
+        hedge: bool = False,
+        cache_ttl: float = 0,
+        stream: bool = False,
+    ) -> httpx.Response:
+        """Make the HTTP POST call to the endpoint.
+        When the circuit breaker is open, this fails immediately.
+        When an identical call is already in progress, its response is shared.
+
+        :param hc_request: The JSON body to send.
+        :param timeout: The (connect, read) timeout for each attempt.
+        :param deadline: How many seconds the caller still waits for the response.
+        :param hedge: Whether a second call can be made when the first one is slow.
+        :param cache_ttl: How many seconds the response can be cached (if a cache is used).
+            Responses from the cache have a ``from_cache`` attribute.
+        :param stream: Whether the response body is read by the caller while it's received.
+            Such a call is not cached, coalesced or hedged. The caller should close the response.
+        """
+        timeout = timeout or self.timeout
+        if deadline is not None and deadline <= 0:
+            logger.error("Proxy call to %s not made, deadline already exceeded", self.endpoint_url)
+            raise DeadlineExceeded()
+
+        if stream:
+            # The body can only be read once, so it can't be shared with other callers.
+            return await self._acall_streamed(hc_request, timeout, deadline)
+
+        key = get_key(hc_request)
+        if self.response_cache is None:
+            cache_ttl = 0
+        elif cache_ttl and (cached := self.response_cache.get(key)) is not None:
+            logger.info("Proxy call to %s answered from cache", self.endpoint_url)
+            return self._build_cached_response(cached)
+
+        if self._single_flight is None:
+            return await self._acall_guarded(hc_request, timeout, deadline, hedge, key, cache_ttl)
+
+        return await self._single_flight.do(
+            get_flight_key(key, deadline),
+            lambda: self._acall_guarded(hc_request, timeout, deadline, hedge, key, cache_ttl),
+            timeout=deadline,
+        )
+
+    async def _acall_guarded(
+        self,
+        hc_request: dict | None,
+        timeout: tuple[float, float],
+        deadline: float | None,
+        hedge: bool = False,
+        cache_key: bytes | None = None,
+        cache_ttl: float = 0,
+    ) -> httpx.Response:
+        """Make the call, unless the bulkhead is full or the circuit breaker is open.
+        Successful responses are stored in the cache.
+        """
+        async with self._abulkhead_call():
+            with self._circuit_breaker_call():
+                response = await self._acall(hc_request, timeout, deadline, hedge)
+
+        if cache_ttl:
+            self._store_response(cache_key, response, cache_ttl)
+        return response
+
+    async def _acall_streamed(
+        self, hc_request: dict | None, timeout: tuple[float, float], deadline: float | None
+    ) -> httpx.Response:
+        """Make the call, but leave the body to be read by the caller.
+        The caller should finish with :meth:`aclose_stream`.
+
+        The body may be read by another event loop (e.g. an async view under WSGI),
+        hence the guards are synchronous context managers.
+        """
+        with contextlib.ExitStack() as guards:
+            if self.bulkhead is not None:
+                await self.bulkhead.aacquire()
+                guards.enter_context(self.bulkhead.hold())
+            guards.enter_context(self._circuit_breaker_call())
+            response = await self._acall(hc_request, timeout, deadline, stream=True)
+            response.guards = guards.pop_all()
+        return response
+
+    async def aclose_stream(
+        self, response: httpx.Response, exception: BaseException | None = None
+    ) -> None:
+        """Close a streamed response, and record the outcome of the call.
+
+        :param exception: The error that occurred while reading the body.
+        """
+        try:
+            await response.aclose()
+        finally:
+            if (guards := getattr(response, "guards", None)) is not None:
+                guards.__exit__(*self._get_stream_exc_info(exception))
+
+    def _abulkhead_call(self) -> contextlib.AbstractAsyncContextManager:
+        """Wait for a free slot of the bulkhead (if there is one), without blocking."""
+        return self.bulkhead.acall() if self.bulkhead is not None else contextlib.nullcontext()
+
+    def _build_cached_response(self, cached: CachedResponse) -> httpx.Response:
+        """Construct the response object for a cached response."""
+        response = httpx.Response(
+            httpx.codes.OK,
+            headers={"Content-Type": cached.content_type},
+            content=cached.content,
+            request=httpx.Request("POST", str(self.endpoint_url)),
+        )
+        response.from_cache = True
+        return response
+
+    async def _acall(
+        self,
+        hc_request: dict | None,
+        timeout: tuple[float, float],
+        deadline: float | None,
+        hedge: bool = False,
+        stream: bool = False,
+    ) -> httpx.Response:
+        """Make the call, retrying temporary failures as far as the retry policy allows this."""
+        logger.debug("calling %s", self.endpoint_url)
+        t0 = time.perf_counter_ns()
+        self.retry_policy.start()
+        attempt = 1
+        while True:
+            attempt_timeout = self.retry_policy.get_timeout(t0, timeout, deadline)
+            try:
+                if hedge and self.hedging_policy is not None:
+                    result = await self._acall_hedged(hc_request, attempt_timeout)
+                else:
+                    result = await self._acall_once(hc_request, attempt_timeout, stream)
+            except (GatewayTimeout, ServiceUnavailable) as e:
+                result = e
+
+            delay = self._get_retry(result, attempt, t0, deadline, timeout, attempt_timeout)
+            if delay is None:
+                break
+
+            await asyncio.sleep(delay)
+            attempt += 1
+
+        return self._handle_response(hc_request, result, t0, retries=attempt - 1)
+
+    async def _acall_once(
+        self, hc_request: dict | None, timeout: tuple[float, float], stream: bool = False
+    ) -> httpx.Response:
+        """Perform a single attempt of the call, including the OAuth handling."""
+        host = None
+        try:
+            # Request the token if needed
+            if self._token_store is not None:
+                host = self.oauth_endpoint_url
+                await self._aget_token()
+
+            host = self._host
+            response = await self._apost(hc_request, timeout, stream=stream)
+
+            if self._is_token_rejected(response):
+                host = self.oauth_endpoint_url
+                await asyncio.to_thread(self._renew_rejected_token, response)
+
+                host = self._host
+                response = await self._apost(hc_request, timeout, stream=stream)
+                self._token_store.counters.incr("replays")
+        except (*self.timeout_errors, *self.connection_errors) as e:
+            raise self._get_connection_error(e, host) from e
+
+        return response
+
+    async def _acall_hedged(
+        self, hc_request: dict | None, timeout: tuple[float, float]
+    ) -> httpx.Response:
+        """Perform an attempt, with a second (hedged) call when the first one is slow.
+        The first response is used, the other call is cancelled.
+        """
+        self.hedging_policy.start()
+        first = asyncio.create_task(self._acall_once(hc_request, timeout))
+        first.add_done_callback(partial(self._record_latency, time.perf_counter_ns()))
+        tasks = {first}
+        try:
+            delay = self.hedging_policy.get_delay()
+            if delay is not None:
+                done, _ = await asyncio.wait(tasks, timeout=delay)
+                if not done and self._allow_hedge(delay):
+                    hedged = asyncio.create_task(self._acall_once(hc_request, timeout))
+                    hedged.add_done_callback(partial(self._release_hedge, time.perf_counter_ns()))
+                    tasks.add(hedged)
+
+            pending = tasks
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                if (winner := self._get_hedge_winner(first, done)) is not None:
+                    return winner.result()
+
+            raise first.exception()
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    async def _aget_token(self):
+        """Provide a valid token. The token store is only accessed in a thread
+        when the token that's kept in memory should be refreshed.
+        """
+        if (token := self._token_store.get_fresh_token()) is not None:
+            return self._use_token(token)
+        else:
+            return await asyncio.to_thread(self._get_token)
+
+    async def _apost(
+        self, hc_request: dict | None, timeout: tuple[float, float], stream: bool = False
+    ) -> httpx.Response:
+        """Perform the actual HTTP request.
+        With ``stream=True``, only the body of a successful response is left unread.
+        """
+        timeout = httpx.Timeout(timeout[1], connect=timeout[0])
+        headers = {}
+        if self._token_store is not None:
+            headers["Authorization"] = f"Bearer {self._session.token['access_token']}"
+
+        if self._connection_stats is None:
+            request = self._async_session.build_request(
+                "POST", str(self.endpoint_url), json=hc_request, headers=headers, timeout=timeout
+            )
+            response = await self._async_session.send(request, stream=stream)
+        else:
+            with self._connection_stats.track():
+                request = self._async_session.build_request(
+                    "POST",
+                    str(self.endpoint_url),
+                    json=hc_request,
+                    headers=headers,
+                    timeout=timeout,
+                    extensions={"trace": self._connection_stats.atrace},
+                )
+                response = await self._async_session.send(request, stream=stream)
+
+        if stream and not response.is_success:
+            await response.aread()  # read the error for the response handling.
+        return response
+
+    def _get_reason(self, response: httpx.Response) -> str:
+        return response.reason_phrase
+
+    def _get_status_error(self, response: httpx.Response) -> httpx.HTTPStatusError:
+        """Provide the exception that the HTTP library would raise for the error status."""
+        try:
+            response.raise_for_status()
+        except httpx.HTTPStatusError as e:
+            return e
+
+
+def get_async_client(
+    endpoint_url: str,
+    client_class: type[AsyncBrpClient] = AsyncBrpClient,
+    kwargs_factory: Callable[[], dict] | None = None,
+    **kwargs,
+) -> AsyncBrpClient:
+    """Return the shared async client for an endpoint, for the currently running event loop.
+    The keyword arguments are only used when the client is constructed.
+
+    :param kwargs_factory: Provides the keyword arguments, only when the client is constructed.
+    """
+    loop = asyncio.get_running_loop()
+    key = (client_class, endpoint_url)
+    try:
+        return _clients_per_loop[loop][key]
+    except KeyError:
+        pass
+
+    with _clients_lock:
+        clients = _clients_per_loop.setdefault(loop, {})
+        try:
+            return clients[key]
+        except KeyError:
+            if kwargs_factory is not None:
+                kwargs = {**kwargs_factory(), **kwargs}
+            client = client_class(endpoint_url, **kwargs)
+            clients[key] = client
+            return client
@@ -0,0 +1,218 @@
+"""Bulkhead for the calls to Haal Centraal.
+
+When one endpoint becomes slow, every request for it would wait for the remote server.
+This ties up all worker threads, so requests for the other endpoints can't be handled either.
+The bulkhead limits the number of concurrent calls per endpoint. A few calls can wait
+for their turn, other calls fail immediately.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import contextlib
+import logging
+import threading
+import time
+from collections import deque
+from collections.abc import AsyncIterator, Callable, Iterator
+
+from .exceptions import BulkheadFull
+from .metrics import Counters
+
+logger = logging.getLogger(__name__)
+
+# Process-wide registry, so all clients of a worker share the limit of an endpoint.
+_bulkheads: dict[str, Bulkhead] = {}
+_bulkheads_lock = threading.Lock()
+
+
+class Bulkhead:
+    """Limit the number of concurrent calls to an endpoint.
+
+    * When fewer calls are in flight than the limit, the call is made directly.
+    * Otherwise, the call waits in a queue until another call finishes.
+    * When the queue is full, or the call would wait too long, it fails immediately.
+
+    The expected waiting time is based on the average duration of the recent calls.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        *,
+        max_concurrent: int = 10,
+        max_queue: int = 10,
+        max_wait: float = 5.0,
+    ):
+        """Initialize the bulkhead.
+
+        :param name: Name for logging (e.g. the endpoint URL).
+        :param max_concurrent: Maximum number of calls in flight.
+        :param max_queue: Maximum number of calls that wait for their turn.
+        :param max_wait: Maximum number of seconds a call waits for its turn.
+        """
+        self.name = name
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.max_wait = max_wait
+        self.counters = Counters()
+
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self._max_in_flight = 0
+        self._waiters: deque[Callable[[], None]] = deque()
+        self._avg_duration = 0.0
+
+    def __repr__(self):
+        return f"<{self.__class__.__qualname__}: {self.name} {self._in_flight}>"
+
+    @contextlib.contextmanager
+    def call(self) -> Iterator[None]:
+        """Wrap the call to the endpoint.
+        This waits for a free slot, or raises :class:`BulkheadFull`.
+        """
+        self.acquire()
+        with self.hold():
+            yield
+
+    @contextlib.asynccontextmanager
+    async def acall(self) -> AsyncIterator[None]:
+        """Async version of :meth:`call`, which waits without blocking the event loop."""
+        await self.aacquire()
+        with self.hold():
+            yield
+
+    def acquire(self) -> None:
+        """Wait for a free slot, or raise :class:`BulkheadFull`."""
+        event = self._enter(threading.Event)
+        if event is not None and not event.wait(self.max_wait) and self._leave_queue(event.set):
+            raise self._rejected(self.max_wait)
+
+    async def aacquire(self) -> None:
+        """Async version of :meth:`acquire`, which waits without blocking the event loop."""
+        if (waiter := self._enter(_AsyncWaiter)) is not None:
+            try:
+                await asyncio.wait_for(asyncio.shield(waiter.future), self.max_wait)
+            except TimeoutError:
+                if self._leave_queue(waiter.set):
+                    raise self._rejected(self.max_wait) from None
+            except asyncio.CancelledError:
+                if not self._leave_queue(waiter.set):
+                    self.release()  # the slot was already given to this call.
+                raise
+
+    @contextlib.contextmanager
+    def hold(self) -> Iterator[None]:
+        """Keep the acquired slot during the call, and give it back afterwards."""
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.release(time.perf_counter() - t0)
+
+    def _enter(self, waiter_class: type):
+        """Take a slot, or return a waiter to wait for a slot.
+        This raises :class:`BulkheadFull` when the call can't wait.
+        """
+        with self._lock:
+            if self._in_flight < self.max_concurrent and not self._waiters:
+                self._take_slot()
+                return None
+
+            expected_wait = (len(self._waiters) + 1) * self._avg_duration / self.max_concurrent
+            if len(self._waiters) < self.max_queue and expected_wait <= self.max_wait:
+                waiter = waiter_class()
+                self._waiters.append(waiter.set)
+                self.counters.incr("queued")
+                return waiter
+
+        raise self._rejected(expected_wait)
+
+    def try_acquire(self) -> bool:
+        """Take a slot when one is free, without waiting or rejecting the call.
+        The slot should be given back with :meth:`release`.
+        """
+        with self._lock:
+            if self._in_flight < self.max_concurrent and not self._waiters:
+                self._take_slot()
+                return True
+            return False
+
+    def _leave_queue(self, grant: Callable[[], None]) -> bool:
+        """Stop waiting. This returns ``False`` when the slot was given to the call already."""
+        with self._lock:
+            try:
+                self._waiters.remove(grant)
+            except ValueError:
+                return False
+            else:
+                return True
+
+    def _rejected(self, expected_wait: float) -> BulkheadFull:
+        self.counters.incr("rejected")
+        logger.warning("Bulkhead for %s is full, call is not made", self.name)
+        return BulkheadFull(wait=max(1, round(expected_wait)))
+
+    def _take_slot(self):
+        self._in_flight += 1
+        self._max_in_flight = max(self._max_in_flight, self._in_flight)
+
+    def release(self, duration: float | None = None) -> None:
+        """Give back the slot, which is handed to the first waiting call.
+        Without a duration (e.g. no call was made), the average duration is not updated.
+        """
+        with self._lock:
+            if duration is not None:
+                # Exponential moving average, so the expected waiting time follows the endpoint.
+                self._avg_duration = (
+                    0.8 * self._avg_duration + 0.2 * duration if self._avg_duration else duration
+                )
+            if self._waiters:
+                # The slot is passed on, so the number of calls in flight stays the same.
+                self._waiters.popleft()()
+            else:
+                self._in_flight -= 1
+
+    def get_stats(self) -> dict:
+        """Provide the current load and statistics of the bulkhead."""
+        with self._lock:
+            return {
+                "in_flight": self._in_flight,
+                "max_in_flight": self._max_in_flight,
+                "queue_depth": len(self._waiters),
+                **self.counters.as_dict(),
+            }
+
+
+class _AsyncWaiter:
+    """Let a coroutine wait for a slot that's released by another thread or event loop."""
+
+    def __init__(self):
+        self.loop = asyncio.get_running_loop()
+        self.future = self.loop.create_future()
+
+    def set(self):
+        self.loop.call_soon_threadsafe(self._set_result)
+
+    def _set_result(self):
+        if not self.future.done():
+            self.future.set_result(None)
+
+
+def get_bulkhead(name: str, **kwargs) -> Bulkhead:
+    """Return the shared bulkhead for an endpoint.
+    The keyword arguments are only used when the bulkhead is constructed.
+    """
+    with _bulkheads_lock:
+        try:
+            return _bulkheads[name]
+        except KeyError:
+            bulkhead = Bulkhead(name, **kwargs)
+            _bulkheads[name] = bulkhead
+            return bulkhead
+
+
+def clear_bulkheads() -> None:
+    """Remove all shared bulkheads."""
+    with _bulkheads_lock:
+        _bulkheads.clear()
@@ -0,0 +1,137 @@
+"""Short-lived cache for the responses of Haal Centraal.
+
+Identical queries are often made a few seconds apart (e.g. when a page is reloaded).
+These are answered from the cache, which is kept in memory of the worker process.
+As the responses contain personal data, they are stored encrypted with a key that never
+leaves the process. Likewise, the cache key is a keyed digest of the query.
+The cache only replaces the call: each request still performs its own authorization,
+response transformation and audit logging.
+"""
+
+from __future__ import annotations
+
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import NamedTuple
+
+from cryptography.fernet import Fernet
+
+from .metrics import Counters
+
+logger = logging.getLogger(__name__)
+
+# Process-wide registry, so all clients of a worker share the cache of an endpoint.
+_response_caches: dict[str, ResponseCache] = {}
+_response_caches_lock = threading.Lock()
+
+
+class CachedResponse(NamedTuple):
+    """The data of a cached response."""
+
+    content_type: str
+    content: bytes
+
+
+class _Entry(NamedTuple):
+    expires: float
+    content_type: str
+    token: bytes  # the encrypted content
+    size: int
+
+
+class ResponseCache:
+    """Memory cache for responses, with a time-to-live and a maximum size.
+
+    When the cache is full, the least recently used responses are removed.
+    """
+
+    def __init__(self, name: str, *, max_bytes: int = 50_000_000):
+        """Initialize the cache.
+
+        :param name: Name for logging (e.g. the endpoint URL).
+        :param max_bytes: The maximum size of all stored (encrypted) responses.
+        """
+        self.name = name
+        self.max_bytes = max_bytes
+        self.counters = Counters()
+        self._lock = threading.Lock()
+        self._entries: OrderedDict[bytes, _Entry] = OrderedDict()
+        self._size = 0
+        self._fernet = Fernet(Fernet.generate_key())
+
+    def __repr__(self):
+        return f"<{self.__class__.__qualname__}: {self.name}>"
+
+    def get(self, key: bytes) -> CachedResponse | None:
+        """Retrieve the response, if it's cached and not expired."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry.expires <= time.monotonic():
+                self._remove(key)
+                entry = None
+
+            if entry is None:
+                self.counters.incr("misses")
+                return None
+
+            self._entries.move_to_end(key)
+            self.counters.incr("hits")
+
+        return CachedResponse(entry.content_type, self._fernet.decrypt(entry.token))
+
+    def set(self, key: bytes, response: CachedResponse, ttl: float) -> None:
+        """Store the response for a number of seconds."""
+        token = self._fernet.encrypt(response.content)
+        size = len(key) + len(token)
+        if size > self.max_bytes:
+            logger.debug("Response of %s is too large to cache: %d bytes", self.name, size)
+            return
+
+        entry = _Entry(time.monotonic() + ttl, response.content_type, token, size)
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = entry
+            self._size += size
+            while self._size > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+                self.counters.incr("evictions")
+
+    def clear(self) -> None:
+        """Remove all responses."""
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+
+    def get_stats(self) -> dict:
+        """Provide the statistics of the cache."""
+        with self._lock:
+            entries = len(self._entries)
+            size = self._size
+
+        return {"entries": entries, "size": size, **self.counters.as_dict()}
+
+    def _remove(self, key: bytes):
+        entry = self._entries.pop(key)
+        self._size -= entry.size
+
+
+def get_response_cache(name: str, **kwargs) -> ResponseCache:
+    """Return the shared response cache for an endpoint.
+    The keyword arguments are only used when the cache is constructed.
+    """
+    with _response_caches_lock:
+        try:
+            return _response_caches[name]
+        except KeyError:
+            cache = ResponseCache(name, **kwargs)
+            _response_caches[name] = cache
+            return cache
+
+
+def clear_response_caches() -> None:
+    """Remove all shared response caches."""
+    with _response_caches_lock:
+        _response_caches.clear()
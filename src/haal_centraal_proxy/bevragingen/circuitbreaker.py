@@ -0,0 +1,219 @@
+"""Circuit breaker for the calls to Haal Centraal.
+
+When the remote server is down, every request would wait for the connection to fail
+or for the timeout. This ties up all workers, making the proxy unresponsive.
+The circuit breaker detects this, and lets requests fail immediately for a while.
+"""
+
+from __future__ import annotations
+
+import contextlib
+import logging
+import threading
+import time
+from collections import deque
+from collections.abc import Iterator
+from enum import StrEnum
+
+from rest_framework.exceptions import APIException
+
+from .exceptions import CircuitOpen, DeadlineExceeded
+from .metrics import Counters
+
+logger = logging.getLogger(__name__)
+
+# Process-wide registry, so all clients of a worker share the state of an endpoint.
+_circuit_breakers: dict[str, CircuitBreaker] = {}
+_circuit_breakers_lock = threading.Lock()
+
+
+class State(StrEnum):
+    CLOSED = "closed"  # calls are made
+    OPEN = "open"  # calls fail immediately
+    HALF_OPEN = "half_open"  # a few trial calls are made
+
+
+class CircuitBreaker:
+    """Track the failures of an endpoint, and stop calling it when it's failing.
+
+    * In the "closed" state, all calls are made. The outcome of the last calls is tracked.
+      When too many of these fail (or are too slow), the circuit opens.
+    * In the "open" state, all calls fail immediately.
+      After a while, the circuit becomes half-open.
+    * In the "half-open" state, a limited number of trial calls are made.
+      When these succeed, the circuit is closed again, otherwise it opens again.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        *,
+        failure_rate_threshold: float = 0.5,
+        slow_call_rate_threshold: float = 0.8,
+        slow_call_duration: float = 10.0,
+        window_size: int = 20,
+        minimum_calls: int = 10,
+        open_duration: float = 30.0,
+        trial_calls: int = 3,
+    ):
+        """Initialize the circuit breaker.
+
+        :param name: Name for logging (e.g. the endpoint URL).
+        :param failure_rate_threshold: Fraction of failed calls that opens the circuit.
+        :param slow_call_rate_threshold: Fraction of slow calls that opens the circuit.
+        :param slow_call_duration: Number of seconds after which a call is considered slow.
+        :param window_size: Number of recent calls to calculate the rates with.
+        :param minimum_calls: Minimum number of calls before the rates are calculated.
+        :param open_duration: Number of seconds the circuit stays open.
+        :param trial_calls: Number of calls to make in the half-open state.
+        """
+        self.name = name
+        self.failure_rate_threshold = failure_rate_threshold
+        self.slow_call_rate_threshold = slow_call_rate_threshold
+        self.slow_call_duration = slow_call_duration
+        self.minimum_calls = minimum_calls
+        self.open_duration = open_duration
+        self.trial_calls = trial_calls
+        self.counters = Counters()
+
+        self._lock = threading.Lock()
+        self._state = State.CLOSED
+        self._outcomes: deque[tuple[bool, bool]] = deque(maxlen=window_size)  # (failed, slow)
+        self._opened_at = 0.0
+        self._trials_started = 0
+        self._trials_succeeded = 0
+
+    def __repr__(self):
+        return f"<{self.__class__.__qualname__}: {self.name} {self._state}>"
+
+    @property
+    def state(self) -> State:
+        """Tell the current state."""
+        with self._lock:
+            return self._get_state()
+
+    @contextlib.contextmanager
+    def call(self) -> Iterator[None]:
+        """Wrap the call to the endpoint.
+        This raises :class:`CircuitOpen` when the call should not be made,
+        and records whether the call failed.
+        """
+        self.acquire()
+        t0 = time.perf_counter_ns()
+        try:
+            yield
+        except DeadlineExceeded:
+            # The caller didn't want to wait any longer, this tells nothing about the endpoint.
+            self.release()
+            raise
+        except (APIException, OSError) as e:
+            self.record(
+                failed=getattr(e, "status_code", 500) >= 500,
+                duration=(time.perf_counter_ns() - t0) * 1e-9,
+            )
+            raise
+        except BaseException:
+            # Not caused by the endpoint (e.g. a programming error or cancellation).
+            self.release()
+            raise
+        else:
+            self.record(failed=False, duration=(time.perf_counter_ns() - t0) * 1e-9)
+
+    def acquire(self) -> None:
+        """Tell whether a call can be made, raises :class:`CircuitOpen` otherwise."""
+        with self._lock:
+            state = self._get_state()
+            if state == State.CLOSED:
+                return
+            elif state == State.HALF_OPEN and self._trials_started < self.trial_calls:
+                self._trials_started += 1
+                return
+
+            self.counters.incr("rejected")
+            wait = max(1, round(self._opened_at + self.open_duration - time.monotonic()))
+
+        raise CircuitOpen(wait=wait)
+
+    def release(self) -> None:
+        """Give back the permission to call, without recording the outcome."""
+        with self._lock:
+            if self._state == State.HALF_OPEN and self._trials_started > 0:
+                self._trials_started -= 1
+
+    def record(self, failed: bool, duration: float) -> None:
+        """Record the outcome of a call."""
+        slow = duration >= self.slow_call_duration
+        with self._lock:
+            state = self._get_state()
+            if state == State.HALF_OPEN:
+                if failed or slow:
+                    self._open()
+                else:
+                    self._trials_succeeded += 1
+                    if self._trials_succeeded >= self.trial_calls:
+                        self._close()
+            elif state == State.CLOSED:
+                self._outcomes.append((failed, slow))
+                if len(self._outcomes) >= self.minimum_calls:
+                    failures = sum(f for f, _ in self._outcomes)
+                    slow_calls = sum(s for _, s in self._outcomes)
+                    if failures >= self.failure_rate_threshold * len(
+                        self._outcomes
+                    ) or slow_calls >= self.slow_call_rate_threshold * len(self._outcomes):
+                        self._open()
+            # In the open state, outcomes of calls that started before are ignored.
+
+    def get_stats(self) -> dict:
+        """Provide the state and statistics of the circuit breaker."""
+        with self._lock:
+            state = self._get_state()
+            calls = len(self._outcomes)
+            failures = sum(f for f, _ in self._outcomes)
+            slow_calls = sum(s for _, s in self._outcomes)
+
+        return {
+            "state": str(state),
+            "failure_rate": round(failures / calls, 2) if calls else 0,
+            "slow_call_rate": round(slow_calls / calls, 2) if calls else 0,
+            **self.counters.as_dict(),
+        }
+
+    def _get_state(self) -> State:
+        if self._state == State.OPEN and time.monotonic() >= self._opened_at + self.open_duration:
+            # Allow a few trial calls
+            self._state = State.HALF_OPEN
+            self._trials_started = 0
+            self._trials_succeeded = 0
+        return self._state
+
+    def _open(self):
+        logger.error("Circuit breaker for %s is opened, calls will fail immediately", self.name)
+        self._state = State.OPEN
+        self._opened_at = time.monotonic()
+        self._outcomes.clear()
+        self.counters.incr("opened")
+
+    def _close(self):
+        logger.info("Circuit breaker for %s is closed again", self.name)
+        self._state = State.CLOSED
+        self._outcomes.clear()
+        self.counters.incr("closed")
+
+
+def get_circuit_breaker(name: str, **kwargs) -> CircuitBreaker:
+    """Return the shared circuit breaker for an endpoint.
+    The keyword arguments are only used when the circuit breaker is constructed.
+    """
+    with _circuit_breakers_lock:
+        try:
+            return _circuit_breakers[name]
+        except KeyError:
+            breaker = CircuitBreaker(name, **kwargs)
+            _circuit_breakers[name] = breaker
+            return breaker
+
+
+def clear_circuit_breakers() -> None:
+    """Remove all shared circuit breakers."""
+    with _circuit_breakers_lock:
+        _circuit_breakers.clear()
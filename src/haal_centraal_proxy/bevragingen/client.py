@@ -1,33 +1,53 @@
 """Client for Haal Centraal API."""
 
+import asyncio
+import contextlib
 import logging
+import threading
 import time
-from typing import TypedDict
+from collections.abc import Callable
+from concurrent.futures import Future, ThreadPoolExecutor
+from pathlib import Path
 from urllib.parse import urlparse
 
+import httpx
 import orjson
 import requests
-from django.core.cache import cache
 from django.core.exceptions import ImproperlyConfigured
 from more_ds.network.url import URL
 from oauthlib.oauth2 import BackendApplicationClient
 from requests import Timeout
+from requests.utils import get_encoding_from_headers
 from requests_oauthlib import OAuth2Session
 from rest_framework import status
 from rest_framework.exceptions import APIException, NotFound
 
-from .exceptions import BadGateway, GatewayTimeout, RemoteAPIException, ServiceUnavailable
+from .bulkhead import Bulkhead
+from .cache import CachedResponse, ResponseCache
+from .circuitbreaker import CircuitBreaker
+from .coalescing import SingleFlight, get_flight_key, get_key
+from .exceptions import (
+    BadGateway,
+    DeadlineExceeded,
+    GatewayTimeout,
+    RemoteAPIException,
+    ServiceUnavailable,
+)
+from .hedging import HedgingPolicy
+from .retries import RetryPolicy
+from .tokens import OAuthToken, TokenStore, get_token_store
+from .transports import HTTP2Adapter, TLSAdapter, get_ssl_context
 
 logger = logging.getLogger(__name__)
 
 USER_AGENT = "Amsterdam-Haal-Centraal-Proxy/1.0"
 
+# The title of the 403 response when our credentials are not accepted.
+AUTHORIZATION_REJECTED_TITLE = "U bent niet geautoriseerd voor het gebruik van deze API."
 
-class OAuthToken(TypedDict):
-    token_type: str  # bearer
-    access_token: str
-    expires_in: int
-    scope: str
+# Process-wide registry of clients, so connection pools are reused between requests.
+_clients: dict[tuple[type, str], "BrpClient"] = {}
+_clients_lock = threading.Lock()
 
 
 class BrpClient:
@@ -39,6 +59,13 @@ class BrpClient:
 
     endpoint_url: URL
 
+    #: The default (connect, read) timeout in seconds, for a single attempt.
+    timeout = (60.0, 60.0)
+
+    #: The exceptions of the HTTP library for a socket timeout, and for connection errors.
+    timeout_errors = (TimeoutError, Timeout)
+    connection_errors = (OSError,)
+
     def __init__(
         self,
         endpoint_url,
@@ -49,6 +76,17 @@ class BrpClient:
         oauth_scope: str | None = None,
         cert_file=None,
         key_file=None,
+        ca_dir=None,
+        pool_maxsize: int = 10,
+        token_file: Path | str | None = None,
+        token_background_refresh: bool = False,
+        http2: bool = False,
+        retry_policy: RetryPolicy | None = None,
+        bulkhead: Bulkhead | None = None,
+        circuit_breaker: CircuitBreaker | None = None,
+        hedging_policy: HedgingPolicy | None = None,
+        coalesce: bool = False,
+        response_cache: ResponseCache | None = None,
     ):
         """Initialize the client configuration.
 
@@ -61,12 +99,39 @@ class BrpClient:
             found in the PKI-overheid certificate.
         :param cert_file: Optional certificate file for mTLS (needed in production).
         :param key_file: Optional private key file for mTLS (needed in production).
+        :param ca_dir: Optional folder with the CA certificates of the private 'diginetwerk'.
+        :param pool_maxsize: Number of connections to keep open for reuse between threads.
+        :param token_file: Optional file to share the OAuth token between processes.
+        :param token_background_refresh: Whether to renew the OAuth token in a background thread,
+            so requests don't have to wait for it.
+        :param http2: Whether to multiplex the calls over HTTP/2 connections,
+            instead of using a HTTP/1.1 connection per concurrent call.
+        :param retry_policy: Optional policy to retry temporary failures.
+        :param bulkhead: Optional limit for the number of concurrent calls to the endpoint.
+        :param circuit_breaker: Optional circuit breaker, to fail fast when the endpoint is down.
+        :param hedging_policy: Optional policy to make a second call when the first one is slow.
+        :param coalesce: Whether identical concurrent calls should share a single call.
+        :param response_cache: Optional cache, to answer identical calls for a short while.
         """
         if not endpoint_url:
             raise ValueError("Missing BRP endpoint URL")
         self.endpoint_url = URL(endpoint_url)
         self.oauth_endpoint_url = oauth_endpoint_url
         self._host = urlparse(endpoint_url).netloc
+        self._ssl_context = get_ssl_context(cert_file, key_file, ca_dir)
+        self._token_store: TokenStore | None = None
+        self._http2_adapter: HTTP2Adapter | None = None
+        self.retry_policy = retry_policy or RetryPolicy()
+        self.bulkhead = bulkhead
+        self.circuit_breaker = circuit_breaker
+        self.hedging_policy = hedging_policy
+        self._hedging_executor = (
+            ThreadPoolExecutor(max_workers=2 * pool_maxsize, thread_name_prefix="brp-hedging")
+            if hedging_policy is not None
+            else None
+        )
+        self._single_flight = self._get_single_flight() if coalesce else None
+        self.response_cache = response_cache
 
         if urlparse(endpoint_url).port and not oauth_client_secret:
             # Connecting to the mock endpoint
@@ -83,31 +148,95 @@ class BrpClient:
             # Connecting to official API on the private 'diginetwerk'.
             self._client_secret = oauth_client_secret
 
-            # Get existing token from configured cache (e.g. locmemcache)
-            # to avoid needing reauthentication.
-            token = cache.get("haal-centraal-token")
+            # The token is shared between all clients of the process, and with a token file
+            # also between all workers, to avoid needing reauthentication.
+            token_key = f"{oauth_endpoint_url} {oauth_client_id} {oauth_scope}"
+            self._token_store = get_token_store(token_file, key=token_key)
 
             # The requests-oauthlib logic will automatically insert the token data.
             self._session = OAuth2Session(
                 # The BackendApplicationClient gives grant_type=authorization_code
                 client=BackendApplicationClient(client_id=oauth_client_id, scope=oauth_scope),
-                token=token,
-                token_updater=self._cache_token,  # only called for refresh urls.
+                token=self._token_store.read(),
             )
 
-        if cert_file is not None:
-            self._session.cert = (cert_file, key_file)
+        if token_background_refresh and self._token_store is not None:
+            self._token_store.start_refresher(self._request_token)
+
+        # Only a single host is contacted, but multiple threads may use the same host.
+        # All connections share the SSL context, so certificates are loaded only once,
+        # and new connections can resume the TLS session of earlier connections.
+        adapter = TLSAdapter(self._ssl_context, pool_connections=1, pool_maxsize=pool_maxsize)
+        self._session.mount("https://", adapter)
+        self._session.mount("http://", adapter)
+
+        if http2:
+            # Calls to the endpoint share a few HTTP/2 connections. As this adapter is
+            # mounted on the session, the OAuth token is still inserted by requests-oauthlib.
+            # The OAuth endpoint is still contacted using the adapter above.
+            self._http2_adapter = HTTP2Adapter(
+                ssl_context=self._ssl_context, max_connections=pool_maxsize
+            )
+            endpoint = urlparse(endpoint_url)
+            self._session.mount(f"{endpoint.scheme}://{endpoint.netloc}/", self._http2_adapter)
 
     def __repr__(self):
         return f"<{self.__class__.__qualname__}: {self.endpoint_url}>"
 
+    def close(self):
+        """Close all connections of this client."""
+        self._session.close()
+        if self._hedging_executor is not None:
+            self._hedging_executor.shutdown(wait=False, cancel_futures=True)
+
+    def _get_single_flight(self) -> SingleFlight:
+        return SingleFlight(str(self.endpoint_url))
+
+    def get_stats(self) -> dict:
+        """Provide statistics of the client, e.g. for health checks."""
+        stats = {}
+        if self._token_store is not None:
+            stats["token"] = self._token_store.counters.as_dict()
+        if self._http2_adapter is not None:
+            stats["connections"] = self._http2_adapter.stats.as_dict()
+        if self.endpoint_url.startswith("https:"):
+            stats["tls"] = self._ssl_context.get_stats()
+        if self.retry_policy.attempts > 1:
+            stats["retries"] = self.retry_policy.get_stats()
+        if self.bulkhead is not None:
+            stats["bulkhead"] = self.bulkhead.get_stats()
+        if self.circuit_breaker is not None:
+            stats["circuit_breaker"] = self.circuit_breaker.get_stats()
+        if self.hedging_policy is not None:
+            stats["hedging"] = self.hedging_policy.get_stats()
+        if self._single_flight is not None:
+            stats["coalescing"] = self._single_flight.counters.as_dict()
+        if self.response_cache is not None:
+            stats["cache"] = self.response_cache.get_stats()
+        return stats
+
     def fetch_token(self) -> OAuthToken:
-        """Retrieve the access token.
+        """Retrieve a new access token, and share it with other workers.
         This is a server-side OAuth call, which doesn't redirect the user.
         It but immediately returns the token.
         """
+        return self._token_store.refresh(self._request_token)
+
+    def _get_token(self) -> OAuthToken:
+        """Provide a valid token, retrieving a new one only when needed."""
+        return self._use_token(self._token_store.get_token(self._request_token))
+
+    def _use_token(self, token: OAuthToken) -> OAuthToken:
+        """Let the session use the token, when it was changed."""
+        if token["access_token"] != (self._session.token or {}).get("access_token"):
+            # Token was retrieved by another worker/thread, or changed.
+            self._session.token = token
+        return token
+
+    def _request_token(self) -> OAuthToken:
+        """Perform the OAuth call to retrieve the token."""
         # The retrieved token is also stored in self._session.token.
-        token = self._session.fetch_token(
+        return self._session.fetch_token(
             self.oauth_endpoint_url,
             client_secret=self._client_secret,
             include_client_id=True,  # not using "Authorization: Basic" header but POST params
@@ -117,64 +246,426 @@ class BrpClient:
                 "User-Agent": USER_AGENT,
             },
         )
-        self._cache_token(token)
-        return token
 
-    def _cache_token(self, token: OAuthToken):
-        """Save the retrieved token."""
-        # make sure the cache is expired when refreshes are needed.
-        timeout = token["expires_in"] - 900
-        logger.debug("Caching OAuth access token for %d seconds", timeout)
-        cache.set("haal-centraal-token", token, timeout=timeout)
+    def warm_up(
+        self,
+        hc_request: dict | None,
+        connections: int = 1,
+        timeout: tuple[float, float] | None = None,
+    ) -> None:
+        """Prepare the client before the first request arrives.
+        This retrieves (or loads) the OAuth token, and opens the connections by making
+        a number of concurrent calls. These calls bypass the retries and circuit breaker.
+
+        :param hc_request: The dummy request to send.
+        :param connections: The number of connections to open.
+        :param timeout: The (connect, read) timeout for the calls.
+        """
+        timeout = timeout or self.timeout
+        connections = max(1, connections)
+        if self._token_store is not None:
+            self._get_token()
+
+        with ThreadPoolExecutor(
+            max_workers=connections, thread_name_prefix="brp-warmup"
+        ) as executor:
+            responses = list(
+                executor.map(lambda _: self._call_once(hc_request, timeout), range(connections))
+            )
+
+        for response in responses:
+            response.close()
+        logger.info("Opened %d connections to %s", connections, self.endpoint_url)
+
+    def call(
+        self,
+        hc_request: dict | None = None,
+        *,
+        timeout: tuple[float, float] | None = None,
+        deadline: float | None = None,
+        hedge: bool = False,
+        cache_ttl: float = 0,
+        stream: bool = False,
+    ) -> requests.Response:
+        """Make the HTTP POST call to the endpoint.
+        When the circuit breaker is open, this fails immediately.
+        When an identical call is already in progress, its response is shared.
+
+        :param hc_request: The JSON body to send.
+        :param timeout: The (connect, read) timeout for each attempt.
+        :param deadline: How many seconds the caller still waits for the response.
+        :param hedge: Whether a second call can be made when the first one is slow.
+        :param cache_ttl: How many seconds the response can be cached (if a cache is used).
+            Responses from the cache have a ``from_cache`` attribute.
+        :param stream: Whether the response body is read by the caller while it's received.
+            Such a call is not cached, coalesced or hedged. The caller should close the response.
+        """
+        timeout = timeout or self.timeout
+        if deadline is not None and deadline <= 0:
+            logger.error("Proxy call to %s not made, deadline already exceeded", self.endpoint_url)
+            raise DeadlineExceeded()
+
+        if stream:
+            # The body can only be read once, so it can't be shared with other callers.
+            return self._call_streamed(hc_request, timeout, deadline)
+
+        key = get_key(hc_request)
+        if self.response_cache is None:
+            cache_ttl = 0
+        elif cache_ttl and (cached := self.response_cache.get(key)) is not None:
+            logger.info("Proxy call to %s answered from cache", self.endpoint_url)
+            return self._build_cached_response(cached)
+
+        if self._single_flight is None:
+            return self._call_guarded(hc_request, timeout, deadline, hedge, key, cache_ttl)
+
+        return self._single_flight.do(
+            get_flight_key(key, deadline),
+            lambda: self._call_guarded(hc_request, timeout, deadline, hedge, key, cache_ttl),
+            timeout=deadline,
+        )
+
+    def _call_guarded(
+        self,
+        hc_request: dict | None,
+        timeout: tuple[float, float],
+        deadline: float | None,
+        hedge: bool = False,
+        cache_key: bytes | None = None,
+        cache_ttl: float = 0,
+    ) -> requests.Response:
+        """Make the call, unless the bulkhead is full or the circuit breaker is open.
+        Successful responses are stored in the cache.
+        """
+        with self._bulkhead_call(), self._circuit_breaker_call():
+            response = self._call(hc_request, timeout, deadline, hedge)
+
+        if cache_ttl:
+            self._store_response(cache_key, response, cache_ttl)
+        return response
+
+    def _call_streamed(
+        self, hc_request: dict | None, timeout: tuple[float, float], deadline: float | None
+    ) -> requests.Response:
+        """Make the call, but leave the body to be read by the caller.
+        The bulkhead slot is kept, and the outcome for the circuit breaker is only recorded
+        when the body is read. Hence, the caller should finish with :meth:`close_stream`.
+        """
+        with contextlib.ExitStack() as guards:
+            guards.enter_context(self._bulkhead_call())
+            guards.enter_context(self._circuit_breaker_call())
+            response = self._call(hc_request, timeout, deadline, stream=True)
+            response.guards = guards.pop_all()
+        return response
+
+    def close_stream(
+        self, response: requests.Response, exception: BaseException | None = None
+    ) -> None:
+        """Close a streamed response, and record the outcome of the call.
+
+        :param exception: The error that occurred while reading the body.
+        """
+        try:
+            response.close()
+        finally:
+            if (guards := getattr(response, "guards", None)) is not None:
+                guards.__exit__(*self._get_stream_exc_info(exception))
+
+    def _get_stream_exc_info(self, exception: BaseException | None) -> tuple:
+        """Tell the bulkhead and circuit breaker how reading the body ended."""
+        if exception is None:
+            return None, None, None
+        if isinstance(exception, (*self.timeout_errors, *self.connection_errors)):
+            # Also counts as a failure of the endpoint, like errors during the call.
+            exception = self._get_connection_error(exception, self._host)
+        return type(exception), exception, exception.__traceback__
+
+    def _bulkhead_call(self) -> contextlib.AbstractContextManager:
+        """Wait for a free slot of the bulkhead (if there is one)."""
+        return self.bulkhead.call() if self.bulkhead is not None else contextlib.nullcontext()
+
+    def _circuit_breaker_call(self) -> contextlib.AbstractContextManager:
+        """Let the circuit breaker (if there is one) reject the call, and record its outcome."""
+        if self.circuit_breaker is None:
+            return contextlib.nullcontext()
+        return self.circuit_breaker.call()
+
+    def _store_response(
+        self, cache_key: bytes, response: requests.Response | httpx.Response, cache_ttl: float
+    ) -> None:
+        """Store a successful response in the cache."""
+        if response.status_code == status.HTTP_200_OK:
+            content_type = response.headers.get("content-type", "application/json; charset=utf-8")
+            self.response_cache.set(
+                cache_key, CachedResponse(content_type, response.content), cache_ttl
+            )
+
+    def _build_cached_response(self, cached: CachedResponse) -> requests.Response:
+        """Construct the response object for a cached response."""
+        response = requests.Response()
+        response.status_code = status.HTTP_200_OK
+        response.headers["Content-Type"] = cached.content_type
+        response.encoding = get_encoding_from_headers(response.headers)
+        response.url = str(self.endpoint_url)
+        response._content = cached.content
+        response._content_consumed = True
+        response.from_cache = True
+        return response
 
-    def call(self, hc_request: dict | None = None) -> requests.Response:
-        """Make an HTTP GET call. kwargs are passed to pool.request."""
+    def _call(
+        self,
+        hc_request: dict | None,
+        timeout: tuple[float, float],
+        deadline: float | None,
+        hedge: bool = False,
+        stream: bool = False,
+    ) -> requests.Response:
+        """Make the call, retrying temporary failures as far as the retry policy allows this."""
         logger.debug("calling %s", self.endpoint_url)
         t0 = time.perf_counter_ns()
+        self.retry_policy.start()
+        attempt = 1
+        while True:
+            attempt_timeout = self.retry_policy.get_timeout(t0, timeout, deadline)
+            try:
+                if hedge and self.hedging_policy is not None:
+                    result = self._call_hedged(hc_request, attempt_timeout)
+                else:
+                    result = self._call_once(hc_request, attempt_timeout, stream)
+            except (GatewayTimeout, ServiceUnavailable) as e:
+                result = e
+
+            delay = self._get_retry(result, attempt, t0, deadline, timeout, attempt_timeout)
+            if delay is None:
+                break
+
+            time.sleep(delay)
+            attempt += 1
+
+        return self._handle_response(hc_request, result, t0, retries=attempt - 1)
+
+    def _get_retry(
+        self,
+        result: requests.Response | httpx.Response | APIException,
+        attempt: int,
+        t0: int,
+        deadline: float | None,
+        timeout: tuple[float, float],
+        attempt_timeout: tuple[float, float],
+    ) -> float | None:
+        """Decide whether the attempt is retried.
+
+        :param result: The response or the error of the attempt.
+        :param attempt_timeout: The timeout of the attempt, which may be shortened
+            to meet the deadline.
+        :returns: The delay before the next attempt, or ``None`` when the response is used.
+            An error that isn't retried is raised.
+        """
+        if not isinstance(result, APIException):
+            if result.status_code not in self.retry_policy.retry_statuses:
+                return None
+            return self._get_retry_delay(attempt, t0, result, deadline)
+
+        if (delay := self._get_retry_delay(attempt, t0, result, deadline)) is not None:
+            return delay
+
+        if isinstance(result, GatewayTimeout) and attempt_timeout[1] < timeout[1]:
+            # The timeout was shortened to meet the deadline.
+            error = DeadlineExceeded()
+            error.retries = attempt - 1
+            raise error from result
+
+        result.retries = attempt - 1
+        raise result
+
+    def _call_once(
+        self, hc_request: dict | None, timeout: tuple[float, float], stream: bool = False
+    ) -> requests.Response:
+        """Perform a single attempt of the call, including the OAuth handling."""
         host = None
         try:
             # Request the token if needed
-            if self._client_secret is not None and not self._session.token:
-                logger.debug("No OAuth token stored yet, retrieving new OAuth token")
+            if self._token_store is not None:
                 host = self.oauth_endpoint_url
-                self.fetch_token()
+                self._get_token()
 
-            # Using urllib directly instead of requests for performance
             host = self._host
-            response: requests.Response = self._session.request(
-                "POST",
-                self.endpoint_url,
-                json=hc_request,
-                timeout=60,
-                headers={
-                    # "Authorization": "Bearer <oauthtoken>" is inserted by requests-oauthlib
-                    "Accept": "application/json; charset=utf-8",
-                    "Content-Type": "application/json; charset=utf-8",
-                    "User-Agent": USER_AGENT,
-                },
-            )
-        except (TimeoutError, Timeout) as e:
+            response = self._post(hc_request, timeout, stream=stream)
+
+            if self._is_token_rejected(response):
+                host = self.oauth_endpoint_url
+                self._renew_rejected_token(response)
+
+                host = self._host
+                response = self._post(hc_request, timeout, stream=stream)
+                self._token_store.counters.incr("replays")
+        except (*self.timeout_errors, *self.connection_errors) as e:
+            raise self._get_connection_error(e, host) from e
+
+        return response
+
+    def _is_token_rejected(self, response: requests.Response | httpx.Response) -> bool:
+        """Tell whether our OAuth token is no longer accepted (e.g. revoked or expired early).
+        The call is then replayed once with a new token.
+        """
+        if self._token_store is None or not self._is_credentials_rejected(response):
+            return False
+
+        logger.warning(
+            "Proxy call to %s rejected our OAuth token, retrieving a new token", self._host
+        )
+        self._token_store.counters.incr("rejected")
+        return True
+
+    def _get_connection_error(self, e: Exception, host: str | None) -> APIException:
+        """Translate the timeout or connection error of the HTTP library."""
+        if isinstance(e, self.timeout_errors):
             # Socket timeout
             logger.error("Proxy call to %s failed, timeout from remote server: %s", host, e)
-            raise GatewayTimeout() from e
-        except OSError as e:
+            return GatewayTimeout()
+        else:
             # Socket connect / SSL error.
             logger.error("Proxy call to %s failed, error when connecting to server: %s", host, e)
-            raise ServiceUnavailable(str(e)) from e
+            return ServiceUnavailable(str(e))
+
+    def _call_hedged(
+        self, hc_request: dict | None, timeout: tuple[float, float]
+    ) -> requests.Response:
+        """Perform an attempt, with a second (hedged) call when the first one is slow.
+
+        The first attempt runs on the calling thread, so it never waits for a thread of the
+        executor that other requests use for their hedged calls. A blocking call can't be
+        aborted, so the calling thread always waits for its own attempt. When that attempt
+        fails (e.g. a read timeout), the hedged call is already in progress, and its response
+        is used instead. An unused response of the hedged call is closed once it arrives.
+        """
+        self.hedging_policy.start()
+        first_done = threading.Event()
+        hedged = None
+        if (delay := self.hedging_policy.get_delay()) is not None:
+            hedged = self._hedging_executor.submit(
+                self._call_hedge, hc_request, timeout, delay, first_done
+            )
+
+        t0 = time.perf_counter_ns()
+        try:
+            response = self._call_once(hc_request, timeout)
+        except Exception:
+            first_done.set()  # a hedged call that didn't start yet, isn't made anymore.
+            if hedged is not None and (response := self._get_hedge_response(hedged)):
+                return response
+            raise
+        finally:
+            first_done.set()
+
+        self.hedging_policy.record((time.perf_counter_ns() - t0) * 1e-9)
+        if hedged is not None:
+            hedged.add_done_callback(_close_response)
+        return response
+
+    def _call_hedge(
+        self,
+        hc_request: dict | None,
+        timeout: tuple[float, float],
+        delay: float,
+        first_done: threading.Event,
+    ) -> requests.Response | None:
+        """Make the hedged call when the first attempt is still in progress after the delay."""
+        if first_done.wait(delay) or not self._allow_hedge(delay):
+            return None
+
+        t0 = time.perf_counter_ns()
+        try:
+            return self._call_once(hc_request, timeout)
+        finally:
+            self._release_hedge(t0)
+
+    def _get_hedge_response(self, hedged: Future) -> requests.Response | None:
+        """Provide the response of the hedged call, when it was made and succeeded."""
+        if hedged.exception() is not None or (response := hedged.result()) is None:
+            return None
+        self.hedging_policy.counters.incr("hedge_wins")
+        return response
+
+    def _allow_hedge(self, delay: float) -> bool:
+        """Tell whether a hedged call can be made.
+        The hedged call takes its own bulkhead slot, so it's skipped when no slot is free.
+        """
+        if self.bulkhead is not None and not self.bulkhead.try_acquire():
+            self.hedging_policy.counters.incr("bulkhead_full")
+            return False
+
+        if not self.hedging_policy.allow_hedge():
+            if self.bulkhead is not None:
+                self.bulkhead.release()
+            return False
+
+        logger.info(
+            "Proxy call to %s is slow (>%.3fs), making a hedged call", self.endpoint_url, delay
+        )
+        return True
+
+    def _get_hedge_winner(
+        self, first: Future | asyncio.Task, done: set[Future] | set[asyncio.Task]
+    ) -> Future | asyncio.Task | None:
+        """Provide the completed attempt whose response is used, if any succeeded."""
+        for future in done:
+            if future.exception() is None:
+                if future is not first:
+                    self.hedging_policy.counters.incr("hedge_wins")
+                return future
+        return None
+
+    def _release_hedge(self, t0: int, future: Future | asyncio.Task | None = None) -> None:
+        """Give back the bulkhead slot of the hedged call once it has finished."""
+        if self.bulkhead is not None:
+            self.bulkhead.release((time.perf_counter_ns() - t0) * 1e-9)
+
+    def _record_latency(self, t0: int, future: Future | asyncio.Task) -> None:
+        """Record the latency of the first attempt, also when the hedged call answered first.
+        Otherwise the delay would only be based on the calls that were fast.
+        For a cancelled attempt, the time until it was cancelled is the best known lower bound.
+        """
+        if future.cancelled() or future.exception() is None:
+            self.hedging_policy.record((time.perf_counter_ns() - t0) * 1e-9)
+
+    def _get_retry_delay(
+        self, attempt: int, t0: int, failure, deadline: float | None = None
+    ) -> float | None:
+        """Tell how long to wait before the failed call is retried, or ``None`` to give up."""
+        delay = self.retry_policy.get_delay(attempt, t0, deadline)
+        if delay is not None:
+            logger.warning(
+                "Proxy call to %s failed (%s), retrying in %.3fs",
+                self.endpoint_url,
+                (
+                    f"status {failure.status_code}"
+                    if hasattr(failure, "status_code")
+                    else failure.__class__.__name__
+                ),
+                delay,
+            )
+        return delay
 
+    def _handle_response(self, hc_request: dict | None, response, t0: int, retries: int = 0):
+        """Log the response, and translate errors into the proper exceptions.
+        The number of retries is stored in the response (or exception), for audit logging.
+        """
         # Log response and timing results
         level = logging.ERROR if response.status_code >= 400 else logging.INFO
         logger.log(
             level,
-            "Proxy call to %s, status %s: %s (%s), took: %.3fs",
+            "Proxy call to %s, status %s: %s (%s), took: %.3fs, retries: %d",
             self.endpoint_url,
             response.status_code,
-            response.reason,
+            self._get_reason(response),
             response.headers.get("content-type"),
             (time.perf_counter_ns() - t0) * 1e-9,
+            retries,
         )
 
         if 200 <= response.status_code < 300:
+            response.retries = retries
             return response
 
         # We got an error.
@@ -194,12 +685,70 @@ class BrpClient:
 
         # Raise exception in nicer format, but chain with the original one
         # so the "response" object is still accessible via __cause__.response.
+        error = self._get_http_error(response)
+        error.retries = retries
+        raise error from self._get_status_error(response)
+
+    def _get_reason(self, response: requests.Response) -> str:
+        return response.reason
+
+    def _get_status_error(self, response: requests.Response) -> requests.HTTPError:
+        """Provide the exception that the HTTP library would raise for the error status."""
         try:
             response.raise_for_status()
         except requests.HTTPError as e:
-            raise self._get_http_error(response) from e
+            return e
+
+    def _post(
+        self, hc_request: dict | None, timeout: tuple[float, float], stream: bool = False
+    ) -> requests.Response:
+        """Perform the actual HTTP request.
+        With ``stream=True``, only the body of a successful response is left unread.
+        """
+        response = self._session.request(
+            "POST",
+            self.endpoint_url,
+            json=hc_request,
+            timeout=timeout,
+            headers={
+                # "Authorization": "Bearer <oauthtoken>" is inserted by requests-oauthlib
+                "Accept": "application/json; charset=utf-8",
+                "Content-Type": "application/json; charset=utf-8",
+                "User-Agent": USER_AGENT,
+            },
+            stream=stream,
+        )
+        if stream and not response.ok:
+            response.content  # noqa: B018, read the error for the response handling.
+        return response
 
-    def _get_http_error(self, response: requests.Response) -> APIException:
+    def _renew_rejected_token(self, response: requests.Response) -> None:
+        """Replace the token that was rejected by the remote server.
+        When multiple threads/workers got the same rejection, only one of them renews it.
+        """
+        rejected = response.request.headers.get("Authorization", "").removeprefix("Bearer ")
+        token = self._token_store.read()
+        if token is None or token["access_token"] == rejected:
+            token = self._token_store.renew(self._request_token, token)
+        self._session.token = token
+
+    def _is_credentials_rejected(self, response) -> bool:
+        """Tell whether the remote server rejected our credentials."""
+        if response.status_code == status.HTTP_401_UNAUTHORIZED:
+            return True
+        elif response.status_code == status.HTTP_403_FORBIDDEN:
+            content_type = response.headers.get("content-type", "")
+            if "json" not in content_type:
+                return False
+            try:
+                remote_json = orjson.loads(response.content)
+            except orjson.JSONDecodeError:
+                return False
+            return remote_json.get("title") == AUTHORIZATION_REJECTED_TITLE
+        else:
+            return False
+
+    def _get_http_error(self, response) -> APIException:
         # Translate the remote HTTP error to the proper response.
         #
         # This translates some errors into a 502 "Bad Gateway" or 503 "Gateway Timeout"
@@ -226,11 +775,7 @@ class BrpClient:
                 detail_message or f"Unexpected HTTP {response.status_code} from internal endpoint"
             )
 
-        if response.status_code == status.HTTP_401_UNAUTHORIZED or (
-            response.status_code == status.HTTP_403_FORBIDDEN
-            and remote_json is not None
-            and remote_json["title"] == "U bent niet geautoriseerd voor het gebruik van deze API."
-        ):
+        if self._is_credentials_rejected(response):
             # Our API key is not configured (401) or incorrect (403). Don't blame the client.
             # So far there is no other cause for a 403, but allow this to change.
             return BadGateway(
@@ -255,3 +800,50 @@ class BrpClient:
                 detail_message,
             )
             return BadGateway(f"Unexpected HTTP {response.status_code} from internal endpoint")
+
+
+def _close_response(future: Future) -> None:
+    """Close the response of a call that wasn't used, so its connection is released."""
+    if not future.cancelled() and future.exception() is None and future.result() is not None:
+        future.result().close()
+
+
+def get_client(
+    endpoint_url: str,
+    client_class: type[BrpClient] = BrpClient,
+    kwargs_factory: Callable[[], dict] | None = None,
+    **kwargs,
+) -> BrpClient:
+    """Return the shared client for an endpoint.
+
+    The client is created once per process (e.g. uwsgi worker), and shared between
+    all threads. This keeps the HTTP connections (and their TLS sessions) open between requests.
+    The keyword arguments are only used when the client is constructed.
+
+    :param kwargs_factory: Provides the keyword arguments, only when the client is constructed.
+        This avoids building the policies of the client for every request.
+    """
+    key = (client_class, endpoint_url)
+    try:
+        return _clients[key]
+    except KeyError:
+        pass
+
+    with _clients_lock:
+        # Check again, another thread could have created it while waiting for the lock.
+        try:
+            return _clients[key]
+        except KeyError:
+            if kwargs_factory is not None:
+                kwargs = {**kwargs_factory(), **kwargs}
+            client = client_class(endpoint_url, **kwargs)
+            _clients[key] = client
+            return client
+
+
+def clear_clients():
+    """Close all shared clients, e.g. after a fork or settings change."""
+    with _clients_lock:
+        for client in _clients.values():
+            client.close()
+        _clients.clear()
@@ -0,0 +1,159 @@
+"""Coalescing of identical concurrent calls to Haal Centraal.
+
+When multiple users request the same data at the same moment (e.g. a dashboard that is
+opened by many case workers), only one call is made. The other requests wait for its response.
+Each request still performs its own authorization, response transformation and audit logging.
+"""
+
+import asyncio
+import copy
+import hmac
+import logging
+import math
+import secrets
+import threading
+from collections.abc import Awaitable, Callable
+from concurrent.futures import Future
+from typing import TypeVar
+
+import orjson
+
+from .exceptions import DeadlineExceeded
+from .metrics import Counters
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# The keys are kept in memory (and in the response cache), so they shouldn't contain the
+# requested BSN's or addresses. A random secret per process avoids that these can be guessed.
+_KEY_SECRET = secrets.token_bytes(32)
+
+
+def get_key(hc_request: dict | None) -> bytes:
+    """Provide the key that identifies identical requests.
+    This is a keyed digest, so the request data can't be derived from it.
+    """
+    data = orjson.dumps(hc_request, option=orjson.OPT_SORT_KEYS)
+    return hmac.new(_KEY_SECRET, data, "sha256").digest()
+
+
+def get_flight_key(key: bytes, deadline: float | None) -> bytes:
+    """Provide the key for coalescing, so only calls with a similar deadline are shared.
+
+    The deadlines are grouped per power of 2 seconds. This avoids that a request without
+    a deadline receives the :class:`DeadlineExceeded` of a request with a short deadline.
+    """
+    bucket = "-" if deadline is None else str(math.ceil(math.log2(max(deadline, 1))))
+    return f"{bucket}:".encode() + key
+
+
+def _copy_error(e: BaseException) -> BaseException:
+    """Provide a copy of a shared exception, so each waiting caller raises its own object.
+
+    Otherwise all callers would update the ``__traceback__`` of the same object concurrently.
+    The ``__cause__`` is kept, as it holds the response of the failed call (for audit logging).
+    """
+    try:
+        new = copy.copy(e)
+    except Exception:  # noqa: BLE001
+        return e
+    new.__cause__ = e.__cause__
+    return new
+
+
+class SingleFlight:
+    """Let concurrent identical calls share the result of a single call (between threads)."""
+
+    def __init__(self, name: str):
+        """Initialize the coalescing.
+
+        :param name: Name for logging (e.g. the endpoint URL).
+        """
+        self.name = name
+        self.counters = Counters()
+        self._lock = threading.Lock()
+        self._calls: dict[bytes, Future] = {}
+
+    def __repr__(self):
+        return f"<{self.__class__.__qualname__}: {self.name}>"
+
+    def do(self, key: bytes, fn: Callable[[], T], timeout: float | None = None) -> T:
+        """Perform the call, unless an identical call is already in progress.
+
+        :param key: Identifies identical calls.
+        :param fn: The function that performs the call.
+        :param timeout: How long to wait for a call that's already in progress.
+        """
+        with self._lock:
+            future = self._calls.get(key)
+            is_leader = future is None
+            if is_leader:
+                future = Future()
+                self._calls[key] = future
+
+        if not is_leader:
+            self._log_hit()
+            try:
+                error = future.exception(timeout=timeout)
+            except TimeoutError:
+                raise DeadlineExceeded() from None
+            if error is not None:
+                raise _copy_error(error)
+            return future.result()
+
+        self.counters.incr("calls")
+        try:
+            result = fn()
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            with self._lock:
+                del self._calls[key]
+
+    def _log_hit(self):
+        self.counters.incr("hits")
+        logger.info("Proxy call to %s coalesced with an identical call in progress", self.name)
+
+
+class AsyncSingleFlight(SingleFlight):
+    """Let concurrent identical calls share the result of a single call (within an event loop).
+
+    The call runs as a separate task, so it's not cancelled when the first caller is cancelled.
+    """
+
+    def __init__(self, name: str):
+        super().__init__(name)
+        self._tasks: dict[bytes, asyncio.Task] = {}
+
+    async def do(
+        self, key: bytes, fn: Callable[[], Awaitable[T]], timeout: float | None = None
+    ) -> T:
+        """Perform the call, unless an identical call is already in progress.
+
+        :param key: Identifies identical calls.
+        :param fn: The function that creates the coroutine for the call.
+        :param timeout: How long to wait for the call.
+        """
+        task = self._tasks.get(key)
+        is_leader = task is None
+        if is_leader:
+            self.counters.incr("calls")
+            task = asyncio.ensure_future(fn())
+            self._tasks[key] = task
+            task.add_done_callback(lambda t: self._tasks.pop(key, None))
+        else:
+            self._log_hit()
+
+        try:
+            return await asyncio.wait_for(asyncio.shield(task), timeout)
+        except TimeoutError:
+            raise DeadlineExceeded() from None
+        except Exception as e:
+            if is_leader:
+                raise
+            raise _copy_error(e)  # noqa: B904, keeps the __cause__ of the original error.
@@ -24,6 +24,28 @@ class ServiceUnavailable(exceptions.APIException):
     default_code = "service_unavailable"
 
 
+class CircuitOpen(ServiceUnavailable):
+    """Render an HTTP 503 when the endpoint is failing, and calls are not made for a while."""
+
+    default_detail = "Connection failed (remote service is unavailable, try again later)"
+    default_code = "circuit_open"
+
+    def __init__(self, detail=None, code=None, wait=None):
+        super().__init__(detail, code)
+        self.wait = wait  # used for the Retry-After header.
+
+
+class BulkheadFull(ServiceUnavailable):
+    """Render an HTTP 503 when too many calls to the endpoint are already in progress."""
+
+    default_detail = "Too many concurrent requests for this service, try again later"
+    default_code = "bulkhead_full"
+
+    def __init__(self, detail=None, code=None, wait=None):
+        super().__init__(detail, code)
+        self.wait = wait  # used for the Retry-After header.
+
+
 class GatewayTimeout(exceptions.APIException):
     """Render an HTTP 504 Gateway Timeout."""
 
@@ -32,6 +54,13 @@ class GatewayTimeout(exceptions.APIException):
     default_code = "gateway_timeout"
 
 
+class DeadlineExceeded(GatewayTimeout):
+    """Render an HTTP 504 when the deadline of the request has passed."""
+
+    default_detail = "Connection failed (request deadline exceeded)"
+    default_code = "deadline_exceeded"
+
+
 class ProblemJsonException(exceptions.APIException):
     """API exception that dictates exactly
     how the application/problem+json response looks like.
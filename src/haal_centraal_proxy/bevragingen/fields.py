@@ -2,32 +2,222 @@ from __future__ import annotations
 
 import logging
 import pathlib
-import re
 from collections import defaultdict
+from collections.abc import Iterable, Iterator, Mapping
+from dataclasses import dataclass
+from functools import lru_cache
+from types import MappingProxyType
+from typing import Any
 
 from django.conf import settings
 
+from . import scopes
+
 logger = logging.getLogger(__name__)
 
 CONFIG_DIR: pathlib.Path = settings.SRC_DIR / "config"
 
+# The number of distinct "fields" parameters to remember the null skeleton for.
+NULL_SKELETON_CACHE_SIZE = 256
+
+
+@dataclass(frozen=True, slots=True)
+class FieldTree:
+    """A prefix trie of dotted field names, with one level per name.
+
+    The tree is built once (e.g. for the field catalogs at import) and can't be changed.
+    Each node has a value when its path is a field name of the collection
+    (``True`` for plain collections), nodes without value only group their children.
+    A ``"naam.*"`` wildcard is stored as ``"*"`` child of the ``naam`` node.
+    """
+
+    children: Mapping[str, FieldTree]
+    value: Any = None
+
+    @classmethod
+    def build(cls, field_names: Iterable[str] | Mapping[str, Any]) -> FieldTree:
+        """Build the tree from a collection of field names, or a mapping with their values."""
+        items = (
+            field_names.items()
+            if isinstance(field_names, Mapping)
+            else ((field_name, True) for field_name in field_names)
+        )
+        tree = {}
+        for field_name, value in items:
+            node = tree
+            for name in field_name.split("."):
+                node = node.setdefault(name, {})
+            node[None] = value
+        return cls._freeze(tree)
+
+    @classmethod
+    def _freeze(cls, tree: dict) -> FieldTree:
+        return cls(
+            children=MappingProxyType(
+                {name: cls._freeze(child) for name, child in tree.items() if name is not None}
+            ),
+            value=tree.get(None),
+        )
+
+    def __contains__(self, field_name: str) -> bool:
+        """Tell whether the field name is part of the collection."""
+        node = self.get(field_name)
+        return node is not None and node.value is not None
+
+    def __iter__(self) -> Iterator[str]:
+        """Iterate over all field names (in the order they were added)."""
+        for name, child in self.children.items():
+            if child.value is not None:
+                yield name
+            for sub_name in child:
+                yield f"{name}.{sub_name}"
+
+    def get(self, field_name: str) -> FieldTree | None:
+        """Return the subtree for a (dotted) field name."""
+        node = self
+        for name in field_name.split("."):
+            if name not in node.children:
+                return None
+            node = node.children[name]
+        return node
+
+    def covers(self, field_name: str) -> bool:
+        """Tell whether a field name is part of the collection.
+        For a ``"naam.*"`` wildcard, the parent field needs to be part of the collection.
+        """
+        return field_name.removesuffix(".*") in self
+
+    def expand(self, field_name: str) -> list[str]:
+        """Expand a ``"naam.*"`` wildcard to all field names below it.
+        Other names are only returned when they are part of the collection.
+        """
+        if not field_name.endswith(".*"):
+            return [field_name] if field_name in self else []
+        prefix = field_name[:-2]
+        node = self.get(prefix)
+        return [f"{prefix}.{sub_name}" for sub_name in node] if node is not None else []
+
+    def matches_wildcard(self, field_name: str) -> bool:
+        """Tell whether a wildcard of the tree covers the field name.
+        A wildcard such as ``"naam.*"`` or ``"naam*"`` needs at least one more character
+        (e.g. ``"naam.*"`` covers ``"naam.voornamen"``, but not ``"naam."`` or ``"naam"``).
+        """
+        node = self
+        names = field_name.split(".")
+        for i, name in enumerate(names):
+            has_more_names = i + 1 < len(names)
+            for child_name in node.children:
+                if child_name.endswith("*"):
+                    prefix = child_name[:-1]
+                    if name.startswith(prefix) and (len(name) > len(prefix) or has_more_names):
+                        return True
+
+            if name not in node.children:
+                return False
+            node = node.children[name]
+        return False
+
+    def as_dict(self) -> dict[str, dict]:
+        """Convert the tree into nested dictionaries (a new copy each time)."""
+        return {name: child.as_dict() for name, child in self.children.items()}
+
+    def null_skeleton(self, array_fields: Iterable[str] = ()) -> dict:
+        """Build the object where all fields are empty.
+        The leaf fields are ``None``, top-level array fields are empty lists.
+        """
+        return {
+            name: (
+                [] if name in array_fields else child.null_skeleton() if child.children else None
+            )
+            for name, child in self.children.items()
+        }
+
+
+@dataclass(frozen=True, slots=True)
+class NullSkeleton:
+    """The empty values for the fields that are missing in an object.
+
+    This allows the client to distinguish between having 'no value' instead of 'no access'
+    (using ``?resultaat-formaat=volledig``). The skeleton is built once for a collection
+    of fields, so filling each object only has to look for the missing keys.
+    """
+
+    #: The field name, the value when it's missing,
+    #: and the skeleton of the nested object (``None`` for leaf fields).
+    entries: tuple[tuple[str, dict | list | None, NullSkeleton | None], ...]
+
+    @classmethod
+    def build(cls, tree: FieldTree, array_fields: Iterable[str] = ()) -> NullSkeleton:
+        """Build the skeleton for all fields of the tree.
+        The top-level array fields become empty lists, as these can't be expanded.
+        """
+        empty_values = tree.null_skeleton(array_fields)
+        return cls(
+            entries=tuple(
+                (name, empty_values[name], cls.build(child) if child.children else None)
+                for name, child in tree.children.items()
+            )
+        )
+
+    def fill(self, item: dict | list) -> None:
+        """Insert the missing fields in the object (or each object of a list).
+        The inserted objects are new copies, as the response is changed later (e.g. encrypted).
+        """
+        if isinstance(item, list):
+            for sub_item in item:
+                self.fill(sub_item)
+        elif isinstance(item, dict):
+            for name, empty_value, skeleton in self.entries:
+                try:
+                    value = item[name]
+                except KeyError:
+                    item[name] = _copy_empty(empty_value) if empty_value is not None else None
+                else:
+                    if skeleton is not None:
+                        skeleton.fill(value)
 
-def read_dataset_fields_files(file_glob, accepted_field_names: set[str] | None = None) -> dict:
+
+def _copy_empty(value: dict | list) -> dict | list:
+    if isinstance(value, list):
+        return []
+    return {
+        name: _copy_empty(sub_value) if sub_value is not None else None
+        for name, sub_value in value.items()
+    }
+
+
+@lru_cache(maxsize=NULL_SKELETON_CACHE_SIZE)
+def get_null_skeleton(
+    field_names: tuple[str, ...], array_fields: tuple[str, ...] = ()
+) -> NullSkeleton:
+    """Provide the (cached) null skeleton for the requested fields."""
+    return NullSkeleton.build(FieldTree.build(field_names), array_fields)
+
+
+def clear_null_skeletons() -> None:
+    """Forget all cached null skeletons."""
+    get_null_skeleton.cache_clear()
+
+
+def read_dataset_fields_files(
+    file_glob, accepted_field_names: FieldTree | None = None
+) -> dict[str, int]:
     """Read the 'gegevensset' configuration files.
     The scopes are grouped by field name they allow.
 
     Comments and whitespace are allowed.
     :returns: Which field names (keys) are accessible for which roles (values).
+        The roles are given as mask of the :mod:`scopes` module.
     """
-    scopes_for_values = defaultdict(set)
+    scopes_for_values = defaultdict(int)
     files = list(CONFIG_DIR.glob(file_glob))
     if not files:
         raise FileNotFoundError(file_glob)
 
     for file in files:
-        scope_name = file.stem
+        scope_bit = scopes.intern_scopes([file.stem])
         for field_name in _read_file(file):
-            if accepted_field_names and field_name.removesuffix(".*") not in accepted_field_names:
+            if accepted_field_names and not accepted_field_names.covers(field_name):
                 logger.warning(
                     "Configuration %s lists unknown field: %s",
                     file.relative_to(CONFIG_DIR),
@@ -35,14 +225,14 @@ def read_dataset_fields_files(file_glob, accepted_field_names: set[str] | None =
                 )
                 continue
 
-            scopes_for_values[field_name].add(scope_name)
+            scopes_for_values[field_name] |= scope_bit
 
     return dict(scopes_for_values)
 
 
-def read_config(file_name) -> set[str]:
-    """Read a configuration file, remove comments and whitespace."""
-    return set(_read_file(CONFIG_DIR / file_name))
+def read_field_names(file_name) -> FieldTree:
+    """Read a catalog of (dotted) field names into a tree."""
+    return FieldTree.build(_read_file(CONFIG_DIR / file_name))
 
 
 def _read_file(file: pathlib.Path) -> list[str]:
@@ -63,15 +253,10 @@ def compact_fields_values(allowed_values: list[str]):
         raise ValueError("No allowed values given")
 
     # Remove wildcard versions (e.g. remove 'naam.voornaam' when 'naam.*' is also allowed).
-    wildcards = [re.sub(r"\.?\*$", "", value) for value in allowed_values if value.endswith("*")]
+    wildcards = [value for value in allowed_values if value.endswith("*")]
     if not wildcards:
         return allowed_values
 
-    is_wildcard_replaced = re.compile(
-        "^({})".format(
-            "|".join(
-                re.escape(key).replace(r"\*", ".+") for key in allowed_values if key.endswith("*")
-            )
-        )
-    )
-    return [v for v in wildcards + allowed_values if not is_wildcard_replaced.match(v)]
+    wildcard_tree = FieldTree.build(wildcards)
+    prefixes = [value[:-1].removesuffix(".") for value in wildcards]
+    return [v for v in prefixes + allowed_values if not wildcard_tree.matches_wildcard(v)]
@@ -0,0 +1,86 @@
+"""Hedged requests for the calls to Haal Centraal.
+
+Some calls are occasionally much slower than others. Instead of waiting for these,
+a second identical call is made when the first one takes longer than most calls do.
+Whichever call answers first is used. The budget limits how much extra load this gives.
+
+The sync client makes the first call on the request thread, which can't be interrupted.
+Hence it only uses the hedged call when the first one fails (e.g. a read timeout),
+as the hedged call is then already in progress instead of starting a retry.
+"""
+
+import threading
+from collections import deque
+
+from .metrics import Counters
+from .retries import RetryBudget
+
+
+class HedgingPolicy:
+    """Decide when a second (hedged) call should be made."""
+
+    def __init__(
+        self,
+        *,
+        percentile: float = 0.95,
+        min_delay: float = 0.05,
+        window_size: int = 200,
+        min_samples: int = 20,
+        budget_ratio: float = 0.05,
+    ):
+        """Initialize the policy.
+
+        :param percentile: The percentile of the recent latencies after which a hedged call
+            is made. With 0.95, about 5% of the calls take longer than this.
+        :param min_delay: The minimum number of seconds to wait before a hedged call is made.
+        :param window_size: Number of recent latencies to calculate the percentile with.
+        :param min_samples: Minimum number of latencies before hedged calls are made.
+        :param budget_ratio: Maximum fraction of extra calls (e.g. 0.05 = 5% extra load).
+        """
+        self.percentile = percentile
+        self.min_delay = min_delay
+        self.min_samples = min_samples
+        self.budget = RetryBudget(budget_ratio, min_retries=1)
+        self.counters = Counters()
+        self._lock = threading.Lock()
+        self._latencies: deque[float] = deque(maxlen=window_size)
+
+    def __repr__(self):
+        return f"<{self.__class__.__qualname__}: p{self.percentile * 100:g}>"
+
+    def start(self) -> None:
+        """Register the start of a new call, which adds a fraction to the budget."""
+        self.budget.deposit()
+
+    def record(self, duration: float) -> None:
+        """Record the latency of a call."""
+        with self._lock:
+            self._latencies.append(duration)
+
+    def get_delay(self) -> float | None:
+        """Tell how long to wait before a hedged call is made.
+        This returns ``None`` when there are not enough measurements yet.
+        """
+        with self._lock:
+            if len(self._latencies) < self.min_samples:
+                return None
+            latencies = sorted(self._latencies)
+
+        return max(self.min_delay, latencies[int(self.percentile * (len(latencies) - 1))])
+
+    def allow_hedge(self) -> bool:
+        """Tell whether a hedged call can be made within the budget."""
+        if self.budget.withdraw():
+            self.counters.incr("hedges")
+            return True
+        else:
+            self.counters.incr("budget_exhausted")
+            return False
+
+    def get_stats(self) -> dict:
+        """Provide the statistics of the policy."""
+        delay = self.get_delay()
+        return {
+            **self.counters.as_dict(),
+            "delay": round(delay, 3) if delay is not None else None,
+        }
@@ -0,0 +1,25 @@
+"""Simple in-process statistics, exposed in the health check views."""
+
+import threading
+from collections import Counter
+
+
+class Counters:
+    """Thread-safe counters, e.g. to count cache hits or retries."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._values = Counter()
+
+    def __repr__(self):
+        return f"<{self.__class__.__qualname__}: {dict(self._values)}>"
+
+    def incr(self, name: str, amount: int = 1) -> None:
+        """Increment a counter."""
+        with self._lock:
+            self._values[name] += amount
+
+    def as_dict(self) -> dict[str, int]:
+        """Return a snapshot of all counters."""
+        with self._lock:
+            return dict(self._values)
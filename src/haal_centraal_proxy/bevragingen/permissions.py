@@ -2,12 +2,16 @@ from __future__ import annotations
 
 import logging
 import re
+from collections.abc import Mapping
 from dataclasses import dataclass, field
-from functools import cached_property
+from types import MappingProxyType
 from typing import ClassVar
 
 from rest_framework.permissions import BasePermission
 
+from . import scopes
+from .fields import FieldTree
+
 logger = logging.getLogger(__name__)
 audit_log = logging.getLogger("haal_centraal_proxy.audit")
 
@@ -30,6 +34,9 @@ class ParameterPolicy:
       ``ParameterPolicy(scopes_for_values={"value1": {"required-scope", ...}, "value2": ...})``.
     * Require a scope, but allow a wildcard fallback:
       ``ParameterPolicy(scopes_for_values=..., default_scope=...)``
+
+    Instead of a set, the scopes can also be given as mask of :mod:`scopes`
+    (as :func:`fields.read_dataset_fields_files` does).
     """
 
     #: Singleton for convenience, to mark that the parameter is always allowed.
@@ -41,11 +48,14 @@ class ParameterPolicy:
 
     #: A specific scope for each value. Multiple values acts as OR.
     #: The user needs to have one of the listed scopes.
-    scopes_for_values: dict[str | None, set[str] | None] = field(default_factory=dict)
+    scopes_for_values: dict[str | None, set[str] | int | None] = field(default_factory=dict)
 
     #: A default scope in case the value is missing in the :attr:`scopes_for_values`.
     default_scope: set[str] | None = None
 
+    def __post_init__(self):
+        self.compile()
+
     @classmethod
     def for_all_values(cls, scopes_for_all_values: set[str]):
         """A configuration shorthand, to require a specific scope for all incoming values."""
@@ -55,87 +65,77 @@ class ParameterPolicy:
         """Return which scopes are required for a given parameter value.
         The user only needs to have one scope of the set ("OR" comparison).
         """
-        try:
-            return self.scopes_for_values[value]
-        except KeyError:
-            # Check if there is a "fieldvalue*" lookup
-            for pattern, roles in self._roles_for_values_re:
-                if pattern.match(value):
-                    return roles
-
-        if self.default_scope is None:
-            raise ValueError(f"Value not handled: {value}")
-        return self.default_scope
+        return self._compiled.get_needed_scopes(value)
 
     def get_allowed_values(self, user_scopes: set[str]) -> list[str]:
         """Tell which values are allowed according to the given scope.
         This may include values that end with a wildcard expression.
         """
-        return [
-            value
-            for value, required_scope in self.scopes_for_values.items()
-            if (
-                # None is permission denied, empty set is no permissions required
-                required_scope is not None
-                and (not required_scope or not required_scope.isdisjoint(user_scopes))
-            )
-        ]
+        return self._compiled.get_allowed_values(scopes.get_mask(user_scopes))
 
-    @cached_property
-    def _roles_for_values_re(self) -> list[tuple[re.Pattern, set[str]]]:
-        return [
-            (re.compile(re.escape(key).replace(r"\*", ".+")), roles)
-            for key, roles in self.scopes_for_values.items()
-            if key.endswith("*")
-        ]
+    def compile(self) -> CompiledPolicy:
+        """Build the lookup tables for :meth:`get_needed_scopes`.
+        This happens when the policy is created, and should be repeated when it's changed.
+        """
+        self._compiled = CompiledPolicy.from_scopes(self.scopes_for_values, self.default_scope)
+        return self._compiled
 
     def validate_values(
-        self, field_name: str, values: list | str, user_scopes: set[str]
+        self,
+        field_name: str,
+        values: list | str,
+        user_scopes: set[str],
+        user_mask: int | None = None,
     ) -> set[str]:
         """Check whether the given parameter values are allowed.
 
         :param field_name: The field being checked
         :param values: The values parsed for the field.
         :param user_scopes: Granted scopes of the current user.
+        :param user_mask: The same scopes as mask, if this is already known.
         :raises AccessDenied: When the user should be denied
         :raises ProblemJsonException: When the value is not supported.
         :returns: The scopes that were used to access.
         """
         # Multiple values: will check each one
         values = [values] if not isinstance(values, list) else values
+        if user_mask is None:
+            user_mask = scopes.get_mask(user_scopes)
+        get_needed_mask = self._compiled.get_needed_mask
         invalid_values = []
         denied_values = []
         all_needed_scopes = set()
+        granted_mask = 0
         for value in values:
             try:
-                needed_scopes = self.get_needed_scopes(value)
+                needed_mask = get_needed_mask(value)
             except ValueError:
                 invalid_values.append(str(value))
                 continue
 
-            if needed_scopes is None:
+            if needed_mask is None:
                 # No scopes defined for this value. Deny.
                 denied_values.append(value)
                 all_needed_scopes.add(f"<always deny {field_name}={value}>")
-            elif needed_scopes:
-                # Not empty set, user must have ONE of these.
-                if user_scopes.isdisjoint(needed_scopes):  # OR comparison
-                    # User doesn't have it.
-                    denied_values.append(value)
-
-                    # track for logging
-                    if len(needed_scopes) > 1:
-                        log_needed = sorted(needed_scopes)
-                        if len(needed_scopes) > 3:
-                            log_needed = log_needed[:2] + ["..."]
-                        all_needed_scopes.add("|".join(log_needed))
-                    else:
-                        all_needed_scopes.update(needed_scopes)
+            elif needed_mask & user_mask:  # OR comparison
+                # Track for logging, but reduce to what the user already has.
+                # This makes sure the "needed" list doesn't show all alternative options.
+                granted_mask |= needed_mask & user_mask
+            else:
+                # User doesn't have any of these.
+                denied_values.append(value)
+
+                # track for logging
+                needed_scopes = scopes.get_names(needed_mask)
+                if len(needed_scopes) > 1:
+                    log_needed = sorted(needed_scopes)
+                    if len(needed_scopes) > 3:
+                        log_needed = log_needed[:2] + ["..."]
+                    all_needed_scopes.add("|".join(log_needed))
                 else:
-                    # Track for logging, but reduce to what the user already has.
-                    # This makes sure the "needed" list doesn't show all alternative options.
-                    all_needed_scopes.update(needed_scopes & user_scopes)
+                    all_needed_scopes.update(needed_scopes)
 
+        all_needed_scopes.update(scopes.get_names(granted_mask))
         if invalid_values:
             raise InvalidValues(field_name, invalid_values)
 
@@ -149,6 +149,109 @@ class ParameterPolicy:
         return all_needed_scopes
 
 
+@dataclass(frozen=True, slots=True)
+class CompiledPolicy:
+    """The lookup tables of a :class:`ParameterPolicy`.
+
+    The scopes are stored as mask (see :mod:`scopes`), so comparing them with the scopes of
+    the user is a single AND. Values that don't need a scope have the
+    :data:`~scopes.NO_SCOPE_NEEDED` bit, values that are always denied have ``None``.
+    Exact values are found in a single dictionary lookup. Wildcards such as ``"naam.*"``
+    are found by walking a prefix trie for the dotted name. Other wildcards (e.g. ``"naam*"``)
+    are still checked as regular expression. When multiple wildcards match,
+    the first one in the policy is used.
+    """
+
+    exact: Mapping[str | None, int | None]
+    #: The ``"naam.*"`` wildcards by their prefix, with their position in the policy and mask.
+    wildcards: FieldTree
+    patterns: tuple[tuple[int, re.Pattern, int | None], ...]
+    default_scope: int | None
+    #: All values with their mask, to find all values a user may use.
+    allowed_values: tuple[tuple[str | None, int], ...]
+
+    @classmethod
+    def from_scopes(
+        cls,
+        scopes_for_values: dict[str | None, set[str] | int | None],
+        default_scope: set[str] | int | None,
+    ) -> CompiledPolicy:
+        """Compile the configuration of a :class:`ParameterPolicy`."""
+        exact = {}
+        wildcards = {}
+        patterns = []
+        for index, (value, needed_scopes) in enumerate(scopes_for_values.items()):
+            mask = _to_mask(needed_scopes)
+            exact[value] = mask
+            if not isinstance(value, str) or not value.endswith("*"):
+                continue
+
+            prefix = value.removesuffix(".*")
+            if prefix != value and "*" not in prefix:
+                wildcards.setdefault(prefix, (index, mask))
+            else:
+                patterns.append((index, re.compile(re.escape(value).replace(r"\*", ".+")), mask))
+
+        return cls(
+            exact=MappingProxyType(exact),
+            wildcards=FieldTree.build(wildcards),
+            patterns=tuple(patterns),
+            default_scope=_to_mask(default_scope),
+            allowed_values=tuple((value, mask) for value, mask in exact.items() if mask),
+        )
+
+    def get_needed_scopes(self, value) -> frozenset[str] | None:
+        """Return which scopes are required for a given parameter value."""
+        mask = self.get_needed_mask(value)
+        return scopes.get_names(mask) if mask is not None else None
+
+    def get_needed_mask(self, value) -> int | None:
+        """Return the mask of the scopes that are required for a given parameter value."""
+        try:
+            return self.exact[value]
+        except KeyError:
+            pass
+
+        if isinstance(value, str) and (match := self._match_wildcard(value)) is not None:
+            return match[1]
+        if self.default_scope is None:
+            raise ValueError(f"Value not handled: {value}")
+        return self.default_scope
+
+    def get_allowed_values(self, user_mask: int) -> list[str]:
+        """Tell which values are allowed for the scopes of the user."""
+        return [value for value, mask in self.allowed_values if mask & user_mask]
+
+    def _match_wildcard(self, value: str) -> tuple[int, int | None] | None:
+        """Find the first wildcard that matches the value."""
+        best = None
+        node = self.wildcards
+        names = value.split(".")
+        last = len(names) - 1
+        for i, name in enumerate(names[:last]):
+            if name not in node.children:
+                break
+            node = node.children[name]
+
+            # The wildcard needs a non-empty suffix (e.g. "naam.*" doesn't match "naam.").
+            has_suffix = i + 1 < last or names[last] != ""
+            if node.value is not None and has_suffix and (best is None or node.value[0] < best[0]):
+                best = node.value
+
+        for index, pattern, mask in self.patterns:
+            if best is not None and index > best[0]:
+                break
+            if pattern.match(value):
+                return index, mask
+        return best
+
+
+def _to_mask(needed_scopes: set[str] | int | None) -> int | None:
+    if needed_scopes is None or isinstance(needed_scopes, int):
+        return needed_scopes
+    return scopes.intern_scopes(needed_scopes)
+
+
 ParameterPolicy.allow_all = ParameterPolicy(default_scope=set())
 ParameterPolicy.allow_value = frozenset()
 
@@ -210,13 +313,16 @@ def validate_parameters(
     # Check whether certain parameters are allowed:
     invalid_names = []
     all_needed_scopes = set()
+    user_mask = scopes.get_mask(user_scopes)
     for field_name, values in hc_request.items():
         try:
             policy = ruleset[field_name]
         except KeyError:
             invalid_names.append(field_name)
         else:
-            needed_for_param = policy.validate_values(field_name, values, user_scopes)
+            needed_for_param = policy.validate_values(
+                field_name, values, user_scopes, user_mask=user_mask
+            )
             all_needed_scopes.update(needed_for_param)
 
     if invalid_names:
@@ -0,0 +1,21 @@
+"""Output formats of the views."""
+
+import orjson
+from rest_framework.renderers import BaseRenderer
+
+
+class NDJSONRenderer(BaseRenderer):
+    """Newline-delimited JSON, selected with ``?_format=ndjson``.
+
+    The proxy views stream the items of their response directly (one item per line).
+    This renderer is used for the other responses (e.g. errors), which are written as one line.
+    """
+
+    media_type = "application/x-ndjson"
+    format = "ndjson"
+    charset = None  # always UTF-8
+
+    def render(self, data, accepted_media_type=None, renderer_context=None) -> bytes:
+        if data is None:
+            return b""
+        return orjson.dumps(data) + b"\n"
@@ -0,0 +1,191 @@
+"""Retry policy for the calls to Haal Centraal.
+
+All Haal Centraal queries are POST requests that only read data, so these are safe to repeat.
+To avoid that retries amplify an outage of the remote server, retries are limited by:
+
+* a deadline per request (no retries once the time is up),
+* a retry budget that is shared by all requests of the process.
+"""
+
+from __future__ import annotations
+
+import random
+import threading
+import time
+
+from rest_framework import status
+
+from .metrics import Counters
+
+# Process-wide registry, so all clients of a worker share the same budget.
+_retry_budgets: dict[tuple[float, int], RetryBudget] = {}
+_retry_budgets_lock = threading.Lock()
+
+
+class RetryBudget:
+    """Limit the number of retries to a fraction of the number of requests.
+
+    Each request deposits a fraction of a retry, each retry withdraws a complete one.
+    When the remote server fails for all requests, at most ``ratio`` extra requests are made.
+    The ``min_retries`` allows retries when there is little traffic,
+    and is also the maximum that can be saved up.
+    """
+
+    def __init__(self, ratio: float = 0.1, min_retries: int = 10):
+        """Initialize the budget.
+
+        :param ratio: How many retries are allowed per request (e.g. 0.1 = 10%).
+        :param min_retries: How many retries can be made without any requests.
+        """
+        self.ratio = ratio
+        self.min_retries = min_retries
+        self.max_balance = max(min_retries, 1)
+        self._balance = float(min_retries)
+        self._lock = threading.Lock()
+
+    def __repr__(self):
+        return f"<{self.__class__.__qualname__}: {self._balance:.1f}>"
+
+    @property
+    def balance(self) -> float:
+        """Tell how many retries can still be made."""
+        return self._balance
+
+    def deposit(self) -> None:
+        """Register a new request, which allows a fraction of a retry."""
+        with self._lock:
+            # Rounded, so the fractions add up to whole retries.
+            self._balance = min(round(self._balance + self.ratio, 6), self.max_balance)
+
+    def withdraw(self) -> bool:
+        """Take a retry from the budget. This returns ``False`` when the budget is exhausted."""
+        with self._lock:
+            if self._balance < 1:
+                return False
+            self._balance -= 1
+            return True
+
+
+class RetryPolicy:
+    """Decide whether, and when, a failed call should be attempted again.
+
+    The delays use exponential backoff with "full jitter": a random delay between 0 and the
+    backoff. This spreads the retries of all workers, instead of retrying at the same moment.
+    """
+
+    #: Status codes of the gateway that indicate a temporary failure.
+    retry_statuses = frozenset(
+        {
+            status.HTTP_502_BAD_GATEWAY,
+            status.HTTP_503_SERVICE_UNAVAILABLE,
+            status.HTTP_504_GATEWAY_TIMEOUT,
+        }
+    )
+
+    def __init__(
+        self,
+        attempts: int = 1,
+        *,
+        backoff: float = 0.1,
+        max_backoff: float = 2.0,
+        deadline: float | None = None,
+        budget: RetryBudget | None = None,
+    ):
+        """Initialize the policy.
+
+        :param attempts: Maximum number of attempts, including the first call.
+        :param backoff: The delay before the first retry, doubled for each next retry.
+        :param max_backoff: The maximum delay between retries.
+        :param deadline: The number of seconds after which no more retries are made.
+        :param budget: The budget that limits the total number of retries.
+        """
+        self.attempts = attempts
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.deadline = deadline
+        self.budget = budget
+        self.counters = Counters()
+
+    def __repr__(self):
+        return f"<{self.__class__.__qualname__}: {self.attempts} attempts>"
+
+    def start(self) -> None:
+        """Register the start of a new request."""
+        if self.budget is not None:
+            self.budget.deposit()
+
+    def get_remaining(self, t0: int, deadline: float | None = None) -> float | None:
+        """Tell how many seconds are left before the deadline, or ``None`` when there is none.
+
+        :param t0: The start of the request, in :func:`time.perf_counter_ns` units.
+        :param deadline: Optional deadline of the caller, in seconds since ``t0``.
+            The earliest of both deadlines applies.
+        """
+        deadlines = [d for d in (self.deadline, deadline) if d is not None]
+        if not deadlines:
+            return None
+        return min(deadlines) - (time.perf_counter_ns() - t0) * 1e-9
+
+    def get_timeout(
+        self, t0: int, timeout: tuple[float, float], deadline: float | None = None
+    ) -> tuple[float, float]:
+        """Limit the (connect, read) timeout of an attempt, so it doesn't exceed the deadline.
+
+        :param t0: The start of the request, in :func:`time.perf_counter_ns` units.
+        :param timeout: The regular (connect, read) timeout.
+        :param deadline: Optional deadline of the caller, in seconds since ``t0``.
+        """
+        remaining = self.get_remaining(t0, deadline)
+        if remaining is None:
+            return timeout
+
+        remaining = max(0.001, remaining)
+        return min(timeout[0], remaining), min(timeout[1], remaining)
+
+    def get_delay(self, attempt: int, t0: int, deadline: float | None = None) -> float | None:
+        """Tell how long to wait before the next attempt, or ``None`` to stop retrying.
+
+        :param attempt: The number of the attempt that failed (starting at 1).
+        :param t0: The start of the request, in :func:`time.perf_counter_ns` units.
+        :param deadline: Optional deadline of the caller, in seconds since ``t0``.
+        """
+        if attempt >= self.attempts:
+            return None
+
+        delay = random.uniform(0, min(self.max_backoff, self.backoff * 2 ** (attempt - 1)))
+        remaining = self.get_remaining(t0, deadline)
+        if remaining is not None and delay >= remaining:
+            self.counters.incr("deadline_exceeded")
+            return None
+
+        if self.budget is not None and not self.budget.withdraw():
+            self.counters.incr("budget_exhausted")
+            return None
+
+        self.counters.incr("retries")
+        return delay
+
+    def get_stats(self) -> dict:
+        """Provide the statistics of the policy."""
+        stats = self.counters.as_dict()
+        if self.budget is not None:
+            stats["budget"] = round(self.budget.balance, 1)
+        return stats
+
+
+def get_retry_budget(ratio: float, min_retries: int) -> RetryBudget:
+    """Return the shared retry budget for the given settings."""
+    key = (ratio, min_retries)
+    with _retry_budgets_lock:
+        try:
+            return _retry_budgets[key]
+        except KeyError:
+            budget = RetryBudget(ratio, min_retries)
+            _retry_budgets[key] = budget
+            return budget
+
+
+def clear_retry_budgets() -> None:
+    """Remove all shared retry budgets."""
+    with _retry_budgets_lock:
+        _retry_budgets.clear()
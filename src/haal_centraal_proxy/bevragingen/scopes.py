@@ -0,0 +1,50 @@
+"""Scope names as bits of an integer.
+
+The permission checks compare the scopes of the user with the scopes that a field needs.
+When each scope name has its own bit, such comparison is a single AND of two integers.
+The scope names are given a bit when the configuration is read (at import).
+"""
+
+from __future__ import annotations
+
+import threading
+from collections.abc import Iterable
+from functools import lru_cache
+
+#: The bit for values that don't need a scope. All masks of users have this bit.
+NO_SCOPE_NEEDED = 1
+
+_bits: dict[str, int] = {}
+_bits_lock = threading.Lock()
+
+
+def intern_scopes(scope_names: Iterable[str]) -> int:
+    """Give each scope name a bit, and return the mask of these scopes.
+    An empty collection returns :data:`NO_SCOPE_NEEDED`.
+    """
+    mask = 0
+    with _bits_lock:
+        for scope_name in scope_names:
+            try:
+                mask |= _bits[scope_name]
+            except KeyError:
+                bit = 1 << (len(_bits) + 1)
+                _bits[scope_name] = bit
+                mask |= bit
+    return mask or NO_SCOPE_NEEDED
+
+
+def get_mask(scope_names: Iterable[str]) -> int:
+    """Tell the mask of the scopes a user has.
+    Scopes that are not used in the configuration are not part of the mask.
+    """
+    mask = NO_SCOPE_NEEDED
+    for scope_name in scope_names:
+        mask |= _bits.get(scope_name, 0)
+    return mask
+
+
+@lru_cache(maxsize=1024)
+def get_names(mask: int) -> frozenset[str]:
+    """Tell which scope names are part of the mask."""
+    return frozenset(scope_name for scope_name, bit in tuple(_bits.items()) if mask & bit)
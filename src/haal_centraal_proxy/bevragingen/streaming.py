@@ -0,0 +1,133 @@
+"""Incremental parsing of the responses of Haal Centraal.
+
+Large responses (e.g. a postcode search for a big apartment building) contain a long list
+of items. Instead of parsing the whole response at once, the items of this list are parsed
+one by one while the data is received. This way, only a single item is kept in memory.
+"""
+
+import re
+from collections.abc import Iterable, Iterator
+
+import orjson
+
+#: Number of bytes to read at once from the remote server.
+CHUNK_SIZE = 64 * 1024
+
+# Characters that change the structure, and the characters that end a string.
+_RE_STRUCTURE = re.compile(rb'["{}\[\],:]')
+_RE_STRING_END = re.compile(rb'["\\]')
+
+
+class ItemScanner:
+    """Find the items of a JSON array in a JSON object, while the data is received.
+
+    The data is given in chunks to :meth:`feed`, which returns the items that are complete.
+    Everything except the items is returned by :meth:`close`. For example, for
+    ``{"type": "...", "personen": [{...}, {...}]}`` the items are the ``personen`` objects.
+    """
+
+    def __init__(self, items_field: str):
+        self.items_key = orjson.dumps(items_field)
+        self._buffer = bytearray()
+        self._rest = bytearray()  # the object without the items.
+        self._pos = 0  # the scan position in the buffer.
+        self._depth = 0
+        self._in_string = False
+        self._string_start = 0
+        self._last_string = None  # for detecting the items key.
+        self._after_key = False
+        self._in_items = False
+        self._item_start = 0
+
+    def feed(self, data: bytes) -> list:
+        """Process the next part of the data, and return the items that are complete."""
+        self._buffer += data
+        items = []
+        pos = self._pos
+        while pos is not None:
+            pos = self._scan_string(pos) if self._in_string else self._scan_structure(pos, items)
+
+        if self._in_items and self._item_start:
+            # Only keep the data of the item that is not complete yet.
+            del self._buffer[: self._item_start]
+            self._pos -= self._item_start
+            self._item_start = 0
+        return items
+
+    def close(self) -> dict:
+        """Return everything except the items, after all data is received.
+        The items field is an empty list in the returned object.
+        """
+        if self._in_items or self._in_string or self._depth != 0:
+            raise ValueError("Incomplete JSON data")
+        return orjson.loads(self._rest + self._buffer)
+
+    def _scan_string(self, pos: int) -> int | None:
+        """Find the end of a string. This returns ``None`` when more data is needed."""
+        match = _RE_STRING_END.search(self._buffer, pos)
+        if match is None:
+            self._pos = len(self._buffer)
+            return None
+
+        end = match.end()
+        if match[0] == b"\\":
+            if end >= len(self._buffer):
+                self._pos = match.start()  # wait for the escaped character.
+                return None
+            return end + 1
+
+        self._in_string = False
+        if self._depth == 1:
+            self._last_string = bytes(self._buffer[self._string_start : end])
+        return end
+
+    def _scan_structure(self, pos: int, items: list) -> int | None:
+        """Process the next structure character. This returns ``None`` when more data is needed."""
+        buffer = self._buffer
+        match = _RE_STRUCTURE.search(buffer, pos)
+        if match is None:
+            self._pos = len(buffer)
+            return None
+
+        char = match[0]
+        start, pos = match.span()
+        if char == b'"':
+            self._in_string = True
+            self._string_start = start
+        elif self._depth == 1 and not self._in_items and self._is_items_start(char):
+            self._in_items = True
+            self._depth += 1
+            self._rest += buffer[:pos]
+            self._item_start = pos
+        elif char in b"{[":
+            self._depth += 1
+        elif char in b"}]":
+            self._depth -= 1
+            if self._in_items and self._depth == 1:
+                # End of the items, only the remaining data is kept.
+                self._add_item(items, buffer[self._item_start : start])
+                self._in_items = False
+                del buffer[:start]
+                pos -= start
+        elif char == b"," and self._in_items and self._depth == 2:
+            self._add_item(items, buffer[self._item_start : start])
+            self._item_start = pos
+        return pos
+
+    def _is_items_start(self, char: bytes) -> bool:
+        """Detect the start of the items: ``"key": [``"""
+        after_key = self._after_key
+        self._after_key = char == b":" and self._last_string == self.items_key
+        return after_key and char == b"["
+
+    def _add_item(self, items: list, data: bytearray):
+        if data.strip():
+            items.append(orjson.loads(data))
+
+
+def iter_items(chunks: Iterable[bytes], items_field: str) -> Iterator:
+    """Parse the items of a JSON response one by one, while the data is received."""
+    scanner = ItemScanner(items_field)
+    for chunk in chunks:
+        yield from scanner.feed(chunk)
+    scanner.close()
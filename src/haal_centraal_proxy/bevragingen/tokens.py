@@ -0,0 +1,348 @@
+"""Storage of the OAuth token for the Diginetwerk API gateway.
+
+The token is shared between all worker processes on the same node using a file.
+This avoids that every uwsgi worker requests its own token when it starts,
+or when the token expires (a "thundering herd" at the OAuth endpoint).
+"""
+
+from __future__ import annotations
+
+import contextlib
+import fcntl
+import logging
+import os
+import random
+import stat
+import tempfile
+import threading
+import time
+from collections.abc import Callable, Iterator
+from pathlib import Path
+from typing import NotRequired, TypedDict
+
+import orjson
+
+from .metrics import Counters
+
+logger = logging.getLogger(__name__)
+
+# Process-wide registry, so all clients of a worker share the same token (and refresher).
+_token_stores: dict[tuple[Path | None, str], TokenStore] = {}
+_token_stores_lock = threading.Lock()
+
+
+class OAuthToken(TypedDict):
+    token_type: str  # bearer
+    access_token: str
+    expires_in: int
+    expires_at: NotRequired[float]  # inserted by requests-oauthlib
+    scope: str
+
+
+class TokenStore:
+    """Single-flight storage of the OAuth token.
+
+    Only one worker (or thread) refreshes the token, while the others either wait for it
+    (when there is no valid token) or continue using the current token (when it's still valid).
+    Without a file path, the token is only shared between threads of the same process.
+    """
+
+    #: How many seconds before expiry the token should be refreshed.
+    refresh_margin = 900
+
+    #: Don't use a token that is about to expire, it could be rejected during the call.
+    expiry_margin = 10
+
+    def __init__(self, path: Path | str | None = None, *, key: str = ""):
+        """Initialize the store.
+
+        :param path: File to share the token between processes.
+        :param key: Identifies the credentials, so a token of different settings is not reused.
+        """
+        self.path = Path(path) if path else None
+        self.key = key
+        if self.path is not None:
+            self._check_directory()
+        self.counters = Counters()
+        self._thread_lock = threading.Lock()
+        self._token: OAuthToken | None = None
+        self._mtime = None
+        self._refresher: TokenRefresher | None = None
+
+    def __repr__(self):
+        return f"<{self.__class__.__qualname__}: {self.path}>"
+
+    def _check_directory(self):
+        """Create the directory of the token file, which should only be accessible by this user."""
+        self.path.parent.mkdir(mode=0o700, parents=True, exist_ok=True)
+        st = self.path.parent.stat()
+        if st.st_uid != os.getuid() or st.st_mode & 0o077:
+            logger.warning("OAuth token directory %s is accessible by others", self.path.parent)
+
+    def get_token(self, fetch: Callable[[], OAuthToken]) -> OAuthToken:
+        """Return a valid token, only calling ``fetch()`` when no other worker does this.
+
+        :param fetch: Function that requests a new token from the OAuth endpoint.
+        """
+        token = self.read()
+        if self.is_fresh(token):
+            self.counters.incr("hits")
+            return token
+
+        is_usable = self.is_usable(token)
+        with self._lock(blocking=not is_usable) as acquired:
+            if not acquired:
+                # Another worker is refreshing, the current token can still be used.
+                self.counters.incr("stale_hits")
+                return token
+
+            # Check again, another worker could have refreshed it while waiting for the lock.
+            new_token = self.read()
+            if self.is_fresh(new_token):
+                self.counters.incr("waits")
+                return new_token
+
+            try:
+                return self._refresh(fetch)
+            except Exception as e:  # noqa: BLE001
+                if not is_usable:
+                    raise
+
+                # The current token can still be used, retry on the next call.
+                logger.warning("Failed to refresh OAuth token, using current token: %s", e)
+                self.counters.incr("refresh_errors")
+                return token
+
+    def get_fresh_token(self) -> OAuthToken | None:
+        """Return the token that was last read or saved, when it doesn't need refreshing.
+        Unlike :meth:`get_token`, this never accesses the file, so it doesn't block.
+        """
+        token = self._token
+        if not self.is_fresh(token):
+            return None
+
+        self.counters.incr("hits")
+        return token
+
+    def refresh(self, fetch: Callable[[], OAuthToken]) -> OAuthToken:
+        """Unconditionally retrieve a new token, and share it with the other workers."""
+        with self._lock(blocking=True):
+            return self._refresh(fetch)
+
+    def renew(self, fetch: Callable[[], OAuthToken], token: OAuthToken | None) -> OAuthToken:
+        """Replace the given token, unless another worker already did this.
+
+        :param fetch: Function that requests a new token from the OAuth endpoint.
+        :param token: The token that should be replaced.
+        """
+        with self._lock(blocking=True):
+            current = self.read()
+            if current is not None and (
+                token is None or current["access_token"] != token["access_token"]
+            ):
+                # Another worker was first.
+                return current
+
+            return self._refresh(fetch)
+
+    def start_refresher(self, fetch: Callable[[], OAuthToken]) -> None:
+        """Start renewing the token in the background, so requests never wait for it."""
+        with self._thread_lock:
+            if self._refresher is None or not self._refresher.is_alive():
+                self._refresher = TokenRefresher(self, fetch)
+                self._refresher.start()
+
+    def stop_refresher(self) -> None:
+        """Stop the background renewal."""
+        if self._refresher is not None:
+            self._refresher.stop()
+            self._refresher = None
+
+    def _refresh(self, fetch: Callable[[], OAuthToken]) -> OAuthToken:
+        logger.debug("Retrieving new OAuth token")
+        token = fetch()
+        self.counters.incr("refreshes")
+        self.save(token)
+        return token
+
+    def is_fresh(self, token: OAuthToken | None) -> bool:
+        """Tell whether the token can be used without refreshing it."""
+        return token is not None and time.time() < token["expires_at"] - self.refresh_margin
+
+    def is_usable(self, token: OAuthToken | None) -> bool:
+        """Tell whether the token is still valid (but perhaps should be refreshed)."""
+        return token is not None and time.time() < token["expires_at"] - self.expiry_margin
+
+    def read(self) -> OAuthToken | None:
+        """Read the current token. The file is only parsed again when it's changed."""
+        if self.path is None:
+            return self._token
+
+        try:
+            mtime = self.path.stat(follow_symlinks=False).st_mtime_ns
+        except FileNotFoundError:
+            return None
+
+        if mtime != self._mtime:
+            try:
+                data = orjson.loads(self._read_file())
+            except (OSError, orjson.JSONDecodeError) as e:
+                # Could be written by an older version, treat as missing.
+                logger.warning("Unable to read OAuth token file %s: %s", self.path, e)
+                return None
+
+            self._token = data["token"] if data.get("key") == self.key else None
+            self._mtime = mtime
+
+        return self._token
+
+    def _read_file(self) -> bytes:
+        """Read the token file, only when it's written by this user.
+        A symlink or file placed by another user could otherwise provide a different token.
+        """
+        fd = os.open(self.path, os.O_RDONLY | os.O_NOFOLLOW)
+        with os.fdopen(fd, "rb") as f:
+            st = os.fstat(fd)
+            if not stat.S_ISREG(st.st_mode) or st.st_uid != os.getuid():
+                raise PermissionError("file is not owned by the current user")
+            return f.read()
+
+    def save(self, token: OAuthToken) -> None:
+        """Store the token for all workers."""
+        if "expires_at" not in token:
+            token = {**token, "expires_at": time.time() + token["expires_in"]}
+
+        self._token = token
+        if self.path is None:
+            return
+
+        logger.debug("Storing OAuth access token in %s", self.path)
+        data = orjson.dumps({"key": self.key, "token": token})
+
+        # Write to a temporary file, and move it in place. This makes the update atomic,
+        # so other workers will never read a half-written file.
+        # The file contains a secret, so only the current user may read it (mkstemp uses 0600).
+        # It has an unpredictable name, so it can't be replaced by a symlink beforehand.
+        fd, tmp_path = tempfile.mkstemp(dir=self.path.parent, prefix=f".{self.path.name}.")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, self.path)
+        except BaseException:
+            with contextlib.suppress(OSError):
+                os.unlink(tmp_path)
+            raise
+        self._mtime = self.path.stat(follow_symlinks=False).st_mtime_ns
+
+    @contextlib.contextmanager
+    def _lock(self, blocking: bool) -> Iterator[bool]:
+        """Lock between threads, and between processes when a file is used."""
+        if not self._thread_lock.acquire(blocking=blocking):
+            yield False
+            return
+
+        try:
+            if self.path is None:
+                yield True
+                return
+
+            lock_path = self.path.with_name(f"{self.path.name}.lock")
+            fd = os.open(lock_path, os.O_RDWR | os.O_CREAT | os.O_NOFOLLOW, 0o600)
+            try:
+                try:
+                    fcntl.flock(fd, fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    yield False
+                    return
+
+                try:
+                    yield True
+                finally:
+                    fcntl.flock(fd, fcntl.LOCK_UN)
+            finally:
+                os.close(fd)
+        finally:
+            self._thread_lock.release()
+
+
+class TokenRefresher(threading.Thread):
+    """Background thread that renews the token before it expires.
+
+    Each worker renews at a slightly different (random) moment, so typically one worker
+    performs the renewal, and the others find the new token in the shared file.
+    Failures are retried with a backoff, while the current token is still valid.
+    """
+
+    #: Maximum number of seconds the renewal is started earlier, different for each worker.
+    jitter = 120
+
+    #: Delays between retries when the renewal failed.
+    retry_delay = 5
+    max_retry_delay = 60
+
+    def __init__(self, store: TokenStore, fetch: Callable[[], OAuthToken]):
+        super().__init__(name="oauth-token-refresher", daemon=True)
+        self.store = store
+        self.fetch = fetch
+        self.worker_jitter = random.uniform(0, self.jitter)
+        self._stopped = threading.Event()
+
+    def stop(self) -> None:
+        """Request the thread to stop."""
+        self._stopped.set()
+
+    def run(self) -> None:
+        failures = 0
+        while not self._stopped.is_set():
+            token = self.store.read()
+            if failures:
+                delay = min(self.retry_delay * 2 ** (failures - 1), self.max_retry_delay)
+            else:
+                delay = self.get_renew_delay(token)
+
+            if self._stopped.wait(delay):
+                break
+
+            # Only renew when nobody else did this during the wait.
+            token = self.store.read()
+            if self.get_renew_delay(token) > 0:
+                continue
+
+            try:
+                self.store.renew(self.fetch, token)
+            except Exception as e:  # noqa: BLE001
+                failures += 1
+                level = logging.WARNING if self.store.is_usable(token) else logging.ERROR
+                logger.log(level, "Background renewal of OAuth token failed: %s", e)
+                self.store.counters.incr("background_errors")
+            else:
+                failures = 0
+                self.store.counters.incr("background_renewals")
+
+    def get_renew_delay(self, token: OAuthToken | None) -> float:
+        """Tell how many seconds to wait before the token should be renewed."""
+        if token is None:
+            return 0
+
+        renew_at = token["expires_at"] - self.store.refresh_margin - self.worker_jitter
+        return max(0.0, renew_at - time.time())
+
+
+def get_token_store(path: Path | str | None, key: str) -> TokenStore:
+    """Return the shared token store for the given settings."""
+    path = Path(path) if path else None
+    with _token_stores_lock:
+        try:
+            return _token_stores[path, key]
+        except KeyError:
+            store = TokenStore(path, key=key)
+            _token_stores[path, key] = store
+            return store
+
+
+def clear_token_stores() -> None:
+    """Remove all shared token stores, and stop their background renewal."""
+    with _token_stores_lock:
+        for store in _token_stores.values():
+            store.stop_refresher()
+        _token_stores.clear()
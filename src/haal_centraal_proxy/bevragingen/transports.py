@@ -0,0 +1,384 @@
+"""Transports for the requests library.
+
+With HTTP/1.1, every concurrent request needs its own connection (and TLS session).
+HTTP/2 multiplexes many requests as "streams" over a single connection.
+New connections resume the TLS session of earlier connections, which avoids a full handshake.
+"""
+
+from __future__ import annotations
+
+import contextlib
+import logging
+import os
+import ssl
+import threading
+import time
+import weakref
+from collections.abc import Iterator
+from pathlib import Path
+
+import httpx
+import requests
+from requests.adapters import BaseAdapter, HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+from requests.utils import get_encoding_from_headers
+
+from .metrics import Counters
+
+logger = logging.getLogger(__name__)
+
+# Process-wide registry, so all clients share the loaded certificates and TLS sessions.
+_ssl_contexts: dict[tuple, ResumingSSLContext] = {}
+_ssl_contexts_lock = threading.Lock()
+
+
+class _ResumingSSLSocket(ssl.SSLSocket):
+    """SSL socket that hands its session back to the context when it's closed."""
+
+    def _real_close(self):
+        if self.server_hostname:
+            with contextlib.suppress(OSError, ValueError):
+                self.context._store_session(self.server_hostname, self.session)
+        super()._real_close()
+
+
+class ResumingSSLContext(ssl.SSLContext):
+    """SSL context that resumes the TLS session of an earlier connection to the same host.
+
+    Resumed sessions skip the certificate exchange (including our client certificate),
+    so new connections are much cheaper. The handshakes are counted and timed.
+    """
+
+    sslsocket_class = _ResumingSSLSocket
+
+    def __init__(self, *args, **kwargs):
+        #: The files the context was created with, to detect requests that expect others.
+        self.ca_bundle: str | None = None
+        self.cert: tuple[str, str | None] | None = None
+        self.counters = Counters()
+        self._lock = threading.Lock()
+        self._sessions: dict[str, ssl.SSLSession] = {}
+        self._last_sockets: dict[str, weakref.ref] = {}
+        self._handshake_time = 0.0
+        self._max_handshake_time = 0.0
+
+    def wrap_socket(self, sock, *args, server_hostname=None, session=None, **kwargs):
+        """Wrap the socket, resuming the last session for the host."""
+        if session is None and server_hostname:
+            session = self._get_session(server_hostname)
+
+        t0 = time.perf_counter()
+        ssl_sock = super().wrap_socket(
+            sock, *args, server_hostname=server_hostname, session=session, **kwargs
+        )
+        self._record_handshake(time.perf_counter() - t0, ssl_sock.session_reused)
+
+        if server_hostname:
+            with self._lock:
+                self._last_sockets[server_hostname] = weakref.ref(ssl_sock)
+            self._store_session(server_hostname, ssl_sock.session)
+        return ssl_sock
+
+    def _get_session(self, server_hostname: str) -> ssl.SSLSession | None:
+        # With TLS 1.3, the session ticket is received after the handshake.
+        # Hence, the session is taken again from the last connection while it's still open,
+        # or when it was closed (see _ResumingSSLSocket).
+        with self._lock:
+            ref = self._last_sockets.get(server_hostname)
+        ssl_sock = ref() if ref is not None else None
+        if ssl_sock is not None:
+            with contextlib.suppress(OSError, ValueError):
+                self._store_session(server_hostname, ssl_sock.session)
+        with self._lock:
+            return self._sessions.get(server_hostname)
+
+    def _store_session(self, server_hostname: str, session: ssl.SSLSession | None):
+        if session is None:
+            return
+        with self._lock:
+            # A session without ticket doesn't replace a session that can be resumed.
+            if session.has_ticket or server_hostname not in self._sessions:
+                self._sessions[server_hostname] = session
+
+    def _record_handshake(self, duration: float, resumed: bool):
+        self.counters.incr("handshakes")
+        if resumed:
+            self.counters.incr("resumed")
+        with self._lock:
+            self._handshake_time += duration
+            self._max_handshake_time = max(self._max_handshake_time, duration)
+
+    def get_stats(self) -> dict:
+        """Provide the statistics of the TLS handshakes."""
+        stats = self.counters.as_dict()
+        handshakes = stats.get("handshakes", 0)
+        with self._lock:
+            stats["handshake_time_avg"] = (
+                round(self._handshake_time / handshakes, 4) if handshakes else None
+            )
+            stats["handshake_time_max"] = round(self._max_handshake_time, 4)
+        return stats
+
+
+def create_ssl_context(cert_file=None, key_file=None, ca_dir=None) -> ResumingSSLContext:
+    """Create the SSL context, with the same CA bundle as the requests library uses.
+
+    :param cert_file: Optional certificate file for mTLS.
+    :param key_file: Optional private key file for mTLS.
+    :param ca_dir: Optional folder with additional CA certificates (``*.crt`` files),
+        e.g. the PKIoverheid certificates of the private 'diginetwerk'.
+    """
+    ssl_context = ResumingSSLContext(ssl.PROTOCOL_TLS_CLIENT)
+    ssl_context.options &= ~ssl.OP_NO_TICKET  # allow session tickets.
+    if ca_bundle := os.environ.get("REQUESTS_CA_BUNDLE"):
+        ssl_context.load_verify_locations(cafile=ca_bundle)
+        ssl_context.ca_bundle = ca_bundle
+    else:
+        ssl_context.load_default_certs()
+    if ca_dir is not None:
+        for ca_file in sorted(Path(ca_dir).glob("*.crt")):
+            ssl_context.load_verify_locations(cafile=ca_file)
+    if cert_file is not None:
+        ssl_context.load_cert_chain(cert_file, key_file)
+        ssl_context.cert = (str(cert_file), str(key_file) if key_file is not None else None)
+    return ssl_context
+
+
+def get_ssl_context(cert_file=None, key_file=None, ca_dir=None) -> ResumingSSLContext:
+    """Return the shared SSL context, so certificates are only loaded once per process."""
+    key = (str(cert_file), str(key_file), str(ca_dir))
+    with _ssl_contexts_lock:
+        try:
+            return _ssl_contexts[key]
+        except KeyError:
+            ssl_context = create_ssl_context(cert_file, key_file, ca_dir)
+            _ssl_contexts[key] = ssl_context
+            return ssl_context
+
+
+def clear_ssl_contexts() -> None:
+    """Remove all shared SSL contexts."""
+    with _ssl_contexts_lock:
+        _ssl_contexts.clear()
+
+
+def check_ssl_settings(ssl_context: ssl.SSLContext, verify, cert) -> None:
+    """Check that the request settings match the shared SSL context.
+    The context verifies the server certificate, and provides the client certificate.
+    Hence, a request can't use other settings (e.g. ``verify=False`` or another bundle).
+    """
+    ca_bundle = getattr(ssl_context, "ca_bundle", None)
+    if verify is not True and verify != ca_bundle:
+        # This also happens when REQUESTS_CA_BUNDLE is changed after the context was created.
+        raise ValueError(
+            f"Request uses verify={verify!r}, but the shared SSL context"
+            f" is created with the CA bundle {ca_bundle!r}"
+        )
+
+    if cert is not None:
+        cert = (str(cert), None) if isinstance(cert, str | os.PathLike) else tuple(map(str, cert))
+        context_cert = getattr(ssl_context, "cert", None)
+        if cert != context_cert:
+            raise ValueError(
+                f"Request uses cert={cert!r}, but the shared SSL context"
+                f" is created with {context_cert!r}"
+            )
+
+
+class TLSAdapter(HTTPAdapter):
+    """HTTP/1.1 adapter that uses a shared SSL context for all connections.
+
+    The context already holds the CA certificates and client certificate, so these files
+    are no longer read for every new connection. This also allows resuming TLS sessions.
+    """
+
+    def __init__(self, ssl_context: ResumingSSLContext, **kwargs):
+        self.ssl_context = ssl_context
+        super().__init__(**kwargs)
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, ssl_context=self.ssl_context, **kwargs)
+
+    def build_connection_pool_key_attributes(self, request, verify, cert=None):
+        # The certificate files are not passed, as the SSL context already has them.
+        host_params, pool_kwargs = super().build_connection_pool_key_attributes(request, verify)
+        pool_kwargs.pop("ca_certs", None)
+        pool_kwargs.pop("ca_cert_dir", None)
+        return host_params, pool_kwargs
+
+    def cert_verify(self, conn, url, verify, cert):
+        """Check the settings, as the SSL context already verifies the server certificate."""
+        if url.lower().startswith("https"):
+            check_ssl_settings(self.ssl_context, verify, cert)
+
+
+class ConnectionStats:
+    """Track how many streams (requests) are sent over each connection.
+
+    This uses the "trace" extension of httpcore, which reports the connection events.
+    """
+
+    def __init__(self):
+        self.counters = Counters()
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self._max_in_flight = 0
+
+    def trace(self, event_name: str, info: dict) -> None:
+        """Callback for the httpcore trace extension."""
+        if event_name == "connection.connect_tcp.complete":
+            self.counters.incr("connections")
+        elif event_name == "http2.send_request_headers.started":
+            self.counters.incr("http2_streams")
+        elif event_name == "http11.send_request_headers.started":
+            self.counters.incr("http11_requests")
+
+    async def atrace(self, event_name: str, info: dict) -> None:
+        """Callback for the httpcore trace extension, for async clients."""
+        self.trace(event_name, info)
+
+    @contextlib.contextmanager
+    def track(self) -> Iterator[None]:
+        """Track the number of concurrent requests."""
+        with self._lock:
+            self._in_flight += 1
+            self._max_in_flight = max(self._max_in_flight, self._in_flight)
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._in_flight -= 1
+
+    def as_dict(self) -> dict:
+        """Return a snapshot of the statistics."""
+        stats = self.counters.as_dict()
+        connections = stats.get("connections", 0)
+        streams = stats.get("http2_streams", 0) + stats.get("http11_requests", 0)
+        with self._lock:
+            stats["in_flight"] = self._in_flight
+            stats["max_in_flight"] = self._max_in_flight
+        stats["streams_per_connection"] = round(streams / connections, 1) if connections else 0
+        return stats
+
+
+class _StreamingBody:
+    """Provide the unread body of an httpx response as the 'raw' object of the requests library."""
+
+    def __init__(self, request: requests.PreparedRequest, hx_response: httpx.Response):
+        self._request = request
+        self._response = hx_response
+
+    def stream(self, chunk_size: int, decode_content: bool = True) -> Iterator[bytes]:
+        """Read the body, translating the httpx errors like requests does for urllib3."""
+        try:
+            yield from self._response.iter_bytes(chunk_size)
+        except httpx.TimeoutException as e:
+            raise requests.ConnectionError(e, request=self._request) from e
+        except httpx.TransportError as e:
+            raise requests.exceptions.ChunkedEncodingError(e, request=self._request) from e
+
+    def close(self):
+        self._response.close()
+
+    release_conn = close
+
+
+class HTTP2Adapter(BaseAdapter):
+    """Transport adapter that sends the requests over HTTP/2.
+
+    The adapter is mounted on the requests session, so all session logic
+    (e.g. the token insertion of requests-oauthlib) still applies.
+    When the server doesn't support HTTP/2, the connection falls back to HTTP/1.1.
+    """
+
+    def __init__(
+        self,
+        *,
+        cert_file=None,
+        key_file=None,
+        max_connections: int = 10,
+        ssl_context: ssl.SSLContext | None = None,
+        transport: httpx.BaseTransport | None = None,
+    ):
+        """Initialize the adapter.
+
+        :param cert_file: Optional certificate file for mTLS.
+        :param key_file: Optional private key file for mTLS.
+        :param ssl_context: Optional shared SSL context, instead of the certificate files.
+        :param max_connections: Maximum number of connections, each can multiplex many requests.
+        :param transport: Optional custom transport (e.g. for testing).
+        """
+        super().__init__()
+        self.stats = ConnectionStats()
+        self.ssl_context = ssl_context or get_ssl_context(cert_file, key_file)
+        self._client = httpx.Client(
+            http2=True,
+            verify=self.ssl_context,
+            limits=httpx.Limits(
+                max_connections=max_connections, max_keepalive_connections=max_connections
+            ),
+            transport=transport,
+        )
+
+    def send(
+        self,
+        request: requests.PreparedRequest,
+        stream=False,
+        timeout=None,
+        verify=True,
+        cert=None,
+        proxies=None,
+    ) -> requests.Response:
+        """Send the prepared request of the requests library using httpx."""
+        if request.url.lower().startswith("https"):
+            check_ssl_settings(self.ssl_context, verify, cert)
+        if isinstance(timeout, tuple):
+            connect, read = timeout
+            timeout = httpx.Timeout(read, connect=connect)
+
+        # HTTP/1.1 headers such as "Connection: keep-alive" are stripped by the h2 library.
+        body = request.body.encode() if isinstance(request.body, str) else request.body
+        hx_request = self._client.build_request(
+            request.method,
+            request.url,
+            content=body,
+            headers=dict(request.headers),
+            timeout=timeout if timeout is not None else httpx.USE_CLIENT_DEFAULT,
+            extensions={"trace": self.stats.trace},
+        )
+
+        try:
+            with self.stats.track():
+                hx_response = self._client.send(hx_request, stream=stream)
+        except httpx.ConnectTimeout as e:
+            raise requests.ConnectTimeout(e, request=request) from e
+        except httpx.TimeoutException as e:
+            raise requests.ReadTimeout(e, request=request) from e
+        except httpx.TransportError as e:
+            raise requests.ConnectionError(e, request=request) from e
+
+        return self.build_response(request, hx_response)
+
+    def build_response(
+        self, request: requests.PreparedRequest, hx_response: httpx.Response
+    ) -> requests.Response:
+        """Translate the httpx response into the response object of the requests library."""
+        response = requests.Response()
+        response.status_code = hx_response.status_code
+        response.reason = hx_response.reason_phrase
+        response.headers = CaseInsensitiveDict(hx_response.headers.items())
+        response.encoding = get_encoding_from_headers(response.headers)
+        response.url = request.url
+        response.request = request
+        response.connection = self
+        if hx_response.is_stream_consumed:
+            response._content = hx_response.content
+            response._content_consumed = True
+        else:
+            # With stream=True, the body is read by iter_content().
+            response.raw = _StreamingBody(request, hx_response)
+        return response
+
+    def close(self):
+        """Close all connections."""
+        self._client.close()
@@ -1,28 +1,61 @@
+from django.conf import settings
 from django.urls import path
 from django.views.generic import RedirectView
 
 from . import views
 
+if settings.BRP_ASYNC_VIEWS:
+    # When running under ASGI, the async views can wait for many Haal Centraal calls at once.
+    personen_view = views.BrpPersonenAsyncView
+    bewoningen_view = views.BrpBewoningenAsyncView
+    verblijfplaatshistorie_view = views.BrpVerblijfplaatshistorieAsyncView
+    personen_batch_view = views.BrpPersonenAsyncBatchView
+    bewoningen_batch_view = views.BrpBewoningenAsyncBatchView
+    verblijfplaatshistorie_batch_view = views.BrpVerblijfplaatshistorieAsyncBatchView
+    personen_health_view = views.BrpPersonenAsyncHealthView
+    bewoningen_health_view = views.BrpBewoningenAsyncHealthView
+    verblijfplaatshistorie_health_view = views.BrpVerblijfplaatshistorieAsyncHealthView
+else:
+    personen_view = views.BrpPersonenView
+    bewoningen_view = views.BrpBewoningenView
+    verblijfplaatshistorie_view = views.BrpVerblijfplaatshistorieView
+    personen_batch_view = views.BrpPersonenBatchView
+    bewoningen_batch_view = views.BrpBewoningenBatchView
+    verblijfplaatshistorie_batch_view = views.BrpVerblijfplaatshistorieBatchView
+    personen_health_view = views.BrpPersonenHealthView
+    bewoningen_health_view = views.BrpBewoningenHealthView
+    verblijfplaatshistorie_health_view = views.BrpVerblijfplaatshistorieHealthView
+
 urlpatterns = [
     path("", RedirectView.as_view(pattern_name="brp-index")),
     path("v1/", views.IndexView.as_view(), name="brp-index"),
     # API's
-    path("v1/personen", views.BrpPersonenView.as_view(), name="brp-personen"),
-    path("v1/bewoningen", views.BrpBewoningenView.as_view(), name="brp-bewoningen"),
+    path("v1/personen", personen_view.as_view(), name="brp-personen"),
+    path("v1/bewoningen", bewoningen_view.as_view(), name="brp-bewoningen"),
     path(
         "v1/verblijfplaatshistorie",
-        views.BrpVerblijfplaatshistorieView.as_view(),
+        verblijfplaatshistorie_view.as_view(),
         name="brp-verblijfplaatshistorie",
     ),
+    # Batches of queries
+    path("v1/personen/batch", personen_batch_view.as_view(), name="brp-personen-batch"),
+    path("v1/bewoningen/batch", bewoningen_batch_view.as_view(), name="brp-bewoningen-batch"),
+    path(
+        "v1/verblijfplaatshistorie/batch",
+        verblijfplaatshistorie_batch_view.as_view(),
+        name="brp-verblijfplaatshistorie-batch",
+    ),
 ]
 
 health_urls = [
+    # Readiness of this worker (see BRP_WARMUP)
+    path("ready", views.ReadinessView.as_view(), name="brp-ready"),
     # Healthchecks
-    path("personen", views.BrpPersonenHealthView.as_view(), name="brp-personen-health"),
-    path("bewoningen", views.BrpBewoningenHealthView.as_view(), name="brp-bewoningen-health"),
+    path("personen", personen_health_view.as_view(), name="brp-personen-health"),
+    path("bewoningen", bewoningen_health_view.as_view(), name="brp-bewoningen-health"),
     path(
         "verblijfplaatshistorie",
-        views.BrpVerblijfplaatshistorieHealthView.as_view(),
+        verblijfplaatshistorie_health_view.as_view(),
         name="brp-verblijfplaatshistorie-health",
     ),
 ]
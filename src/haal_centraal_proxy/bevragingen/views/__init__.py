@@ -1,20 +1,53 @@
 """Access to all BRP views"""
 
 # Split in a package for easier maintenance
-from .bewoningen import BrpBewoningenHealthView, BrpBewoningenView
-from .index import IndexView
-from .personen import BrpPersonenHealthView, BrpPersonenView
+from .bewoningen import (
+    BrpBewoningenAsyncBatchView,
+    BrpBewoningenAsyncHealthView,
+    BrpBewoningenAsyncView,
+    BrpBewoningenBatchView,
+    BrpBewoningenHealthView,
+    BrpBewoningenView,
+)
+from .index import IndexView, ReadinessView
+from .personen import (
+    BrpPersonenAsyncBatchView,
+    BrpPersonenAsyncHealthView,
+    BrpPersonenAsyncView,
+    BrpPersonenBatchView,
+    BrpPersonenHealthView,
+    BrpPersonenView,
+)
 from .verblijfplaatshistorie import (
+    BrpVerblijfplaatshistorieAsyncBatchView,
+    BrpVerblijfplaatshistorieAsyncHealthView,
+    BrpVerblijfplaatshistorieAsyncView,
+    BrpVerblijfplaatshistorieBatchView,
     BrpVerblijfplaatshistorieHealthView,
     BrpVerblijfplaatshistorieView,
 )
 
 __all__ = (
     "IndexView",
+    "ReadinessView",
     "BrpPersonenView",
     "BrpBewoningenView",
     "BrpBewoningenHealthView",
     "BrpPersonenHealthView",
     "BrpVerblijfplaatshistorieView",
     "BrpVerblijfplaatshistorieHealthView",
+    # Batch variants
+    "BrpPersonenBatchView",
+    "BrpBewoningenBatchView",
+    "BrpVerblijfplaatshistorieBatchView",
+    # Async variants
+    "BrpPersonenAsyncView",
+    "BrpBewoningenAsyncView",
+    "BrpBewoningenAsyncHealthView",
+    "BrpPersonenAsyncHealthView",
+    "BrpVerblijfplaatshistorieAsyncView",
+    "BrpVerblijfplaatshistorieAsyncHealthView",
+    "BrpPersonenAsyncBatchView",
+    "BrpBewoningenAsyncBatchView",
+    "BrpVerblijfplaatshistorieAsyncBatchView",
 )
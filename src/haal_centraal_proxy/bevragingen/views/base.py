@@ -1,28 +1,43 @@
+import asyncio
 import logging
 import time
-from collections.abc import Callable, Iterable
-from copy import deepcopy
+from collections.abc import AsyncIterable, AsyncIterator, Callable, Iterable, Iterator
+from concurrent.futures import ThreadPoolExecutor
+from copy import copy
+from dataclasses import dataclass
+from functools import partial
 
+import httpx
 import orjson
 import requests
 from django.conf import settings
 from django.core.exceptions import ImproperlyConfigured
-from django.http import HttpResponse
+from django.http import HttpResponse, StreamingHttpResponse
 from django.urls import reverse
 from django.utils.decorators import method_decorator
 from django.utils.timezone import now
 from django.views.decorators.cache import never_cache
 from rest_framework import status
 from rest_framework.exceptions import APIException, PermissionDenied
+from rest_framework.renderers import JSONRenderer
 from rest_framework.request import Request
 from rest_framework.response import Response
 from rest_framework.throttling import AnonRateThrottle, ScopedRateThrottle
 from rest_framework.views import APIView
 
 from haal_centraal_proxy.bevragingen import authentication, encryption, permissions, types
-from haal_centraal_proxy.bevragingen.client import BrpClient
+from haal_centraal_proxy.bevragingen.async_client import AsyncBrpClient, get_async_client
+from haal_centraal_proxy.bevragingen.bulkhead import get_bulkhead
+from haal_centraal_proxy.bevragingen.cache import get_response_cache
+from haal_centraal_proxy.bevragingen.circuitbreaker import get_circuit_breaker
+from haal_centraal_proxy.bevragingen.client import BrpClient, get_client
 from haal_centraal_proxy.bevragingen.exceptions import ProblemJsonException, RemoteAPIException
+from haal_centraal_proxy.bevragingen.fields import FieldTree
+from haal_centraal_proxy.bevragingen.hedging import HedgingPolicy
 from haal_centraal_proxy.bevragingen.permissions import ParameterPolicy
+from haal_centraal_proxy.bevragingen.renderers import NDJSONRenderer
+from haal_centraal_proxy.bevragingen.retries import RetryPolicy, get_retry_budget
+from haal_centraal_proxy.bevragingen.streaming import CHUNK_SIZE, ItemScanner
 
 logger = logging.getLogger(__name__)
 audit_log = logging.getLogger("haal_centraal_proxy.audit")
@@ -32,6 +47,22 @@ DictOfDicts = dict[str, dict[str, dict]]
 SCOPE_ENCRYPT_BSN = "benk-brp-encrypt-bsn"
 
 
+@dataclass(slots=True)
+class ParsedResponse:
+    """A response of Haal Centraal that's already parsed, e.g. when it's combined from
+    multiple calls. The views handle this the same way as the :class:`requests.Response`.
+    """
+
+    #: The parsed JSON data.
+    data: types.BaseResponse
+    #: The headers, only ``content-type`` is used.
+    headers: dict[str, str]
+    #: The number of retries that were needed.
+    retries: int = 0
+    #: Whether the data came from the cache.
+    from_cache: bool = False
+
+
 class ClientMixin(APIView):
 
     #: Define which additional scopes are needed
@@ -40,18 +71,89 @@ class ClientMixin(APIView):
     #: Define the URL for the endpoint
     endpoint_url: str
 
+    #: How many connections the endpoint may keep open (per worker process).
+    pool_maxsize: int = 10
+
     def get_client(self) -> BrpClient:
-        """Provide the API client class. This can be overwritten per view if needed."""
-        return self.client_class(
-            endpoint_url=self.endpoint_url,
-            oauth_endpoint_url=settings.BRP_OAUTH_TOKEN_URL,
-            oauth_client_id=settings.BRP_OAUTH_CLIENT_ID,
-            oauth_client_secret=settings.BRP_OAUTH_CLIENT_SECRET,
-            oauth_scope=settings.BRP_OAUTH_SCOPE,
-            cert_file=settings.BRP_MTLS_CERT_FILE,
-            key_file=settings.BRP_MTLS_KEY_FILE,
+        """Provide the API client class. This can be overwritten per view if needed.
+
+        The client is shared between all requests of the worker process,
+        so connections to the endpoint are reused.
+        """
+        return get_client(
+            self.endpoint_url,
+            client_class=self.client_class,
+            kwargs_factory=self.get_client_kwargs,
         )
 
+    def get_client_kwargs(self) -> dict:
+        """Provide the settings of the client."""
+        return {
+            "oauth_endpoint_url": settings.BRP_OAUTH_TOKEN_URL,
+            "oauth_client_id": settings.BRP_OAUTH_CLIENT_ID,
+            "oauth_client_secret": settings.BRP_OAUTH_CLIENT_SECRET,
+            "oauth_scope": settings.BRP_OAUTH_SCOPE,
+            "cert_file": settings.BRP_MTLS_CERT_FILE,
+            "key_file": settings.BRP_MTLS_KEY_FILE,
+            "ca_dir": settings.BRP_CA_DIR,
+            "pool_maxsize": self.pool_maxsize,
+            "token_file": settings.BRP_OAUTH_TOKEN_FILE,
+            "token_background_refresh": settings.BRP_OAUTH_TOKEN_BACKGROUND_REFRESH,
+            "http2": settings.BRP_HTTP2,
+            "retry_policy": RetryPolicy(
+                settings.BRP_RETRY_ATTEMPTS,
+                backoff=settings.BRP_RETRY_BACKOFF,
+                max_backoff=settings.BRP_RETRY_MAX_BACKOFF,
+                deadline=settings.BRP_RETRY_DEADLINE,
+                budget=get_retry_budget(
+                    settings.BRP_RETRY_BUDGET_RATIO, settings.BRP_RETRY_BUDGET_MIN_RETRIES
+                ),
+            ),
+            "bulkhead": (
+                get_bulkhead(
+                    self.endpoint_url,
+                    max_concurrent=self.pool_maxsize,
+                    max_queue=settings.BRP_BULKHEAD_MAX_QUEUE,
+                    max_wait=settings.BRP_BULKHEAD_MAX_WAIT,
+                )
+                if settings.BRP_BULKHEAD
+                else None
+            ),
+            "circuit_breaker": (
+                get_circuit_breaker(
+                    self.endpoint_url,
+                    failure_rate_threshold=settings.BRP_CIRCUIT_BREAKER_FAILURE_RATE,
+                    slow_call_rate_threshold=settings.BRP_CIRCUIT_BREAKER_SLOW_CALL_RATE,
+                    slow_call_duration=settings.BRP_CIRCUIT_BREAKER_SLOW_CALL_DURATION,
+                    open_duration=settings.BRP_CIRCUIT_BREAKER_OPEN_DURATION,
+                    trial_calls=settings.BRP_CIRCUIT_BREAKER_TRIAL_CALLS,
+                    window_size=settings.BRP_CIRCUIT_BREAKER_WINDOW_SIZE,
+                    minimum_calls=settings.BRP_CIRCUIT_BREAKER_MINIMUM_CALLS,
+                )
+                if settings.BRP_CIRCUIT_BREAKER
+                else None
+            ),
+            "hedging_policy": (
+                HedgingPolicy(
+                    percentile=settings.BRP_HEDGING_PERCENTILE,
+                    budget_ratio=settings.BRP_HEDGING_BUDGET_RATIO,
+                    min_delay=settings.BRP_HEDGING_MIN_DELAY,
+                    window_size=settings.BRP_HEDGING_WINDOW_SIZE,
+                    min_samples=settings.BRP_HEDGING_MIN_SAMPLES,
+                )
+                if settings.BRP_HEDGING
+                else None
+            ),
+            "coalesce": settings.BRP_COALESCE_REQUESTS,
+            "response_cache": (
+                get_response_cache(
+                    self.endpoint_url, max_bytes=settings.BRP_RESPONSE_CACHE_MAX_BYTES
+                )
+                if settings.BRP_RESPONSE_CACHE_MAX_BYTES
+                else None
+            ),
+        }
+
 
 class BaseHealthCheckView(ClientMixin, APIView):
     """View that performs a dummy call to the BRP API for healthchecks."""
@@ -62,16 +164,86 @@ class BaseHealthCheckView(ClientMixin, APIView):
     dummy_request = {"type": "healthcheck"}
 
     def get(self, request, *args, **kwargs):
+        client = self.get_client()
         try:
-            client = self.get_client()
             hc_response = client.call(self.dummy_request)
         except RemoteAPIException as e:
             success = e.detail == "De foutieve parameter(s) zijn: type."
-            return Response({"success": success, "response": e.remote_json})
+            data = {"success": success, "response": e.remote_json}
         except (APIException, OSError) as e:
-            return Response({"success": False, "exception": str(e)})
+            data = {"success": False, "exception": str(e)}
+        else:
+            data = {"success": True, "response": hc_response}
+
+        # Expose the client statistics, so the connection behavior can be monitored.
+        data["stats"] = self.get_stats(client)
+        return Response(data)
+
+    def get_stats(self, client: BrpClient) -> dict:
+        """Provide the statistics to monitor."""
+        return client.get_stats()
 
-        return Response({"success": True, "response": hc_response})
+
+class AsyncClientMixin(ClientMixin):
+    """Let views run as coroutines, using the asyncio based client.
+
+    REST Framework only supports synchronous views, hence this replaces the :meth:`dispatch`
+    method with an async version. The authentication, permission and throttling checks
+    run in a thread, as these can perform I/O: the JWT validation may retrieve the signing
+    keys (JWKS), and the throttling reads and writes the cache. The rest of :meth:`initial`
+    runs on the event loop, as the async client is bound to it.
+    """
+
+    client_class = AsyncBrpClient
+
+    def get_client(self) -> AsyncBrpClient:
+        """Provide the API client. It's shared between all requests of the event loop."""
+        return get_async_client(
+            self.endpoint_url,
+            client_class=self.client_class,
+            kwargs_factory=self.get_client_kwargs,
+        )
+
+    async def dispatch(self, request, *args, **kwargs):
+        """Async version of :meth:`APIView.dispatch`."""
+        self.args = args
+        self.kwargs = kwargs
+        request = self.initialize_request(request, *args, **kwargs)
+        self.request = request
+        self.headers = self.default_response_headers
+
+        try:
+            await asyncio.to_thread(self.check_request, request)
+            self.initial(request, *args, **kwargs)
+
+            if request.method.lower() in self.http_method_names:
+                handler = getattr(self, request.method.lower(), self.http_method_not_allowed)
+            else:
+                handler = self.http_method_not_allowed
+
+            response = handler(request, *args, **kwargs)
+            if asyncio.iscoroutine(response):
+                response = await response
+        except Exception as exc:  # noqa: BLE001
+            response = self.handle_exception(exc)
+
+        self.response = self.finalize_response(request, response, *args, **kwargs)
+        return self.response
+
+    def check_request(self, request: Request) -> None:
+        """Perform the checks that :meth:`APIView.initial` would do, before it's called."""
+        super().perform_authentication(request)
+        super().check_permissions(request)
+        super().check_throttles(request)
+
+    def perform_authentication(self, request: Request) -> None:
+        """Skipped in :meth:`initial`, as this already happened in :meth:`check_request`."""
+
+    def check_permissions(self, request: Request) -> None:
+        """Skipped in :meth:`initial`, as this already happened in :meth:`check_request`."""
+
+    def check_throttles(self, request: Request) -> None:
+        """Skipped in :meth:`initial`, as this already happened in :meth:`check_request`."""
 
 
 class BaseProxyView(ClientMixin, APIView):
@@ -82,6 +254,7 @@ class BaseProxyView(ClientMixin, APIView):
     """
 
     authentication_classes = [authentication.JWTAuthentication]
+    renderer_classes = [JSONRenderer, NDJSONRenderer]
 
     # Need to define for every subclass:
 
@@ -93,13 +266,25 @@ class BaseProxyView(ClientMixin, APIView):
     needed_scopes: set = None
     #: The ruleset which parameters are allowed, or require additional roles.
     parameter_ruleset: dict[str, ParameterPolicy] = None
+    #: The read timeout per query type, e.g. searches may take longer than a lookup.
+    read_timeouts: dict[str, float] = {}
+    #: Query types for which a second call is made when the first one is slow (if enabled).
+    hedged_query_types: set[str] = set()
+    #: How many seconds the responses can be cached per query type (0 = not cached).
+    cache_ttls: dict[str, float] = {}
+    #: The list in the response that is streamed as one item per line (with ?_format=ndjson).
+    items_field: str = None
+
+    def initialize_request(self, request, *args, **kwargs) -> Request:
+        """Start measuring the processing time, which includes the authorization checks."""
+        self.start_time = time.perf_counter_ns()
+        self.start_date = now()
+        return super().initialize_request(request, *args, **kwargs)
 
     def initial(self, request: Request, *args, **kwargs):
         """DRF-level initialization for all request types."""
         self._base_url = reverse(request.resolver_match.view_name)
         self.client = self.get_client()
-        self.start_time = time.perf_counter_ns()
-        self.start_date = now()
 
         # Perform authorization, permission checks and throttles.
         super().initial(request, *args, **kwargs)
@@ -113,7 +298,9 @@ class BaseProxyView(ClientMixin, APIView):
             # request.data is only available in initial(), not in setup()
             self.default_log_fields = {
                 "service": self.service_log_id,
-                "query_type": request.data.get("type", None),
+                "query_type": (
+                    request.data.get("type", None) if isinstance(request.data, dict) else None
+                ),
                 "user": self.user_id,
                 "X-User": self.request.headers["X-User"],
                 "X-Correlation-ID": self.request.headers["X-Correlation-ID"],
@@ -127,6 +314,29 @@ class BaseProxyView(ClientMixin, APIView):
                 f"A required header is missing: {e.args[0]}", code="missingHeaders"
             ) from None
 
+        self.request_timeout = self.get_request_timeout(request)
+
+    def get_request_timeout(self, request: Request) -> float | None:
+        """Tell how many seconds the client waits for the response (X-Request-Timeout header).
+        There is no point in waiting for Haal Centraal after the client has given up.
+        """
+        value = request.headers.get("X-Request-Timeout")
+        if not value:
+            return None
+
+        try:
+            timeout = float(value)
+        except ValueError:
+            timeout = 0
+        if not 0 < timeout < float("inf"):
+            raise ProblemJsonException(
+                title="Een of meerdere parameters zijn niet correct.",
+                detail=f"De X-Request-Timeout header is ongeldig: {value}.",
+                code="paramsValidation",
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        return timeout
+
     def get_permissions(self):
         """Collect the DRF permission checks.
         DRF checks these in the initial() method, and will block view access
@@ -150,6 +360,47 @@ class BaseProxyView(ClientMixin, APIView):
         Basic checks (such as content-type validation) are already done by REST Framework.
         The API uses POST so the logs won't include personally identifiable information (PII).
         """
+        hc_request, needed_scopes = self.prepare_request(request)
+
+        # Proxy to Haal Centraal
+        try:
+            downstream_response = self.call_remote(hc_request, stream=self.is_ndjson_requested())
+        except (APIException, OSError) as e:
+            # Even when the request failed, still log that we did grant access.
+            self.log_call_failed(request, hc_request, needed_scopes, e)
+            raise
+
+        return self.get_response(request, hc_request, downstream_response, needed_scopes)
+
+    def call_remote(self, hc_request: types.BaseQuery, stream: bool = False) -> requests.Response:
+        """Perform the call to Haal Centraal.
+        This can be overwritten to split the request into multiple calls.
+
+        :param stream: Whether the response body is read while it's received.
+        """
+        return self.client.call(hc_request, stream=stream, **self.get_call_kwargs(hc_request))
+
+    def get_call_kwargs(self, hc_request: types.BaseQuery) -> dict:
+        """Provide the timeouts, hedging and caching options for the call to Haal Centraal."""
+        kwargs = {
+            "timeout": (
+                settings.BRP_CONNECT_TIMEOUT,
+                self.read_timeouts.get(hc_request["type"], settings.BRP_READ_TIMEOUT),
+            ),
+            "hedge": hc_request["type"] in self.hedged_query_types,
+            "cache_ttl": self.cache_ttls.get(hc_request["type"], 0),
+        }
+        if self.request_timeout is not None:
+            # What's left of the client's deadline, after the checks of this view.
+            elapsed = (time.perf_counter_ns() - self.start_time) * 1e-9
+            kwargs["deadline"] = self.request_timeout - elapsed
+        return kwargs
+
+    def prepare_request(self, request: Request) -> tuple[types.BaseQuery, set[str]]:
+        """Validate the incoming request, and translate it into the request for Haal Centraal.
+
+        :returns: The request for Haal Centraal, and the scopes that were needed to grant access.
+        """
         hc_request = request.data.copy()
 
         # Decrypt certain values if needed by the user scope
@@ -219,52 +470,193 @@ class BaseProxyView(ClientMixin, APIView):
         # Allow inserting missing parameters, etc...
         self.transform_request(hc_request)
 
-        # Proxy to Haal Centraal
+        return hc_request, self.needed_scopes | needed_param_scopes
+
+    def log_call_failed(
+        self,
+        request: Request,
+        hc_request: types.BaseQuery,
+        needed_scopes: set[str],
+        exception: OSError | APIException,
+    ) -> None:
+        """Log that access was granted, even though the call to Haal Centraal failed."""
         try:
-            downstream_response = self.client.call(hc_request)
-        except (APIException, OSError) as e:
-            # Even when the request failed, still log that we did grant access.
-            hc_response = (
-                e.__cause__.response.json()
-                if isinstance(e.__cause__, requests.RequestException)
-                else None
-            )
+            response = getattr(exception.__cause__, "response", None)
+            hc_response = response.json() if response is not None else None
+        except ValueError:
+            hc_response = None  # not a JSON response, e.g. HTML error page.
 
-            self.log_access_granted(
-                request,
-                hc_request,
-                hc_response,
-                final_response=None,
-                needed_scopes=self.needed_scopes | needed_param_scopes,
-                exception=e,
-            )
-            raise
+        self.log_access_granted(
+            request,
+            hc_request,
+            hc_response,
+            final_response=None,
+            needed_scopes=needed_scopes,
+            exception=exception,
+            retries=getattr(exception, "retries", 0),
+        )
+
+    def get_response(
+        self,
+        request: Request,
+        hc_request: types.BaseQuery,
+        downstream_response: requests.Response | ParsedResponse,
+        needed_scopes: set[str],
+    ) -> HttpResponse:
+        """Transform the response from Haal Centraal into the response for the client."""
+        if self.is_ndjson_requested():
+            if isinstance(downstream_response, ParsedResponse):
+                # Already received completely, so the items are processed at once.
+                lines = self._get_ndjson_lines(
+                    request,
+                    hc_request,
+                    downstream_response.data,
+                    needed_scopes,
+                    downstream_response,
+                )
+            else:
+                # The items are parsed and transformed one by one while they're received.
+                lines = self._iter_ndjson_lines(
+                    request, hc_request, downstream_response, needed_scopes
+                )
+            return self.get_streaming_response(lines)
+
+        final_response = self.get_final_response(
+            request, hc_request, downstream_response, needed_scopes
+        )
+        return HttpResponse(
+            orjson.dumps(final_response),
+            content_type=downstream_response.headers.get(
+                "content-type", "application/json; charset=utf-8"
+            ),
+        )
+
+    def get_final_response(
+        self,
+        request: Request,
+        hc_request: types.BaseQuery,
+        downstream_response: requests.Response | ParsedResponse,
+        needed_scopes: set[str],
+    ) -> types.BaseResponse:
+        """Transform, log and encrypt the data from Haal Centraal for the client."""
+        if isinstance(downstream_response, ParsedResponse):
+            hc_response = downstream_response.data
+        else:
+            hc_response = orjson.loads(downstream_response.content)
+        return self.process_response(
+            request,
+            hc_request,
+            hc_response,
+            needed_scopes,
+            retries=getattr(downstream_response, "retries", 0),
+            cached=getattr(downstream_response, "from_cache", False),
+        )
 
+    def process_response(
+        self,
+        request: Request,
+        hc_request: types.BaseQuery,
+        hc_response: types.BaseResponse,
+        needed_scopes: set[str],
+        retries: int = 0,
+        cached: bool = False,
+    ) -> types.BaseResponse:
+        """Transform, log and encrypt the parsed data from Haal Centraal.
+        The data is transformed in-place. Any data that is removed for the client,
+        but is still relevant for the audit log, is recorded by the transform methods.
+        """
         # Rewrite the response to pagination still works.
-        # (currently in in-place)
-        hc_response = orjson.loads(downstream_response.text)
-        final_response = deepcopy(hc_response)
+        final_response = hc_response
         self.transform_response(hc_request, final_response)
 
         # Post it to audit logging, both when everything went ok, or failed.
         self.log_access_granted(
             request,
             hc_request,
-            hc_response,
-            final_response,
-            needed_scopes=self.needed_scopes | needed_param_scopes,
+            hc_response=None,
+            final_response=final_response,
+            needed_scopes=needed_scopes,
+            retries=retries,
+            cached=cached,
         )
 
         # Encrypt certain values if needed by the user scope
         self.encrypt_response(final_response)
+        return final_response
 
-        # And return it.
-        return HttpResponse(
-            orjson.dumps(final_response),
-            content_type=downstream_response.headers.get(
-                "content-type", "application/json; charset=utf-8"
-            ),
+    def is_ndjson_requested(self) -> bool:
+        """Tell whether the client requested a stream of items (using ?_format=ndjson)."""
+        renderer = getattr(self.request, "accepted_renderer", None)
+        return renderer is not None and renderer.format == NDJSONRenderer.format
+
+    def get_streaming_response(
+        self, lines: Iterable[bytes] | AsyncIterable[bytes]
+    ) -> StreamingHttpResponse:
+        """Provide the response that sends the lines while they are generated."""
+        return StreamingHttpResponse(lines, content_type=NDJSONRenderer.media_type)
+
+    def _iter_ndjson_lines(
+        self,
+        request: Request,
+        hc_request: types.BaseQuery,
+        downstream_response: requests.Response,
+        needed_scopes: set[str],
+    ) -> Iterator[bytes]:
+        """Write each item of the response as a separate line.
+        Each item is processed as soon as it's received, so only one item is kept in memory.
+        """
+        scanner = ItemScanner(self.items_field)
+        has_items = False
+        try:
+            for chunk in downstream_response.iter_content(CHUNK_SIZE):
+                for hc_item in scanner.feed(chunk):
+                    has_items = True
+                    yield from self._get_ndjson_lines(
+                        request,
+                        hc_request,
+                        {self.items_field: [hc_item]},
+                        needed_scopes,
+                        downstream_response,
+                    )
+            hc_response = scanner.close()
+        except BaseException as e:
+            self.client.close_stream(downstream_response, e)
+            if isinstance(e, OSError | ValueError):
+                # The connection broke, or the data was invalid while reading the response.
+                self.log_call_failed(request, hc_request, needed_scopes, e)
+            raise
+        else:
+            self.client.close_stream(downstream_response)
+
+        if not has_items:
+            # Still log an empty result, or write a response that has no list of items.
+            yield from self._get_ndjson_lines(
+                request, hc_request, hc_response, needed_scopes, downstream_response
+            )
+
+    def _get_ndjson_lines(
+        self,
+        request: Request,
+        hc_request: types.BaseQuery,
+        hc_response: types.BaseResponse,
+        needed_scopes: set[str],
+        downstream_response: requests.Response | httpx.Response | ParsedResponse,
+    ) -> list[bytes]:
+        """Process a (partial) response, and provide the lines for its items.
+        Each partial response is written separately to the audit log.
+        """
+        final_response = self.process_response(
+            request,
+            hc_request,
+            hc_response,
+            needed_scopes,
+            retries=getattr(downstream_response, "retries", 0),
+            cached=getattr(downstream_response, "from_cache", False),
         )
+        items = final_response.get(self.items_field) if self.items_field else None
+        if not isinstance(items, list):
+            return [orjson.dumps(final_response) + b"\n"]
+        return [orjson.dumps(item) + b"\n" for item in items]
 
     def log_access_denied(
         self, hc_request: types.BaseQuery, err: permissions.AccessDenied
@@ -301,11 +693,17 @@ class BaseProxyView(ClientMixin, APIView):
         final_response: types.BaseResponse | None,
         needed_scopes: set[str],
         exception: OSError | APIException | None = None,
+        retries: int = 0,
+        cached: bool = False,
     ) -> None:
         """Perform the audit logging for the request/response.
 
         This is a very basic global logging.
         Per service type, it may need more refinement.
+
+        :param hc_response: The response of Haal Centraal, when it couldn't be transformed
+            (e.g. an error). Successful responses are transformed in-place into the
+            ``final_response``, without keeping a copy of the original.
         """
         extra = {
             **self.default_log_fields,
@@ -316,6 +714,8 @@ class BaseProxyView(ClientMixin, APIView):
             "request_started": self.start_date,
             "request_processed": now(),
             "processing_time": (time.perf_counter_ns() - self.start_time) * 1e-9,
+            "retries": retries,
+            "cached": cached,
         }
 
         if exception is None:
@@ -448,47 +848,277 @@ class BaseProxyView(ClientMixin, APIView):
     ) -> None:
         """This method can be overwritten to insert any null values that the user does have
         access to per endpoint. This allows the client to distinguish between having 'no value'
-        instead of 'no access'.
+        instead of 'no access'. The :class:`~haal_centraal_proxy.bevragingen.fields.NullSkeleton`
+        inserts these values.
         """
 
-    def _include_nulls(self, request_fields: DictOfDicts, item: list | dict, parent_path=()):
-        """Include null values based on the collection of requested fields"""
-        if isinstance(item, list):
-            for sub_item in item:
-                self._include_nulls(request_fields, sub_item, parent_path=parent_path)
-        elif isinstance(item, dict):
-            for key, sub_level in request_fields.items():
-                try:
-                    sub_item = item[key]
-                except KeyError:
-                    # Element is missing
-                    if not parent_path and key in self.top_level_array_fields:
-                        # Array fields can't be expanded.
-                        item[key] = []
-                        continue
 
-                    if not sub_level:
-                        # This is a leaf node
-                        # None for object, string, etc..
-                        item[key] = None
-                        continue
+def group_dotted_names(dotted_field_names: Iterable[str] | FieldTree) -> DictOfDicts:
+    """Convert a list of dotted names to tree."""
+    if not isinstance(dotted_field_names, FieldTree):
+        dotted_field_names = FieldTree.build(dotted_field_names)
+    return dotted_field_names.as_dict()
 
-                    # New item is empty object, will be filled with its keys.
-                    sub_item = item.setdefault(key, {})
 
-                if sub_level:
-                    self._include_nulls(
-                        sub_level,
-                        sub_item,
-                        parent_path=parent_path + (key,),
-                    )
+class AsyncHealthCheckViewMixin(AsyncClientMixin):
+    """Async variant of the :class:`BaseHealthCheckView` logic."""
+
+    async def get(self, request, *args, **kwargs):
+        client = self.get_client()
+        try:
+            hc_response = await client.call(self.dummy_request)
+        except RemoteAPIException as e:
+            success = e.detail == "De foutieve parameter(s) zijn: type."
+            data = {"success": success, "response": e.remote_json}
+        except (APIException, OSError) as e:
+            data = {"success": False, "exception": str(e)}
+        else:
+            data = {"success": True, "response": hc_response}
 
+        # Expose the client statistics, so the connection behavior can be monitored.
+        data["stats"] = self.get_stats(client)
+        return Response(data)
 
-def group_dotted_names(dotted_field_names: Iterable[str]) -> DictOfDicts:
-    """Convert a list of dotted names to tree."""
-    result = {}
-    for dotted_name in dotted_field_names:
-        tree_level = result
-        for path_item in dotted_name.split("."):
-            tree_level = tree_level.setdefault(path_item, {})
-    return result
+
+class AsyncProxyViewMixin(AsyncClientMixin):
+    """Async variant of the :class:`BaseProxyView` logic.
+    This allows many calls to Haal Centraal to be in progress within a single process.
+    """
+
+    @method_decorator(never_cache)
+    async def post(self, request: Request, *args, **kwargs):
+        """Handle the incoming POST request, while awaiting the response of Haal Centraal."""
+        hc_request, needed_scopes = self.prepare_request(request)
+
+        # Proxy to Haal Centraal
+        try:
+            downstream_response = await self.call_remote(
+                hc_request, stream=self.is_ndjson_requested()
+            )
+        except (APIException, OSError) as e:
+            # Even when the request failed, still log that we did grant access.
+            self.log_call_failed(request, hc_request, needed_scopes, e)
+            raise
+
+        return self.get_response(request, hc_request, downstream_response, needed_scopes)
+
+    async def call_remote(
+        self, hc_request: types.BaseQuery, stream: bool = False
+    ) -> httpx.Response:
+        """Perform the call to Haal Centraal, while other requests are handled."""
+        return await self.client.call(
+            hc_request, stream=stream, **self.get_call_kwargs(hc_request)
+        )
+
+    async def _iter_ndjson_lines(
+        self,
+        request: Request,
+        hc_request: types.BaseQuery,
+        downstream_response: httpx.Response,
+        needed_scopes: set[str],
+    ) -> AsyncIterator[bytes]:
+        """Write each item of the response as a separate line, while it's received."""
+        chunks = downstream_response.aiter_bytes(CHUNK_SIZE)
+        scanner = ItemScanner(self.items_field)
+        has_items = False
+        try:
+            async for chunk in chunks:
+                for hc_item in scanner.feed(chunk):
+                    has_items = True
+                    for line in self._get_ndjson_lines(
+                        request,
+                        hc_request,
+                        {self.items_field: [hc_item]},
+                        needed_scopes,
+                        downstream_response,
+                    ):
+                        yield line
+            hc_response = scanner.close()
+        except BaseException as e:
+            await self.client.aclose_stream(downstream_response, e)
+            if isinstance(e, OSError | ValueError | httpx.TransportError):
+                # The connection broke, or the data was invalid while reading the response.
+                self.log_call_failed(request, hc_request, needed_scopes, e)
+            raise
+        else:
+            await self.client.aclose_stream(downstream_response)
+
+        if not has_items:
+            for line in self._get_ndjson_lines(
+                request, hc_request, hc_response, needed_scopes, downstream_response
+            ):
+                yield line
+
+    def get_streaming_response(
+        self, lines: Iterable[bytes] | AsyncIterable[bytes]
+    ) -> StreamingHttpResponse:
+        """Provide the response that sends the lines while they are generated.
+        Under ASGI, Django can only stream asynchronous iterators without blocking.
+        """
+        if not isinstance(lines, AsyncIterable):
+            lines = _aiter_lines(lines)
+        return super().get_streaming_response(lines)
+
+
+async def _aiter_lines(lines: Iterable[bytes]) -> AsyncIterator[bytes]:
+    for line in lines:
+        yield line
+
+
+class BatchViewMixin:
+    """Let a proxy view handle many independent queries in a single HTTP request.
+
+    Each query is validated, performed and audit-logged as if it was a separate request.
+    The results are returned in the order of the queries, each with its own status code,
+    and either the response or the ``application/problem+json`` error of that query.
+    """
+
+    def initial(self, request: Request, *args, **kwargs):
+        """DRF-level initialization for all request types."""
+        super().initial(request, *args, **kwargs)
+
+        # Links in the responses should point to the regular endpoint.
+        self._base_url = self._base_url.removesuffix("/batch")
+
+    @method_decorator(never_cache)
+    def post(self, request: Request, *args, **kwargs):
+        """Handle the incoming POST request with a list of queries.
+        With ?_format=ndjson, each result is sent as soon as it's available.
+        """
+        queries = self.get_batch_queries(request)
+        results = self._iter_results(request, queries)
+        if self.is_ndjson_requested():
+            return self.get_streaming_response(orjson.dumps(result) + b"\n" for result in results)
+
+        return self.get_batch_response(list(results))
+
+    def _iter_results(self, request: Request, queries: list[dict]) -> Iterator[dict]:
+        """Perform the queries concurrently, and provide the results in their order."""
+        executor = ThreadPoolExecutor(
+            max_workers=min(len(queries), settings.BRP_BATCH_CONCURRENCY),
+            thread_name_prefix="brp-batch",
+        )
+        try:
+            yield from executor.map(partial(self.handle_query, request), queries)
+        finally:
+            # When the client disconnects, the remaining queries are not performed.
+            executor.shutdown(cancel_futures=True)
+
+    def get_batch_queries(self, request: Request) -> list[dict]:
+        """Validate that the request contains a list of queries."""
+        queries = request.data
+        if (
+            not isinstance(queries, list)
+            or not queries
+            or not all(isinstance(query, dict) for query in queries)
+        ):
+            raise ProblemJsonException(
+                title="Een of meerdere parameters zijn niet correct.",
+                detail="Het verzoek moet een lijst met zoekvragen bevatten.",
+                code="paramsValidation",
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        if len(queries) > settings.BRP_BATCH_MAX_SIZE:
+            raise ProblemJsonException(
+                title="Een of meerdere parameters zijn niet correct.",
+                detail=(
+                    f"Het verzoek mag maximaal {settings.BRP_BATCH_MAX_SIZE} zoekvragen bevatten."
+                ),
+                code="paramsValidation",
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        return queries
+
+    def get_query_view(self, request: Request, query: dict) -> tuple[BaseProxyView, Request]:
+        """Provide the view and request to handle a single query of the batch.
+        The view is copied, as it holds state of the query (e.g. the inserted fields).
+        """
+        view = copy(self)
+        view.default_log_fields = {**self.default_log_fields, "query_type": query.get("type")}
+        query_request = copy(request)
+        query_request._full_data = query  # what request.data returns.
+        return view, query_request
+
+    def handle_query(self, request: Request, query: dict) -> dict:
+        """Perform a single query, like :meth:`BaseProxyView.post` does."""
+        view, query_request = self.get_query_view(request, query)
+        try:
+            hc_request, needed_scopes = view.prepare_request(query_request)
+            try:
+                downstream_response = view.call_remote(hc_request)
+            except (APIException, OSError) as e:
+                view.log_call_failed(query_request, hc_request, needed_scopes, e)
+                raise
+
+            final_response = view.get_final_response(
+                query_request, hc_request, downstream_response, needed_scopes
+            )
+        except APIException as e:
+            return self.get_query_error(e)
+
+        return {"status": status.HTTP_200_OK, "response": final_response}
+
+    def get_query_error(self, exc: APIException) -> dict:
+        """Provide the problem+json error of a single query."""
+        response = self.get_exception_handler()(exc, self.get_exception_handler_context())
+        return {"status": response.status_code, "error": response.data}
+
+    def get_batch_response(self, results: list[dict]) -> HttpResponse:
+        """Combine the results of all queries."""
+        return HttpResponse(
+            orjson.dumps({"results": results}), content_type="application/json; charset=utf-8"
+        )
+
+
+class AsyncBatchViewMixin(BatchViewMixin):
+    """Async variant of the :class:`BatchViewMixin` logic."""
+
+    @method_decorator(never_cache)
+    async def post(self, request: Request, *args, **kwargs):
+        """Handle the incoming POST request with a list of queries.
+        With ?_format=ndjson, each result is sent as soon as it's available.
+        """
+        queries = self.get_batch_queries(request)
+        results = self._aiter_results(request, queries)
+        if self.is_ndjson_requested():
+            return self.get_streaming_response(
+                orjson.dumps(result) + b"\n" async for result in results
+            )
+
+        return self.get_batch_response([result async for result in results])
+
+    async def _aiter_results(self, request: Request, queries: list[dict]) -> AsyncIterator[dict]:
+        """Perform the queries concurrently, and provide the results in their order."""
+        semaphore = asyncio.Semaphore(settings.BRP_BATCH_CONCURRENCY)
+
+        async def _handle_query(query: dict) -> dict:
+            async with semaphore:
+                return await self.handle_query(request, query)
+
+        tasks = [asyncio.ensure_future(_handle_query(query)) for query in queries]
+        try:
+            for task in tasks:
+                yield await task
+        finally:
+            # When the client disconnects, the remaining queries are not performed.
+            for task in tasks:
+                task.cancel()
+
+    async def handle_query(self, request: Request, query: dict) -> dict:
+        """Perform a single query, like :meth:`AsyncProxyViewMixin.post` does."""
+        view, query_request = self.get_query_view(request, query)
+        try:
+            hc_request, needed_scopes = view.prepare_request(query_request)
+            try:
+                downstream_response = await view.call_remote(hc_request)
+            except (APIException, OSError) as e:
+                view.log_call_failed(query_request, hc_request, needed_scopes, e)
+                raise
+
+            final_response = view.get_final_response(
+                query_request, hc_request, downstream_response, needed_scopes
+            )
+        except APIException as e:
+            return self.get_query_error(e)
+
+        return {"status": status.HTTP_200_OK, "response": final_response}
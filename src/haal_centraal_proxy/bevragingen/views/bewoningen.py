@@ -4,9 +4,17 @@ from rest_framework.exceptions import APIException
 from haal_centraal_proxy.bevragingen import fields, types
 from haal_centraal_proxy.bevragingen.permissions import ParameterPolicy
 
-from .base import BaseHealthCheckView, BaseProxyView, audit_log, group_dotted_names
+from .base import (
+    AsyncBatchViewMixin,
+    AsyncHealthCheckViewMixin,
+    AsyncProxyViewMixin,
+    BaseHealthCheckView,
+    BaseProxyView,
+    BatchViewMixin,
+    audit_log,
+)
 
-ALL_FIELD_NAMES = fields.read_config("haal_centraal/bewoningen/fields.csv")
+ALL_FIELD_NAMES = fields.read_field_names("haal_centraal/bewoningen/fields.csv")
 
 
 class BrpBewoningenHealthView(BaseHealthCheckView):
@@ -15,6 +23,7 @@ class BrpBewoningenHealthView(BaseHealthCheckView):
     permission_classes = []
     throttle_scope = "bewoningen:health"
     endpoint_url = settings.BRP_BEWONINGEN_URL
+    pool_maxsize = settings.BRP_BEWONINGEN_POOL_SIZE
 
 
 class BrpBewoningenView(BaseProxyView):
@@ -25,6 +34,10 @@ class BrpBewoningenView(BaseProxyView):
 
     service_log_id = "bewoningen"
     endpoint_url = settings.BRP_BEWONINGEN_URL
+    pool_maxsize = settings.BRP_BEWONINGEN_POOL_SIZE
+    read_timeouts = settings.BRP_BEWONINGEN_READ_TIMEOUTS
+    cache_ttls = settings.BRP_BEWONINGEN_CACHE_TTLS
+    items_field = "bewoningen"
 
     # Require extra scopes
     needed_scopes = {"benk-brp-bewoning-api"}
@@ -48,6 +61,7 @@ class BrpBewoningenView(BaseProxyView):
         # This is based on the output of the get-openapi.py script.
         "bewoningen",
     ]
+    null_skeleton = fields.NullSkeleton.build(ALL_FIELD_NAMES, top_level_array_fields)
 
     def log_access_granted(
         self,
@@ -57,23 +71,32 @@ class BrpBewoningenView(BaseProxyView):
         final_response: types.BewoningenResponse | None,
         needed_scopes: set[str],
         exception: OSError | APIException | None = None,
+        retries: int = 0,
+        cached: bool = False,
     ) -> None:
         """Extend logging to also include each BSN that was returned in the response"""
         super().log_access_granted(
-            request, hc_request, hc_response, final_response, needed_scopes, exception
+            request,
+            hc_request,
+            hc_response,
+            final_response,
+            needed_scopes,
+            exception,
+            retries,
+            cached,
         )
 
         if exception is None:
             # Separate log message for every person that's being accessed.
             personen = []
-            for bewoning in hc_response["bewoningen"]:
+            for bewoning in final_response["bewoningen"]:
                 personen += bewoning.get("bewoners", []) + bewoning.get("mogelijkeBewoners", [])
             for persoon in personen:
                 msg_params = {}
                 extra = {
                     "request": request.data,
                     "hc_request": hc_request,
-                    "hc_response": final_response or hc_response,
+                    "hc_response": final_response,
                 }
                 msg = ["User %(user)s retrieved using '%(service)s.%(query_type)s':"]
                 msg_params["burgerservicenummer"] = persoon.get("burgerservicenummer", "?")
@@ -102,5 +125,20 @@ class BrpBewoningenView(BaseProxyView):
         """Insert any null values that the user does have access to.
         This allows the client to distinguish between having 'no value' instead of 'no access'.
         """
-        request_fields = group_dotted_names(ALL_FIELD_NAMES)
-        self._include_nulls(request_fields, hc_response)
+        self.null_skeleton.fill(hc_response)
+
+
+class BrpBewoningenAsyncHealthView(AsyncHealthCheckViewMixin, BrpBewoningenHealthView):
+    """Async variant of the health check view, for ASGI deployments."""
+
+
+class BrpBewoningenAsyncView(AsyncProxyViewMixin, BrpBewoningenView):
+    """Async variant of the bewoningen view, for ASGI deployments."""
+
+
+class BrpBewoningenBatchView(BatchViewMixin, BrpBewoningenView):
+    """Batch variant of the bewoningen view, to perform many queries at once."""
+
+
+class BrpBewoningenAsyncBatchView(AsyncBatchViewMixin, BrpBewoningenAsyncView):
+    """Async variant of the bewoningen batch view, for ASGI deployments."""
@@ -1,9 +1,12 @@
 from fnmatch import fnmatch
 
 from django.urls import get_resolver
+from rest_framework import status
 from rest_framework.response import Response
 from rest_framework.views import APIView
 
+from haal_centraal_proxy.bevragingen import warmup
+
 
 class IndexView(APIView):
     """Having some response on the /bevragingen/v1/ path fixes the healthcheck."""
@@ -21,6 +24,17 @@ class IndexView(APIView):
         return _extract_patterns(patterns, prefix="/", match="/bevragingen/v1/?*")
 
 
+class ReadinessView(APIView):
+    """Tell the orchestrator whether this worker has finished its warm-up."""
+
+    def get(self, request):
+        data = warmup.get_status()
+        return Response(
+            data,
+            status=status.HTTP_200_OK if data["ready"] else status.HTTP_503_SERVICE_UNAVAILABLE,
+        )
+
+
 def _extract_patterns(patterns, prefix, match):
     urls = []
     for pattern in patterns:
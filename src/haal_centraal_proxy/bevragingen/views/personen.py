@@ -1,14 +1,34 @@
-import logging
+from __future__ import annotations
 
+import asyncio
+import logging
+from collections.abc import Sequence
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from functools import lru_cache, partial
+
+import httpx
+import orjson
+import requests
 from django.conf import settings
 from rest_framework import status
 from rest_framework.exceptions import APIException
+from rest_framework.request import Request
 
 from haal_centraal_proxy.bevragingen import fields, types
 from haal_centraal_proxy.bevragingen.exceptions import ProblemJsonException
 from haal_centraal_proxy.bevragingen.permissions import ParameterPolicy
 
-from .base import BaseHealthCheckView, BaseProxyView, audit_log, group_dotted_names
+from .base import (
+    AsyncBatchViewMixin,
+    AsyncHealthCheckViewMixin,
+    AsyncProxyViewMixin,
+    BaseHealthCheckView,
+    BaseProxyView,
+    BatchViewMixin,
+    ParsedResponse,
+    audit_log,
+)
 
 logger = logging.getLogger(__name__)
 
@@ -32,6 +52,10 @@ SEARCH_ONLY_IN_AMSTERDAM = {
     "ZoekMetNaamEnGemeenteVanInschrijving",
 }
 
+# The maximum number of BSN's that Haal Centraal accepts in a single call.
+# Larger lists are split into multiple calls.
+MAX_BSN_PER_CALL = 20
+
 SCOPE_NATIONWIDE = "benk-brp-landelijk"
 SCOPE_INCLUDE_DECEASED = "benk-brp-inclusief-overledenen"
 SCOPE_ALLOW_CONFIDENTIAL_PERSONS = "benk-brp-inclusief-geheim"
@@ -39,21 +63,72 @@ SCOPE_SEARCH_POSTCODE = "benk-brp-zoekvraag-postcode-huisnummer"
 SCOPE_SEARCH_POSTCODE_NATIONWIDE = "benk-brp-zoekvraag-postcode-huisnummer-landelijk"
 
 # Which fields are allowed per type
-ALL_FIELD_NAMES = fields.read_config("haal_centraal/personen/fields-Persoon.csv")
-FILTERED = fields.read_config("haal_centraal/personen/fields-filtered-Persoon.csv")
-FILTERED_MIN = fields.read_config("haal_centraal/personen/fields-filtered-PersoonBeperkt.csv")
+ALL_FIELD_NAMES = fields.read_field_names("haal_centraal/personen/fields-Persoon.csv")
+FILTERED = fields.read_field_names("haal_centraal/personen/fields-filtered-Persoon.csv")
+FILTERED_MIN = fields.read_field_names("haal_centraal/personen/fields-filtered-PersoonBeperkt.csv")
 
 # Which fields are allowed for each scope
 SCOPES_FOR_FIELDS = fields.read_dataset_fields_files(
     "dataset_fields/personen/*.txt", accepted_field_names=ALL_FIELD_NAMES
 )
 
+# The number of scope combinations and query types to remember the authorization profile for.
+AUTHORIZATION_PROFILE_CACHE_SIZE = 512
+
+
+@dataclass(frozen=True, slots=True)
+class AuthorizationProfile:
+    """The request transformations that only depend on the scopes and the query type.
+    As most requests come from a few applications, these are calculated once and cached.
+    """
+
+    #: The "fields" parameter when the request doesn't have one (empty when nothing is allowed).
+    default_fields: tuple[str, ...]
+    #: The "fields" values the scopes allow, which may include wildcards.
+    allowed_fields: frozenset[str]
+    #: Whether the search is limited to Amsterdam when no municipality is given.
+    add_municipality_filter: bool
+    #: Whether deceased persons are included when the parameter is not given.
+    add_deceased_filter: bool
+
+
+@lru_cache(maxsize=AUTHORIZATION_PROFILE_CACHE_SIZE)
+def _get_authorization_profile(
+    view_class: type[BrpPersonenView], user_scopes: frozenset[str], query_type: str
+) -> AuthorizationProfile:
+    return view_class.build_authorization_profile(user_scopes, query_type)
+
+
+def get_authorization_profile_stats() -> dict:
+    """Provide the statistics of the authorization profile cache."""
+    info = _get_authorization_profile.cache_info()
+    lookups = info.hits + info.misses
+    return {
+        "hits": info.hits,
+        "misses": info.misses,
+        "hit_rate": round(info.hits / lookups, 2) if lookups else 0,
+        "size": info.currsize,
+    }
+
+
+def clear_authorization_profiles() -> None:
+    """Forget all authorization profiles."""
+    _get_authorization_profile.cache_clear()
+
 
 class BrpPersonenHealthView(BaseHealthCheckView):
     """View to check backend access."""
 
     throttle_scope = "personen:health"
     endpoint_url = settings.BRP_PERSONEN_URL
+    pool_maxsize = settings.BRP_PERSONEN_POOL_SIZE
+
+    def get_stats(self, client) -> dict:
+        """Also tell how well the authorization profiles are cached."""
+        return {
+            **super().get_stats(client),
+            "authorization_profiles": get_authorization_profile_stats(),
+        }
 
 
 class BrpPersonenView(BaseProxyView):
@@ -71,6 +146,11 @@ class BrpPersonenView(BaseProxyView):
 
     service_log_id = "personen"
     endpoint_url = settings.BRP_PERSONEN_URL
+    pool_maxsize = settings.BRP_PERSONEN_POOL_SIZE
+    read_timeouts = settings.BRP_PERSONEN_READ_TIMEOUTS
+    cache_ttls = settings.BRP_PERSONEN_CACHE_TTLS
+    hedged_query_types = {"RaadpleegMetBurgerservicenummer"}
+    items_field = "personen"
 
     # Require extra scopes
     needed_scopes = {"benk-brp-personen-api"}
@@ -86,6 +166,9 @@ class BrpPersonenView(BaseProxyView):
     }
 
     always_insert_id_fields = ("aNummer", "burgerservicenummer")
+
+    #: The responses of the calls that succeeded, when another part of a split request failed.
+    partial_responses: Sequence[types.PersonenResponse] = ()
     top_level_array_fields = [
         # Hard-coded list here of all array fields (which shouldn't get null-defaults).
         # This is based on the output of the get-openapi.py script.
@@ -210,87 +293,254 @@ class BrpPersonenView(BaseProxyView):
         final_response: types.PersonenResponse | None,
         needed_scopes: set[str],
         exception: OSError | APIException | None = None,
+        retries: int = 0,
+        cached: bool = False,
     ) -> None:
         """Extend logging to also include each BSN that was returned in the response"""
         super().log_access_granted(
-            request, hc_request, hc_response, final_response, needed_scopes, exception
+            request,
+            hc_request,
+            hc_response,
+            final_response,
+            needed_scopes,
+            exception,
+            retries,
+            cached,
         )
 
         if exception is None:
-            # Separate log message for every person that's being accessed.
-            for persoon in hc_response["personen"]:
-                msg_params = {}
-                extra = {
-                    "request": request.data,
-                    "hc_request": hc_request,
-                    "hc_response": final_response or hc_response,
-                }
-                msg = ["User %(user)s retrieved using '%(service)s.%(query_type)s':"]
-                for id_field in self.always_insert_id_fields:
-                    msg_params[id_field] = persoon.get(id_field, "?")
-                    extra[id_field] = persoon.get(id_field, None)
-                    msg.append(f"{id_field}=%({id_field})s")
-
-                audit_log.info(
-                    # Visible log message
-                    " ".join(msg),
+            self._log_retrieved_persons(
+                request,
+                hc_request,
+                final_response,
+                self._get_retrieved_identifiers(final_response),
+            )
+
+    def log_call_failed(
+        self,
+        request: Request,
+        hc_request: types.PersonenQuery,
+        needed_scopes: set[str],
+        exception: OSError | APIException,
+    ) -> None:
+        """Extend logging to also include each BSN that was retrieved by the other calls,
+        when the call for one part of a split request failed.
+        """
+        super().log_call_failed(request, hc_request, needed_scopes, exception)
+        for hc_response in self.partial_responses:
+            self._log_retrieved_persons(request, hc_request, hc_response, hc_response["personen"])
+
+    def _log_retrieved_persons(
+        self,
+        request: Request,
+        hc_request: types.PersonenQuery,
+        hc_response: types.PersonenResponse,
+        personen: list[dict],
+    ) -> None:
+        """Separate log message for every person that's being accessed."""
+        for persoon in personen:
+            msg_params = {}
+            extra = {
+                "request": request.data,
+                "hc_request": hc_request,
+                "hc_response": hc_response,
+            }
+            msg = ["User %(user)s retrieved using '%(service)s.%(query_type)s':"]
+            for id_field in self.always_insert_id_fields:
+                msg_params[id_field] = persoon.get(id_field, "?")
+                extra[id_field] = persoon.get(id_field, None)
+                msg.append(f"{id_field}=%({id_field})s")
+
+            audit_log.info(
+                # Visible log message
+                " ".join(msg),
+                {
+                    "service": self.service_log_id,
+                    "query_type": hc_request["type"],
+                    "user": self.user_id,
+                    **msg_params,
+                },
+                # Extra JSON fields for log querying
+                extra={
+                    **self.default_log_fields,
+                    **extra,
+                },
+            )
+
+    def _get_retrieved_identifiers(self, final_response: types.PersonenResponse) -> list[dict]:
+        """Provide the identifiers of all persons that were retrieved from Haal Centraal.
+        This includes the persons and identifiers that were removed from the response.
+        """
+        personen = final_response["personen"]
+        if self.removed_identifiers:
+            personen = [
+                {**persoon, **removed}
+                for persoon, removed in zip(personen, self.removed_identifiers, strict=True)
+            ]
+        return personen + self.hidden_persons
+
+    def prepare_request(self, request: Request) -> tuple[types.PersonenQuery, set[str]]:
+        """Validate the incoming request, which includes limiting the number of BSN's.
+        Every 20 BSN's take a separate call to Haal Centraal.
+        """
+        max_bsn = settings.BRP_PERSONEN_MAX_BSN
+        bsns = request.data.get("burgerservicenummer") if isinstance(request.data, dict) else None
+        if isinstance(bsns, list) and len(bsns) > max_bsn:
+            raise ProblemJsonException(
+                title="Een of meerdere parameters zijn niet correct.",
+                detail=(
+                    f"Er kunnen maximaal {max_bsn} burgerservicenummers"
+                    " tegelijk worden opgevraagd."
+                ),
+                code="paramsValidation",
+                status=status.HTTP_400_BAD_REQUEST,
+                invalid_params=[
                     {
-                        "service": self.service_log_id,
-                        "query_type": hc_request["type"],
-                        "user": self.user_id,
-                        **msg_params,
-                    },
-                    # Extra JSON fields for log querying
-                    extra={
-                        **self.default_log_fields,
-                        **extra,
-                    },
+                        "name": "burgerservicenummer",
+                        "code": "maxItems",
+                        "reason": f"Parameter bevat meer dan {max_bsn} items.",
+                    }
+                ],
+            )
+
+        return super().prepare_request(request)
+
+    def call_remote(
+        self, hc_request: types.PersonenQuery, stream: bool = False
+    ) -> requests.Response | ParsedResponse:
+        """Perform the call to Haal Centraal.
+        Large lists of BSN's are split into multiple calls, which are made concurrently.
+        Their responses are combined into a single :class:`ParsedResponse`.
+        """
+        chunks = self._split_request(hc_request)
+        if len(chunks) == 1:
+            return super().call_remote(hc_request, stream=stream)
+
+        # The responses are combined, so these calls are not streamed.
+        call_chunk = partial(self._call_chunk, super().call_remote)
+        with ThreadPoolExecutor(
+            max_workers=min(len(chunks), settings.BRP_PERSONEN_CHUNK_CONCURRENCY),
+            thread_name_prefix="brp-personen-chunks",
+        ) as executor:
+            futures = [executor.submit(call_chunk, chunk) for chunk in chunks]
+        return self._merge_responses([f.exception() or f.result() for f in futures])
+
+    @staticmethod
+    def _call_chunk(
+        call_remote, chunk: types.PersonenQuery
+    ) -> tuple[types.PersonenResponse, requests.Response]:
+        """Perform the call for one part of the split request, and parse its response."""
+        response = call_remote(chunk)
+        return orjson.loads(response.content), response
+
+    def _split_request(self, hc_request: types.PersonenQuery) -> list[types.PersonenQuery]:
+        """Split the request into requests that Haal Centraal accepts."""
+        bsns = hc_request.get("burgerservicenummer")
+        if (
+            hc_request["type"] != "RaadpleegMetBurgerservicenummer"
+            or not isinstance(bsns, list)
+            or len(bsns) <= MAX_BSN_PER_CALL
+        ):
+            return [hc_request]
+
+        return [
+            {**hc_request, "burgerservicenummer": bsns[i : i + MAX_BSN_PER_CALL]}
+            for i in range(0, len(bsns), MAX_BSN_PER_CALL)
+        ]
+
+    def _merge_responses(
+        self,
+        results: list[
+            tuple[types.PersonenResponse, requests.Response | httpx.Response] | BaseException
+        ],
+    ) -> ParsedResponse:
+        """Combine the responses of the split request, as if it was a single call.
+        The persons are kept in the order of the requested BSN's.
+        When a call failed, its error is raised. The persons that the other calls
+        retrieved are still written to the audit log by :meth:`log_call_failed`.
+        """
+        responses = [result for result in results if not isinstance(result, BaseException)]
+        if errors := [result for result in results if isinstance(result, BaseException)]:
+            self.partial_responses = [hc_response for hc_response, _ in responses]
+            raise errors[0]
+
+        hc_response, first_response = responses[0]
+        for other_response, _ in responses[1:]:
+            hc_response["personen"].extend(other_response["personen"])
+
+        return ParsedResponse(
+            hc_response,
+            headers={
+                "content-type": first_response.headers.get(
+                    "content-type", "application/json; charset=utf-8"
                 )
+            },
+            retries=sum(getattr(response, "retries", 0) for _, response in responses),
+            from_cache=all(getattr(response, "from_cache", False) for _, response in responses),
+        )
+
+    @classmethod
+    def build_authorization_profile(
+        cls, user_scopes: frozenset[str], query_type: str
+    ) -> AuthorizationProfile:
+        """Determine the request transformations for a combination of scopes and query type.
+        Use :meth:`get_authorization_profile` to have a cached version.
+        """
+        allowed_by_scope = cls.parameter_ruleset["fields"].get_allowed_values(user_scopes)
+        allowed_by_type = cls.possible_fields_by_type.get(query_type, None)
+
+        # The sorting is done to have consistent logging.
+        allowed_fields = sorted(
+            set(allowed_by_type).intersection(allowed_by_scope)
+            if allowed_by_type is not None
+            else allowed_by_scope
+        )
+
+        return AuthorizationProfile(
+            default_fields=(
+                tuple(fields.compact_fields_values(allowed_fields)) if allowed_fields else ()
+            ),
+            allowed_fields=frozenset(allowed_by_scope),
+            add_municipality_filter=(
+                SCOPE_NATIONWIDE not in user_scopes
+                or query_type in SEARCH_ONLY_IN_AMSTERDAM
+                or (SCOPE_SEARCH_POSTCODE in user_scopes and query_type == SEARCH_ZIPCODE_NUMBER)
+            ),
+            add_deceased_filter=(
+                SCOPE_INCLUDE_DECEASED in user_scopes and query_type in SEARCH_INCLUDE_DECEASED
+            ),
+        )
+
+    def get_authorization_profile(self, query_type: str) -> AuthorizationProfile:
+        """Provide the (cached) request transformations for the scopes of the user."""
+        return _get_authorization_profile(type(self), frozenset(self.user_scopes), query_type)
 
     def transform_request(self, hc_request: types.PersonenQuery) -> None:
         """Extra rules before passing the request to Haal Centraal"""
+        profile = self.get_authorization_profile(hc_request["type"])
         if "fields" not in hc_request:
-            self._add_fields_filter(hc_request)
-
-        if "gemeenteVanInschrijving" not in hc_request and (
-            SCOPE_NATIONWIDE not in self.user_scopes
-            or hc_request["type"] in SEARCH_ONLY_IN_AMSTERDAM
-            or (
-                SCOPE_SEARCH_POSTCODE in self.user_scopes
-                and hc_request["type"] == "ZoekMetPostcodeEnHuisnummer"
-            )
-        ):
+            self._add_fields_filter(hc_request, profile)
+
+        if "gemeenteVanInschrijving" not in hc_request and profile.add_municipality_filter:
             self._add_municipality_filter(hc_request)
 
-        if (
-            SCOPE_INCLUDE_DECEASED in self.user_scopes
-            and hc_request["type"] in SEARCH_INCLUDE_DECEASED
-            and "inclusiefOverledenPersonen" not in hc_request
-        ):
+        if profile.add_deceased_filter and "inclusiefOverledenPersonen" not in hc_request:
             self._add_deceased_filter(hc_request)
 
         # Always need to log aNummer/BSN, so make sure it's requested too.
         self.inserted_id_fields = []
         self._add_identifier_fields(hc_request)
 
-    def _add_fields_filter(self, hc_request: types.PersonenQuery) -> None:
+    def _add_fields_filter(
+        self, hc_request: types.PersonenQuery, profile: AuthorizationProfile
+    ) -> None:
         """Determine all values for the "fields" parameter that the user has access to.
 
         This value is used when no default is given.
 
-        :param query_type: The "zoekvraag/doelbinding" (the "type" parameter in the request).
+        :param profile: The authorization profile for the scopes and query type.
         """
-        allowed_by_scope = self.parameter_ruleset["fields"].get_allowed_values(self.user_scopes)
-        allowed_by_type = self.possible_fields_by_type.get(hc_request["type"], None)
-
-        # The sorting is done to have consistent logging.
-        allowed_fields = sorted(
-            set(allowed_by_type).intersection(allowed_by_scope)
-            if allowed_by_type is not None
-            else allowed_by_scope
-        )
-
-        if not allowed_fields:
+        if not profile.default_fields:
             audit_log.info(
                 "Denied access to '%(service)s' no allowed values for 'fields'",
                 {"service": self.service_log_id},
@@ -307,9 +557,10 @@ class BrpPersonenView(BaseProxyView):
                 status=status.HTTP_403_FORBIDDEN,
             )
 
-        # When no 'fields' parameter is given, pass all allowed options
+        # When no 'fields' parameter is given, pass all allowed options.
+        # This is a new list, as the identifier fields are added to it.
         logging.debug("Auto-generating 'fields' parameter based on user scopes")
-        hc_request["fields"] = fields.compact_fields_values(allowed_fields)
+        hc_request["fields"] = list(profile.default_fields)
 
     def _add_municipality_filter(self, hc_request: types.PersonenQuery) -> None:
         """Restrict the search to a single municipality."""
@@ -361,6 +612,10 @@ class BrpPersonenView(BaseProxyView):
         """Extra rules before passing the response to the client."""
         super().transform_response(hc_request, hc_response)  # rewrite links
 
+        # Data that is removed for the client, but still needs to be audit logged.
+        self.hidden_persons = []
+        self.removed_identifiers = []
+
         # Remove persons that the calling organisation may not see.
         if SCOPE_ALLOW_CONFIDENTIAL_PERSONS not in self.user_scopes:
             self._hide_confidential_persons(hc_response)
@@ -382,17 +637,18 @@ class BrpPersonenView(BaseProxyView):
         https://github.com/BRP-API/Haal-Centraal-BRP-bevragen/issues/1756
         https://github.com/BRP-API/Haal-Centraal-BRP-bevragen/issues/1857
         """
-        personen = [
-            persoon
-            for persoon in hc_response["personen"]
-            if not int(persoon.get("geheimhoudingPersoonsgegevens", 0))  # "1" in demo data
-        ]
-        num_hidden = len(hc_response["personen"]) - len(personen)
-        if num_hidden:
+        personen = []
+        for persoon in hc_response["personen"]:
+            if int(persoon.get("geheimhoudingPersoonsgegevens", 0)):  # "1" in demo data
+                self.hidden_persons.append(persoon)
+            else:
+                personen.append(persoon)
+
+        if self.hidden_persons:
             logging.debug(
                 "Removed %d persons from response"
                 " (missing scope %s for to view 'geheimhoudingPersoonsgegevens')",
-                num_hidden,
+                len(self.hidden_persons),
                 SCOPE_ALLOW_CONFIDENTIAL_PERSONS,
             )
 
@@ -406,14 +662,22 @@ class BrpPersonenView(BaseProxyView):
             "Removing additional identifier fields from response: %s",
             ",".join(self.inserted_id_fields),
         )
-        for persoon in hc_response["personen"]:
-            for id_field in self.inserted_id_fields:
-                persoon.pop(id_field, None)
+        # The removed values are kept for the audit log.
+        self.removed_identifiers = [
+            {
+                id_field: persoon.pop(id_field)
+                for id_field in self.inserted_id_fields
+                if id_field in persoon
+            }
+            for persoon in hc_response["personen"]
+        ]
 
         # Also clean up from request before logging it.
         # Also makes sure the null-inserted fields won't include these.
+        # (when the response is streamed, this happens for the first item).
         for id_field in self.inserted_id_fields:
-            hc_request["fields"].remove(id_field)
+            if id_field in hc_request["fields"]:
+                hc_request["fields"].remove(id_field)
 
     def _insert_null_values(
         self, hc_request: types.PersonenQuery, hc_response: types.PersonenResponse
@@ -421,5 +685,44 @@ class BrpPersonenView(BaseProxyView):
         """Insert any null values that the user does have access to.
         This allows the client to distinguish between having 'no value' instead of 'no access'.
         """
-        request_fields = group_dotted_names(hc_request["fields"])
-        self._include_nulls(request_fields, hc_response["personen"])
+        null_skeleton = fields.get_null_skeleton(
+            tuple(hc_request["fields"]), tuple(self.top_level_array_fields)
+        )
+        null_skeleton.fill(hc_response["personen"])
+
+
+class BrpPersonenAsyncHealthView(AsyncHealthCheckViewMixin, BrpPersonenHealthView):
+    """Async variant of the health check view, for ASGI deployments."""
+
+
+class BrpPersonenAsyncView(AsyncProxyViewMixin, BrpPersonenView):
+    """Async variant of the personen view, for ASGI deployments."""
+
+    async def call_remote(
+        self, hc_request: types.PersonenQuery, stream: bool = False
+    ) -> httpx.Response | ParsedResponse:
+        """Perform the call to Haal Centraal, splitting large lists of BSN's."""
+        chunks = self._split_request(hc_request)
+        if len(chunks) == 1:
+            return await super().call_remote(hc_request, stream=stream)
+
+        call_remote = super().call_remote
+        semaphore = asyncio.Semaphore(settings.BRP_PERSONEN_CHUNK_CONCURRENCY)
+
+        async def _call_chunk(chunk: types.PersonenQuery):
+            async with semaphore:
+                response = await call_remote(chunk)  # combined, so not streamed.
+                return orjson.loads(response.content), response
+
+        results = await asyncio.gather(
+            *(_call_chunk(chunk) for chunk in chunks), return_exceptions=True
+        )
+        return self._merge_responses(results)
+
+
+class BrpPersonenBatchView(BatchViewMixin, BrpPersonenView):
+    """Batch variant of the personen view, to perform many queries at once."""
+
+
+class BrpPersonenAsyncBatchView(AsyncBatchViewMixin, BrpPersonenAsyncView):
+    """Async variant of the personen batch view, for ASGI deployments."""
@@ -3,15 +3,26 @@ from django.conf import settings
 from haal_centraal_proxy.bevragingen import fields, types
 from haal_centraal_proxy.bevragingen.permissions import ParameterPolicy
 
-from .base import BaseHealthCheckView, BaseProxyView, DictOfDicts, group_dotted_names
+from .base import (
+    AsyncBatchViewMixin,
+    AsyncHealthCheckViewMixin,
+    AsyncProxyViewMixin,
+    BaseHealthCheckView,
+    BaseProxyView,
+    BatchViewMixin,
+)
 
-BASE_FIELD_NAMES = fields.read_config("haal_centraal/verblijfplaatshistorie/fields.csv")
-ADRES_FIELD_NAMES = fields.read_config("haal_centraal/verblijfplaatshistorie/fields-Adres.csv")
-LOCATIE_FIELD_NAMES = fields.read_config("haal_centraal/verblijfplaatshistorie/fields-Locatie.csv")
-VERBLIJFPLAATSBUITENLAND_FIELD_NAMES = fields.read_config(
+BASE_FIELD_NAMES = fields.read_field_names("haal_centraal/verblijfplaatshistorie/fields.csv")
+ADRES_FIELD_NAMES = fields.read_field_names(
+    "haal_centraal/verblijfplaatshistorie/fields-Adres.csv"
+)
+LOCATIE_FIELD_NAMES = fields.read_field_names(
+    "haal_centraal/verblijfplaatshistorie/fields-Locatie.csv"
+)
+VERBLIJFPLAATSBUITENLAND_FIELD_NAMES = fields.read_field_names(
     "haal_centraal/verblijfplaatshistorie/fields-VerblijfplaatsBuitenland.csv"
 )
-VERBLIJFPLAATSONBEKEND_FIELD_NAMES = fields.read_config(
+VERBLIJFPLAATSONBEKEND_FIELD_NAMES = fields.read_field_names(
     "haal_centraal/verblijfplaatshistorie/fields-VerblijfplaatsOnbekend.csv"
 )
 
@@ -28,6 +39,7 @@ class BrpVerblijfplaatshistorieHealthView(BaseHealthCheckView):
 
     throttle_scope = "verblijfplaatshistorie:health"
     endpoint_url = settings.BRP_VERBLIJFPLAATSHISTORIE_URL
+    pool_maxsize = settings.BRP_VERBLIJFPLAATSHISTORIE_POOL_SIZE
 
 
 class BrpVerblijfplaatshistorieView(BaseProxyView):
@@ -38,6 +50,10 @@ class BrpVerblijfplaatshistorieView(BaseProxyView):
 
     service_log_id = "verblijfplaatshistorie"
     endpoint_url = settings.BRP_VERBLIJFPLAATSHISTORIE_URL
+    pool_maxsize = settings.BRP_VERBLIJFPLAATSHISTORIE_POOL_SIZE
+    read_timeouts = settings.BRP_VERBLIJFPLAATSHISTORIE_READ_TIMEOUTS
+    cache_ttls = settings.BRP_VERBLIJFPLAATSHISTORIE_CACHE_TTLS
+    items_field = "verblijfplaatsen"
 
     # Require extra scopes
     needed_scopes = {"benk-brp-verblijfplaatshistorie-api"}
@@ -57,6 +73,14 @@ class BrpVerblijfplaatshistorieView(BaseProxyView):
     }
 
     top_level_array_fields = []
+    null_skeleton = fields.NullSkeleton.build(BASE_FIELD_NAMES)
+    item_null_skeleton = fields.NullSkeleton.build(BASE_FIELD_NAMES.get("verblijfplaatsen"))
+
+    # The fields of each residence depend on its type.
+    null_entries_by_type = {
+        type_name: {entry[0]: entry for entry in fields.NullSkeleton.build(field_names).entries}
+        for type_name, field_names in FIELD_NAMES_TYPE_MAPPING.items()
+    }
 
     def _insert_null_values(
         self, hc_request: types.PersonenQuery, hc_response: types.PersonenResponse
@@ -64,40 +88,34 @@ class BrpVerblijfplaatshistorieView(BaseProxyView):
         """Insert any null values that the user does have access to.
         This allows the client to distinguish between having 'no value' instead of 'no access'.
         """
-        request_fields = group_dotted_names(BASE_FIELD_NAMES)
-        self._include_nulls(request_fields, hc_response)
-
-    def _include_nulls(self, request_fields: DictOfDicts, item: list | dict, parent_path=()):
-        """Include null values based on the collection of requested fields"""
-        if isinstance(item, list):
-            for sub_item in item:
-                self._include_nulls(request_fields, sub_item, parent_path=parent_path)
-        elif isinstance(item, dict):
-            if "type" in item:
-                type_fields = group_dotted_names(FIELD_NAMES_TYPE_MAPPING[item["type"]])
-                request_fields.update(type_fields)
-            for key, sub_level in request_fields.items():
-                try:
-                    sub_item = item[key]
-                except KeyError:
-                    # Element is missing
-                    if not parent_path and key in self.top_level_array_fields:
-                        # Array fields can't be expanded.
-                        item[key] = []
-                        continue
-
-                    if not sub_level:
-                        # This is a leaf node
-                        # None for object, string, etc..
-                        item[key] = None
-                        continue
-
-                    # New item is empty object, will be filled with its keys.
-                    sub_item = item.setdefault(key, {})
-
-                if sub_level:
-                    self._include_nulls(
-                        sub_level,
-                        sub_item,
-                        parent_path=parent_path + (key,),
-                    )
+        # The fields of a type are added to the fields of the earlier residences,
+        # so a local copy is updated instead of the shared skeletons.
+        entries = {entry[0]: entry for entry in self.item_null_skeleton.entries}
+        item_skeleton = self.item_null_skeleton
+        for item in hc_response.get("verblijfplaatsen") or ():
+            if isinstance(item, dict) and "type" in item:
+                entries.update(self.null_entries_by_type[item["type"]])
+                item_skeleton = fields.NullSkeleton(entries=tuple(entries.values()))
+            item_skeleton.fill(item)
+
+        self.null_skeleton.fill(hc_response)
+
+
+class BrpVerblijfplaatshistorieAsyncHealthView(
+    AsyncHealthCheckViewMixin, BrpVerblijfplaatshistorieHealthView
+):
+    """Async variant of the health check view, for ASGI deployments."""
+
+
+class BrpVerblijfplaatshistorieAsyncView(AsyncProxyViewMixin, BrpVerblijfplaatshistorieView):
+    """Async variant of the verblijfplaatshistorie view, for ASGI deployments."""
+
+
+class BrpVerblijfplaatshistorieBatchView(BatchViewMixin, BrpVerblijfplaatshistorieView):
+    """Batch variant of the verblijfplaatshistorie view, to perform many queries at once."""
+
+
+class BrpVerblijfplaatshistorieAsyncBatchView(
+    AsyncBatchViewMixin, BrpVerblijfplaatshistorieAsyncView
+):
+    """Async variant of the verblijfplaatshistorie batch view, for ASGI deployments."""
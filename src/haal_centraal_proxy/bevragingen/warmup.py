@@ -0,0 +1,200 @@
+"""Warm-up of a worker process, before it handles requests.
+
+Otherwise, the first requests of each worker would wait for the imports, the OAuth token
+and the TLS handshakes with the BRP gateway. The ``/health/ready`` endpoint tells the
+orchestrator when the warm-up has finished.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import contextlib
+import logging
+import threading
+import time
+from collections.abc import Iterator
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+_status: WarmupStatus | None = None
+_task: asyncio.Task | None = None
+
+
+class WarmupStatus:
+    """The progress of the warm-up."""
+
+    def __init__(self):
+        self.ready = False
+        self.duration: float | None = None
+        self.errors: dict[str, str] = {}
+
+    def as_dict(self) -> dict:
+        return {"ready": self.ready, "duration": self.duration, "errors": self.errors}
+
+
+def schedule_warm_up() -> None:
+    """Run the warm-up in each worker process, before it handles requests.
+    This is called by the WSGI/ASGI application, so management commands don't warm up.
+    """
+    if not settings.BRP_WARMUP:
+        return
+
+    global _task
+    try:
+        import uwsgi
+        from uwsgidecorators import postfork
+    except ImportError:
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            # Not running under uwsgi, only the readiness endpoint waits for it.
+            threading.Thread(target=warm_up, name="brp-warmup", daemon=True).start()
+        else:
+            # Loaded by the ASGI server (e.g. uvicorn) in the event loop that handles the
+            # requests, so the async clients can be warmed up for that loop.
+            _task = loop.create_task(awarm_up())
+    else:
+        if uwsgi.worker_id() == 0:
+            # Loaded in the master process, the connections should be opened by each worker.
+            postfork(warm_up)
+        else:
+            # Loaded in the worker (lazy-apps), which only accepts requests afterwards.
+            warm_up()
+
+
+def warm_up(connections: int | None = None) -> WarmupStatus:
+    """Prepare this process for handling requests.
+    Errors are logged and reported by the readiness endpoint, the process is always
+    marked as ready afterwards.
+
+    Async clients are bound to the event loop that handles the requests. Without it,
+    they're warmed up using a temporary event loop. This still retrieves the OAuth token
+    and loads the certificates, but their connections can't be reused.
+
+    :param connections: The number of connections to open for each endpoint.
+    """
+    with _track_status() as status:
+        connections = _get_connections(connections)
+        sync_views, async_views = _get_view_classes()
+        _warm_up_views(status, sync_views, connections)
+        if async_views:
+            logger.warning(
+                "Warm-up of async views runs outside the event loop that handles the requests,"
+                " only the OAuth token and certificates are prepared, not the connections."
+            )
+            asyncio.run(_awarm_up_views(status, async_views, connections, close=True))
+    return status
+
+
+async def awarm_up(connections: int | None = None) -> WarmupStatus:
+    """Async version of :func:`warm_up`, for the event loop that handles the requests.
+    The connections of the async clients are opened for this loop, so requests reuse them.
+    """
+    with _track_status() as status:
+        connections = _get_connections(connections)
+        # Importing the views reads files, so this happens in a thread.
+        sync_views, async_views = await asyncio.to_thread(_get_view_classes)
+        await asyncio.to_thread(_warm_up_views, status, sync_views, connections)
+        await _awarm_up_views(status, async_views, connections)
+    return status
+
+
+@contextlib.contextmanager
+def _track_status() -> Iterator[WarmupStatus]:
+    """Record the outcome of the warm-up. Any error still marks the process as ready."""
+    global _status
+    _status = status = WarmupStatus()
+    t0 = time.perf_counter()
+    try:
+        yield status
+    except Exception as e:  # noqa: BLE001, the worker should still handle requests.
+        logger.exception("Warm-up failed: %s", e)
+        status.errors["warmup"] = str(e)
+    finally:
+        status.duration = time.perf_counter() - t0
+        status.ready = True
+        logger.info("Warm-up finished in %.3fs", status.duration)
+
+
+def _get_connections(connections: int | None) -> int:
+    if connections is None:
+        connections = settings.BRP_WARMUP_CONNECTIONS
+    return max(1, connections)
+
+
+def _get_view_classes() -> tuple[list[type], list[type]]:
+    """Provide the proxy views of each endpoint, split into sync and async views."""
+    # Importing the URLs also imports all views, reads the field configuration files,
+    # and compiles the parameter rulesets.
+    from .urls import urlpatterns
+    from .views.base import AsyncClientMixin, BaseProxyView
+
+    view_classes = {}
+    for pattern in urlpatterns:
+        view_class = getattr(pattern.callback, "view_class", None)
+        if view_class is not None and issubclass(view_class, BaseProxyView):
+            view_classes.setdefault(view_class.endpoint_url, view_class)
+
+    async_views = [v for v in view_classes.values() if issubclass(v, AsyncClientMixin)]
+    sync_views = [v for v in view_classes.values() if v not in async_views]
+    return sync_views, async_views
+
+
+def _warm_up_views(status: WarmupStatus, view_classes: list[type], connections: int) -> None:
+    from .views.base import BaseHealthCheckView
+
+    for view_class in view_classes:
+        view = view_class()
+        try:
+            view.get_client().warm_up(
+                BaseHealthCheckView.dummy_request,
+                connections=min(connections, view.pool_maxsize),
+                timeout=(settings.BRP_CONNECT_TIMEOUT, settings.BRP_READ_TIMEOUT),
+            )
+        except Exception as e:  # noqa: BLE001, e.g. OAuth errors or configuration errors.
+            logger.warning("Warm-up of %s failed: %s", view_class.endpoint_url, e)
+            status.errors[view_class.endpoint_url] = str(e)
+
+
+async def _awarm_up_views(
+    status: WarmupStatus, view_classes: list[type], connections: int, close: bool = False
+) -> None:
+    """Warm up the async clients of the running event loop, concurrently.
+
+    :param close: Whether to close the clients afterwards, for a temporary event loop.
+    """
+    from .views.base import BaseHealthCheckView
+
+    async def _warm_up_view(view_class):
+        view = view_class()
+        client = view.get_client()
+        try:
+            await client.warm_up(
+                BaseHealthCheckView.dummy_request,
+                connections=min(connections, view.pool_maxsize),
+                timeout=(settings.BRP_CONNECT_TIMEOUT, settings.BRP_READ_TIMEOUT),
+            )
+        except Exception as e:  # noqa: BLE001, e.g. OAuth errors or configuration errors.
+            logger.warning("Warm-up of %s failed: %s", view_class.endpoint_url, e)
+            status.errors[view_class.endpoint_url] = str(e)
+        finally:
+            if close:
+                await client.aclose()
+
+    await asyncio.gather(*(_warm_up_view(view_class) for view_class in view_classes))
+
+
+def get_status() -> dict:
+    """Tell whether this process is ready to handle requests."""
+    if _status is None:
+        return {"ready": not settings.BRP_WARMUP}
+    return _status.as_dict()
+
+
+def clear_status() -> None:
+    """Forget the warm-up status."""
+    global _status, _task
+    _status = None
+    _task = None
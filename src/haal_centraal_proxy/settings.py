@@ -1,3 +1,5 @@
+import os
+import tempfile
 from pathlib import Path
 
 import environ
@@ -98,6 +100,7 @@ if not DEBUG:
     ]
 
 WSGI_APPLICATION = "haal_centraal_proxy.wsgi.application"
+ASGI_APPLICATION = "haal_centraal_proxy.asgi.application"
 
 # -- Services
 
@@ -289,7 +292,8 @@ CORS_ALLOWED_ORIGIN_REGEXES = env.list(
     ),
 )
 CORS_ALLOW_HEADERS = list(default_headers) + env.list(
-    "CORS_ALLOW_HEADERS", default=["x-user", "x-correlation-id", "x-task-description"]
+    "CORS_ALLOW_HEADERS",
+    default=["x-user", "x-correlation-id", "x-task-description", "x-request-timeout"],
 )
 
 CONTENT_SECURITY_POLICY = {
@@ -351,9 +355,20 @@ BRP_OAUTH_CLIENT_ID = env.str("BRP_OAUTH_CLIENT_ID", default=None)
 # Scope is AfnemerID + Amsterdam OIN
 BRP_OAUTH_SCOPE = env.str("BRP_OAUTH_SCOPE", "510193-00000001002564440000")
 
+# The OAuth token is shared between all workers on the same node using this file.
+# By default, it's stored in a directory that is only accessible by the current user.
+BRP_OAUTH_TOKEN_FILE = env.str(
+    "BRP_OAUTH_TOKEN_FILE",
+    default=str(Path(tempfile.gettempdir()) / f"haal-centraal-{os.getuid()}" / "token.json"),
+)
+# Renew the OAuth token in a background thread before it expires.
+BRP_OAUTH_TOKEN_BACKGROUND_REFRESH = env.bool("BRP_OAUTH_TOKEN_BACKGROUND_REFRESH", default=True)
+
 # mTLS client certificate for production
 BRP_MTLS_KEY_FILE = env.str("BRP_MTLS_KEY_FILE", None)
 BRP_MTLS_CERT_FILE = env.str("BRP_MTLS_CERT_FILE", None)
+# PKIoverheid CA certificates of the private 'diginetwerk'
+BRP_CA_DIR = env.str("BRP_CA_DIR", str(SRC_DIR / "config/ca"))
 
 # https://www.rvig.nl/Aansluitinstructies-Diginetwerk-voor-stelselapplicaties
 # Proefomgeving URLs (NPR: Niet Productie):
@@ -371,6 +386,116 @@ BRP_VERBLIJFPLAATSHISTORIE_URL = env.str(
     "BRP_VERBLIJFPLAATSHISTORIE_URL", default=f"{BRP_URL}/verblijfplaatshistorie"
 )
 
+# Use the asyncio-based views, when running under an ASGI server.
+BRP_ASYNC_VIEWS = env.bool("BRP_ASYNC_VIEWS", default=False)
+
+# Number of connections each uwsgi worker keeps open per endpoint.
+# This should match the number of threads that can call the endpoint concurrently.
+BRP_PERSONEN_POOL_SIZE = env.int("BRP_PERSONEN_POOL_SIZE", default=10)
+BRP_BEWONINGEN_POOL_SIZE = env.int("BRP_BEWONINGEN_POOL_SIZE", default=10)
+BRP_VERBLIJFPLAATSHISTORIE_POOL_SIZE = env.int("BRP_VERBLIJFPLAATSHISTORIE_POOL_SIZE", default=10)
+
+# Prepare each worker before it handles requests: import the views, retrieve the OAuth token
+# and open a number of connections per endpoint. The /health/ready endpoint tells when
+# this is done. Under uwsgi, this happens in each worker after it's forked.
+BRP_WARMUP = env.bool("BRP_WARMUP", default=False)
+BRP_WARMUP_CONNECTIONS = env.int("BRP_WARMUP_CONNECTIONS", default=2)
+
+# Haal Centraal accepts at most 20 BSN's per call. Larger lists are split into multiple calls,
+# of which this number is made concurrently (per request). The maximum list length limits
+# how many calls a single request can make.
+BRP_PERSONEN_MAX_BSN = env.int("BRP_PERSONEN_MAX_BSN", default=200)
+BRP_PERSONEN_CHUNK_CONCURRENCY = env.int("BRP_PERSONEN_CHUNK_CONCURRENCY", default=4)
+
+# The batch endpoints (e.g. /v1/personen/batch) perform a list of queries in a single request.
+# The concurrency is the number of queries that are performed at the same time (per request).
+BRP_BATCH_MAX_SIZE = env.int("BRP_BATCH_MAX_SIZE", default=100)
+BRP_BATCH_CONCURRENCY = env.int("BRP_BATCH_CONCURRENCY", default=4)
+
+# Timeouts (in seconds) for the calls to the BRP. The read timeout can differ per query type,
+# e.g. BRP_PERSONEN_READ_TIMEOUTS="RaadpleegMetBurgerservicenummer=10,ZoekMetPostcode=30".
+# Clients can request a shorter deadline using the "X-Request-Timeout" header.
+BRP_CONNECT_TIMEOUT = env.float("BRP_CONNECT_TIMEOUT", default=5.0)
+BRP_READ_TIMEOUT = env.float("BRP_READ_TIMEOUT", default=60.0)
+BRP_PERSONEN_READ_TIMEOUTS = env.dict(
+    "BRP_PERSONEN_READ_TIMEOUTS",
+    cast={"value": float},
+    default={
+        "RaadpleegMetBurgerservicenummer": 20.0,
+        "ZoekMetGeslachtsnaamEnGeboortedatum": 60.0,
+    },
+)
+BRP_BEWONINGEN_READ_TIMEOUTS = env.dict(
+    "BRP_BEWONINGEN_READ_TIMEOUTS", cast={"value": float}, default={}
+)
+BRP_VERBLIJFPLAATSHISTORIE_READ_TIMEOUTS = env.dict(
+    "BRP_VERBLIJFPLAATSHISTORIE_READ_TIMEOUTS", cast={"value": float}, default={}
+)
+
+# Multiplex the calls over HTTP/2 connections, instead of a HTTP/1.1 connection per call.
+# With HTTP/2, the pool size is the maximum number of connections.
+BRP_HTTP2 = env.bool("BRP_HTTP2", default=False)
+
+# Retry temporary failures (connection errors, timeouts, 502/503/504) of the BRP gateway.
+# The attempts include the first call. The delays use exponential backoff with full jitter.
+# No retries are made after the deadline, and the budget limits the retries to a fraction
+# of all requests, so retries can't amplify an outage. By default, no retries are made.
+BRP_RETRY_ATTEMPTS = env.int("BRP_RETRY_ATTEMPTS", default=1)
+BRP_RETRY_BACKOFF = env.float("BRP_RETRY_BACKOFF", default=0.1)
+BRP_RETRY_MAX_BACKOFF = env.float("BRP_RETRY_MAX_BACKOFF", default=2.0)
+BRP_RETRY_DEADLINE = env.float("BRP_RETRY_DEADLINE", default=60.0)
+BRP_RETRY_BUDGET_RATIO = env.float("BRP_RETRY_BUDGET_RATIO", default=0.1)
+BRP_RETRY_BUDGET_MIN_RETRIES = env.int("BRP_RETRY_BUDGET_MIN_RETRIES", default=10)
+
+# Limit the concurrent calls per endpoint to its pool size (e.g. BRP_PERSONEN_POOL_SIZE),
+# so a slow endpoint can't tie up all worker threads. A limited number of calls wait
+# for their turn, other calls fail immediately with a 503 and Retry-After header.
+BRP_BULKHEAD = env.bool("BRP_BULKHEAD", default=False)
+BRP_BULKHEAD_MAX_QUEUE = env.int("BRP_BULKHEAD_MAX_QUEUE", default=10)
+BRP_BULKHEAD_MAX_WAIT = env.float("BRP_BULKHEAD_MAX_WAIT", default=5.0)
+
+# Fail fast with a 503 when the BRP gateway is down, instead of waiting for every call.
+# The circuit opens when too many of the recent calls failed, or were too slow.
+# After the open duration, a few trial calls are made to test whether the gateway is back.
+# The rates are calculated over the last calls (window size), once enough calls were made.
+BRP_CIRCUIT_BREAKER = env.bool("BRP_CIRCUIT_BREAKER", default=False)
+BRP_CIRCUIT_BREAKER_FAILURE_RATE = env.float("BRP_CIRCUIT_BREAKER_FAILURE_RATE", default=0.5)
+BRP_CIRCUIT_BREAKER_SLOW_CALL_RATE = env.float("BRP_CIRCUIT_BREAKER_SLOW_CALL_RATE", default=0.8)
+BRP_CIRCUIT_BREAKER_SLOW_CALL_DURATION = env.float(
+    "BRP_CIRCUIT_BREAKER_SLOW_CALL_DURATION", default=10.0
+)
+BRP_CIRCUIT_BREAKER_OPEN_DURATION = env.float("BRP_CIRCUIT_BREAKER_OPEN_DURATION", default=30.0)
+BRP_CIRCUIT_BREAKER_TRIAL_CALLS = env.int("BRP_CIRCUIT_BREAKER_TRIAL_CALLS", default=3)
+BRP_CIRCUIT_BREAKER_WINDOW_SIZE = env.int("BRP_CIRCUIT_BREAKER_WINDOW_SIZE", default=20)
+BRP_CIRCUIT_BREAKER_MINIMUM_CALLS = env.int("BRP_CIRCUIT_BREAKER_MINIMUM_CALLS", default=10)
+
+# Hedged requests for lookups by BSN: when the call takes longer than the given percentile
+# of the recent calls, a second identical call is made, and the first response is used.
+# The budget ratio limits the extra load on the BRP (e.g. 0.05 = at most 5% extra calls).
+BRP_HEDGING = env.bool("BRP_HEDGING", default=False)
+BRP_HEDGING_PERCENTILE = env.float("BRP_HEDGING_PERCENTILE", default=0.95)
+BRP_HEDGING_BUDGET_RATIO = env.float("BRP_HEDGING_BUDGET_RATIO", default=0.05)
+BRP_HEDGING_MIN_DELAY = env.float("BRP_HEDGING_MIN_DELAY", default=0.05)
+BRP_HEDGING_WINDOW_SIZE = env.int("BRP_HEDGING_WINDOW_SIZE", default=200)
+BRP_HEDGING_MIN_SAMPLES = env.int("BRP_HEDGING_MIN_SAMPLES", default=20)
+
+# Let identical concurrent requests (after the request transformation) share a single call
+# to the BRP. Each request still has its own authorization checks and audit log record.
+# This is opt-in, like hedging.
+BRP_COALESCE_REQUESTS = env.bool("BRP_COALESCE_REQUESTS", default=False)
+
+# Short-lived cache for identical queries, e.g. BRP_PERSONEN_CACHE_TTLS="ZoekMetPostcode=10".
+# Query types without a time-to-live (in seconds) are not cached. The responses are kept
+# encrypted in memory of each worker. The audit log still records every request.
+BRP_RESPONSE_CACHE_MAX_BYTES = env.int("BRP_RESPONSE_CACHE_MAX_BYTES", default=50_000_000)
+BRP_PERSONEN_CACHE_TTLS = env.dict("BRP_PERSONEN_CACHE_TTLS", cast={"value": float}, default={})
+BRP_BEWONINGEN_CACHE_TTLS = env.dict(
+    "BRP_BEWONINGEN_CACHE_TTLS", cast={"value": float}, default={}
+)
+BRP_VERBLIJFPLAATSHISTORIE_CACHE_TTLS = env.dict(
+    "BRP_VERBLIJFPLAATSHISTORIE_CACHE_TTLS", cast={"value": float}, default={}
+)
+
 # Muse be a URL-safe base64-encoded 32-byte key
 if _USE_SECRET_STORE or CLOUD_ENV.startswith("azure"):
     HAAL_CENTRAAL_BRP_ENCRYPTION_KEYS = (
@@ -14,3 +14,7 @@ os.environ.setdefault("DJANGO_SETTINGS_MODULE", "haal_centraal_proxy.settings")
 
 application = get_wsgi_application()
 application = WhiteNoise(application, root=settings.STATIC_ROOT)
+
+from haal_centraal_proxy.bevragingen.warmup import schedule_warm_up  # noqa: E402
+
+schedule_warm_up()
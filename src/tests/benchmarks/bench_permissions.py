@@ -0,0 +1,121 @@
+"""Benchmark of the parameter validation, using the ``fields`` of a full personen request.
+The previous implementation used sets of scope names, and scanned regexes for wildcards.
+
+Run from the ``src`` folder::
+
+    python -m tests.benchmarks.bench_permissions
+"""
+
+import os
+import re
+import timeit
+
+import django
+
+REPEAT = 1000
+NUM_WILDCARDS = 30
+
+
+class RegexLookup:
+    """The previous implementation: a dict lookup, and a scan of all wildcard regexes."""
+
+    def __init__(self, scopes_for_values: dict, default_scope: set | None = None):
+        self.scopes_for_values = scopes_for_values
+        self.default_scope = default_scope
+        self.roles_for_values_re = [
+            (re.compile(re.escape(key).replace(r"\*", ".+")), roles)
+            for key, roles in scopes_for_values.items()
+            if key.endswith("*")
+        ]
+
+    def get_needed_scopes(self, value):
+        try:
+            return self.scopes_for_values[value]
+        except KeyError:
+            for pattern, roles in self.roles_for_values_re:
+                if pattern.match(value):
+                    return roles
+
+        if self.default_scope is None:
+            raise ValueError(f"Value not handled: {value}")
+        return self.default_scope
+
+
+def get_allowed_values(scopes_for_values: dict, user_scopes: set[str]) -> list[str]:
+    """The previous implementation, comparing sets of scope names."""
+    return [
+        value
+        for value, required_scope in scopes_for_values.items()
+        if (
+            required_scope is not None
+            and (not required_scope or not required_scope.isdisjoint(user_scopes))
+        )
+    ]
+
+
+def report(name: str, old, new):
+    old_time = timeit.timeit(old, number=REPEAT)
+    new_time = timeit.timeit(new, number=REPEAT)
+    print(f"{name}:")
+    print(f"  previous:        {old_time / REPEAT * 1e6:8.1f} µs")
+    print(f"  compiled tables: {new_time / REPEAT * 1e6:8.1f} µs")
+
+
+def measure(name: str, scopes_for_values: dict, values: list[str]):
+    from haal_centraal_proxy.bevragingen import scopes
+    from haal_centraal_proxy.bevragingen.permissions import ParameterPolicy
+
+    # The previous implementation stored sets of scope names.
+    scopes_for_values = {
+        value: scopes.get_names(mask) if isinstance(mask, int) else mask
+        for value, mask in scopes_for_values.items()
+    }
+    old = RegexLookup(scopes_for_values).get_needed_scopes
+    policy = ParameterPolicy(scopes_for_values=scopes_for_values)
+    compiled = policy.compile()
+    assert [old(v) for v in values] == [compiled.get_needed_scopes(v) for v in values]
+    new = compiled.get_needed_mask
+    report(
+        f"{name}, lookup ({len(values)} values)",
+        lambda: [old(v) for v in values],
+        lambda: [new(v) for v in values],
+    )
+
+    user_scopes = {"benk-brp-personen-api", "benk-brp-zoekvraag-bsn", "benk-brp-gegevensset-1"}
+    user_mask = scopes.get_mask(user_scopes)
+    assert get_allowed_values(scopes_for_values, user_scopes) == policy.get_allowed_values(
+        user_scopes
+    )
+    report(
+        f"{name}, allowed values",
+        lambda: get_allowed_values(scopes_for_values, user_scopes),
+        lambda: compiled.get_allowed_values(user_mask),
+    )
+
+
+def main():
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "tests.settings")
+    django.setup()
+
+    from haal_centraal_proxy.bevragingen.views import BrpPersonenView
+
+    # The fields parameter of a lookup by BSN, with all fields.
+    scopes_for_values = BrpPersonenView.parameter_ruleset["fields"].scopes_for_values
+    values = sorted(v for v in scopes_for_values if v is not None)
+    measure("personen fields", scopes_for_values, values)
+
+    # The same fields, where groups are allowed with a wildcard (e.g. "naam.*").
+    groups = sorted({v.partition(".")[0] for v in values if "." in v})[:NUM_WILDCARDS]
+    wildcard_scopes = {
+        **{
+            v: scopes
+            for v, scopes in scopes_for_values.items()
+            if "." not in (v or "") or v.partition(".")[0] not in groups
+        },
+        **{f"{group}.*": {"benk-brp-gegevensset-1"} for group in groups},
+    }
+    measure(f"personen fields, {len(groups)} wildcards", wildcard_scopes, values)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+"""Benchmark of the response pipeline, using a large personen response.
+
+Run from the ``src`` folder::
+
+    python -m tests.benchmarks.bench_transform
+"""
+
+import logging
+import os
+import timeit
+from copy import deepcopy
+
+import django
+import orjson
+import requests_mock
+
+NUM_PERSONS = 500
+REPEAT = 20
+
+
+def get_response() -> dict:
+    """A search result of a large apartment building."""
+    return {
+        "type": "ZoekMetPostcodeEnHuisnummer",
+        "personen": [
+            {
+                "burgerservicenummer": f"{999_000_000 + i}",
+                "geheimhoudingPersoonsgegevens": i % 50 == 0,
+                "naam": {
+                    "voornamen": "Ronald Franciscus Maria",
+                    "voorvoegsel": "van",
+                    "geslachtsnaam": f"Moes {i}",
+                    "aanduidingNaamgebruik": {"code": "E", "omschrijving": "eigen geslachtsnaam"},
+                },
+                "geboorte": {
+                    "datum": {"type": "Datum", "datum": "1963-06-17"},
+                    "plaats": {"code": "0363", "omschrijving": "Amsterdam"},
+                },
+                "verblijfplaats": {
+                    "type": "Adres",
+                    "verblijfadres": {
+                        "officieleStraatnaam": "Weesperstraat",
+                        "huisnummer": 113,
+                        "huisletter": "A",
+                        "postcode": "1018VN",
+                        "woonplaats": "Amsterdam",
+                    },
+                },
+                "_links": {"self": {"href": f"http://localhost/personen/{i}"}},
+            }
+            for i in range(NUM_PERSONS)
+        ],
+    }
+
+
+def main():
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "tests.settings")
+    django.setup()
+    logging.disable(logging.WARNING)  # measure the pipeline, not writing the logs.
+
+    from django.urls import reverse
+    from rest_framework.test import APIClient
+
+    from tests.utils import build_jwt_token
+
+    content = orjson.dumps(get_response())
+    print(f"Response of {NUM_PERSONS} persons: {len(content) / 1024:.0f} KiB")
+
+    # The parsing and copying that the pipeline no longer does.
+    old = timeit.timeit(lambda: deepcopy(orjson.loads(content.decode())), number=REPEAT)
+    new = timeit.timeit(lambda: orjson.loads(content), number=REPEAT)
+    print(f"parse from text + deepcopy: {old / REPEAT * 1000:7.2f} ms")
+    print(f"parse from content:         {new / REPEAT * 1000:7.2f} ms")
+
+    # The complete request, including the transformation and audit logging.
+    api_client = APIClient()
+    token = build_jwt_token(
+        [
+            "benk-brp-personen-api",
+            "benk-brp-zoekvraag-postcode-huisnummer",
+            "benk-brp-gegevensset-1",
+        ]
+    )
+    with requests_mock.Mocker() as mock:
+        mock.post("/lap/api/brp/personen", content=content)
+
+        def request():
+            response = api_client.post(
+                reverse("brp-personen"),
+                {"type": "ZoekMetPostcodeEnHuisnummer", "postcode": "1018VN", "huisnummer": 113},
+                format="json",
+                headers={
+                    "Authorization": f"Bearer {token}",
+                    "X-Correlation-ID": "benchmark",
+                    "X-User": "benchmark",
+                    "X-Task-Description": "benchmark",
+                },
+            )
+            assert response.status_code == 200, response.content
+
+        request()  # warm up
+        total = timeit.timeit(request, number=REPEAT)
+    print(f"complete request:           {total / REPEAT * 1000:7.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
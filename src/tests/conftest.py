@@ -7,11 +7,39 @@ from django.core.handlers.wsgi import WSGIRequest
 from rest_framework.request import Request
 from rest_framework.test import APIClient, APIRequestFactory
 
+from haal_centraal_proxy.bevragingen import (
+    bulkhead,
+    cache,
+    circuitbreaker,
+    client,
+    fields,
+    retries,
+    tokens,
+    transports,
+    warmup,
+)
+from haal_centraal_proxy.bevragingen.views import personen
 from tests.utils import api_request_with_scopes, to_drf_request
 
 HERE = Path(__file__).parent
 
 
+@pytest.fixture(autouse=True)
+def clear_clients():
+    """Make sure each test starts with fresh API clients (they're shared per process)."""
+    yield
+    client.clear_clients()
+    tokens.clear_token_stores()
+    retries.clear_retry_budgets()
+    circuitbreaker.clear_circuit_breakers()
+    bulkhead.clear_bulkheads()
+    cache.clear_response_caches()
+    transports.clear_ssl_contexts()
+    warmup.clear_status()
+    personen.clear_authorization_profiles()
+    fields.clear_null_skeletons()
+
+
 @pytest.fixture()
 def api_rf() -> APIRequestFactory:
     """Request factory for APIView classes"""
@@ -0,0 +1,127 @@
+import asyncio
+import threading
+
+import pytest
+from django.urls import reverse
+
+from haal_centraal_proxy.bevragingen.bulkhead import Bulkhead, get_bulkhead
+from haal_centraal_proxy.bevragingen.exceptions import BulkheadFull
+from haal_centraal_proxy.bevragingen.views import BrpPersonenView
+from tests.utils import build_jwt_token
+
+
+class TestBulkhead:
+    """Prove that the bulkhead limits the concurrent calls."""
+
+    def test_reject_when_full(self):
+        """Prove that calls fail immediately when the queue is full."""
+        bulkhead = Bulkhead("test", max_concurrent=1, max_queue=0)
+        with bulkhead.call():
+            assert bulkhead.get_stats()["in_flight"] == 1
+            with pytest.raises(BulkheadFull) as exc_info, bulkhead.call():
+                pytest.fail("call should not be made")
+
+        assert exc_info.value.status_code == 503
+        assert exc_info.value.wait == 1
+        assert bulkhead.get_stats() == {
+            "in_flight": 0,
+            "max_in_flight": 1,
+            "queue_depth": 0,
+            "rejected": 1,
+        }
+
+    def test_try_acquire(self):
+        """Prove that a slot can be taken without waiting for it."""
+        bulkhead = Bulkhead("test", max_concurrent=1, max_queue=1)
+        assert bulkhead.try_acquire()
+        assert not bulkhead.try_acquire()
+        bulkhead.release()
+        assert bulkhead.get_stats() == {"in_flight": 0, "max_in_flight": 1, "queue_depth": 0}
+
+    def test_wait_for_slot(self):
+        """Prove that a waiting call gets the slot of the call that finished."""
+        bulkhead = Bulkhead("test", max_concurrent=1, max_queue=1)
+        calls = []
+
+        def waiting_call():
+            with bulkhead.call():
+                calls.append("waiting")
+
+        with bulkhead.call():
+            thread = threading.Thread(target=waiting_call)
+            thread.start()
+            while not bulkhead.get_stats()["queue_depth"]:
+                thread.join(0.01)
+            calls.append("first")
+
+        thread.join()
+        assert calls == ["first", "waiting"]
+        assert bulkhead.get_stats() == {
+            "in_flight": 0,
+            "max_in_flight": 1,
+            "queue_depth": 0,
+            "queued": 1,
+        }
+
+    def test_wait_timeout(self):
+        """Prove that a call doesn't wait longer than the maximum."""
+        bulkhead = Bulkhead("test", max_concurrent=1, max_queue=1, max_wait=0.01)
+        with bulkhead.call(), pytest.raises(BulkheadFull), bulkhead.call():
+            pytest.fail("call should not be made")
+
+        assert bulkhead.get_stats()["queue_depth"] == 0
+
+    def test_reject_slow_endpoint(self):
+        """Prove that calls fail immediately when they would wait too long."""
+        bulkhead = Bulkhead("test", max_concurrent=1, max_queue=10, max_wait=5)
+        bulkhead._avg_duration = 8.0
+        with bulkhead.call(), pytest.raises(BulkheadFull) as exc_info, bulkhead.call():
+            pytest.fail("call should not be made")
+
+        assert exc_info.value.wait == 8
+
+    def test_async(self):
+        """Prove that coroutines wait without blocking the event loop."""
+        bulkhead = Bulkhead("test", max_concurrent=1, max_queue=1)
+        calls = []
+
+        async def call(name):
+            async with bulkhead.acall():
+                await asyncio.sleep(0.01)
+                calls.append(name)
+
+        async def main():
+            return await asyncio.gather(
+                call("first"), call("second"), call("third"), return_exceptions=True
+            )
+
+        results = asyncio.run(main())
+        assert calls == ["first", "second"]
+        assert isinstance(results[2], BulkheadFull)
+        assert bulkhead.get_stats()["in_flight"] == 0
+
+
+def test_view_rejects(api_client, requests_mock, common_headers, settings):
+    """Prove that the view returns a 503 problem+json when the endpoint is too busy."""
+    settings.BRP_BULKHEAD = True
+    api_mock = requests_mock.post("/lap/api/brp/personen", json={"personen": []})
+    token = build_jwt_token(
+        [
+            "benk-brp-personen-api",
+            "benk-brp-zoekvraag-postcode-huisnummer",
+            "benk-brp-gegevensset-1",
+        ]
+    )
+    bulkhead = get_bulkhead(BrpPersonenView.endpoint_url, max_concurrent=1, max_queue=0)
+    with bulkhead.call():
+        response = api_client.post(
+            reverse("brp-personen"),
+            {"type": "ZoekMetPostcodeEnHuisnummer", "postcode": "1074VE", "huisnummer": 1},
+            headers={"Authorization": f"Bearer {token}", **common_headers},
+        )
+
+    assert response.status_code == 503
+    assert response["Content-Type"] == "application/problem+json"
+    assert response["Retry-After"] == "1"
+    assert response.json()["code"] == "bulkheadFull"
+    assert not api_mock.called
@@ -0,0 +1,126 @@
+import asyncio
+
+import httpx
+from django.urls import reverse
+
+from haal_centraal_proxy.bevragingen.async_client import AsyncBrpClient
+from haal_centraal_proxy.bevragingen.cache import CachedResponse, ResponseCache
+from haal_centraal_proxy.bevragingen.client import BrpClient
+from haal_centraal_proxy.bevragingen.views.personen import BrpPersonenView
+from tests.utils import build_jwt_token
+
+RESPONSE = CachedResponse("application/json", b'{"personen": [{"naam": "test"}]}')
+
+
+class TestResponseCache:
+    """Prove that the cache expires and limits the responses."""
+
+    def test_get_set(self):
+        """Prove that the stored response is returned, but not stored as plain text."""
+        cache = ResponseCache("test")
+        assert cache.get(b"key") is None
+        cache.set(b"key", RESPONSE, ttl=10)
+        assert cache.get(b"key") == RESPONSE
+        assert b"test" not in cache._entries[b"key"].token
+        assert cache.get_stats() == {
+            "entries": 1,
+            "size": cache._entries[b"key"].size,
+            "hits": 1,
+            "misses": 1,
+        }
+
+    def test_expired(self, monkeypatch):
+        """Prove that the response is no longer returned after the time-to-live."""
+        now = 1000.0
+        monkeypatch.setattr("time.monotonic", lambda: now)
+        cache = ResponseCache("test")
+        cache.set(b"key", RESPONSE, ttl=10)
+        now += 10
+        assert cache.get(b"key") is None
+        assert cache.get_stats()["entries"] == 0
+
+    def test_evict_least_recently_used(self):
+        """Prove that the cache removes the least recently used response when it's full."""
+        cache = ResponseCache("test")
+        cache.set(b"key1", RESPONSE, ttl=10)
+        cache.max_bytes = cache.get_stats()["size"] * 2
+        cache.set(b"key2", RESPONSE, ttl=10)
+        cache.get(b"key1")
+        cache.set(b"key3", RESPONSE, ttl=10)
+
+        assert cache.get(b"key2") is None
+        assert cache.get(b"key1") == RESPONSE
+        assert cache.get(b"key3") == RESPONSE
+        assert cache.get_stats()["evictions"] == 1
+
+    def test_too_large(self):
+        """Prove that responses larger than the cache are not stored."""
+        cache = ResponseCache("test", max_bytes=10)
+        cache.set(b"key", RESPONSE, ttl=10)
+        assert cache.get_stats()["entries"] == 0
+
+
+def test_sync_client(requests_mock):
+    """Prove that the client only caches when a time-to-live is given."""
+    api_mock = requests_mock.post("http://localhost:5010/personen", json={"personen": []})
+    client = BrpClient("http://localhost:5010/personen", response_cache=ResponseCache("test"))
+    hc_request = {"type": "RaadpleegMetBurgerservicenummer", "burgerservicenummer": ["1"]}
+    client.call(hc_request)
+    client.call(hc_request, cache_ttl=10)
+    response = client.call(hc_request, cache_ttl=10)
+
+    assert api_mock.call_count == 2
+    assert response.from_cache
+    assert response.text == '{"personen": []}'
+    assert response.json() == {"personen": []}
+
+
+def test_async_client():
+    """Prove that the async client also uses the cache."""
+    calls = []
+
+    async def handler(request):
+        calls.append(request)
+        return httpx.Response(200, json={"personen": []})
+
+    async def main():
+        client = AsyncBrpClient(
+            "http://localhost:5010/personen",
+            transport=httpx.MockTransport(handler),
+            response_cache=ResponseCache("test"),
+        )
+        await client.call({"type": "RaadpleegMetBurgerservicenummer"}, cache_ttl=10)
+        return await client.call({"type": "RaadpleegMetBurgerservicenummer"}, cache_ttl=10)
+
+    response = asyncio.run(main())
+    assert len(calls) == 1
+    assert response.from_cache
+    assert response.json() == {"personen": []}
+
+
+def test_audit_log(api_client, requests_mock, caplog, common_headers, monkeypatch):
+    """Prove that cached responses are still logged, and the audit log tells so."""
+    monkeypatch.setattr(BrpPersonenView, "cache_ttls", {"ZoekMetPostcodeEnHuisnummer": 10})
+    api_mock = requests_mock.post(
+        "/lap/api/brp/personen",
+        json={"type": "ZoekMetPostcodeEnHuisnummer", "personen": []},
+    )
+    token = build_jwt_token(
+        [
+            "benk-brp-personen-api",
+            "benk-brp-zoekvraag-postcode-huisnummer",
+            "benk-brp-gegevensset-1",
+        ]
+    )
+    for _ in range(2):
+        response = api_client.post(
+            reverse("brp-personen"),
+            {"type": "ZoekMetPostcodeEnHuisnummer", "postcode": "1074VE", "huisnummer": 1},
+            headers={"Authorization": f"Bearer {token}", **common_headers},
+        )
+        assert response.status_code == 200, response.data
+
+    assert api_mock.call_count == 1
+    records = [r for r in caplog.records if r.message.startswith("Access granted")]
+    assert [r.cached for r in records] == [False, True]
+    assert records[0].hc_response == records[1].hc_response
@@ -0,0 +1,110 @@
+import pytest
+from django.urls import reverse
+from rest_framework.exceptions import ParseError
+
+from haal_centraal_proxy.bevragingen.circuitbreaker import CircuitBreaker, State
+from haal_centraal_proxy.bevragingen.exceptions import BadGateway, CircuitOpen
+from tests.utils import build_jwt_token
+
+
+class TestCircuitBreaker:
+    """Prove that the circuit breaker opens and closes."""
+
+    def _fail(self, breaker: CircuitBreaker):
+        with pytest.raises(BadGateway), breaker.call():
+            raise BadGateway()
+
+    def test_open_on_failures(self):
+        """Prove that the circuit opens when too many calls fail, and then fails fast."""
+        breaker = CircuitBreaker("test", window_size=4, minimum_calls=4)
+        with breaker.call():
+            pass
+        for _ in range(3):
+            self._fail(breaker)
+        assert breaker.state == State.OPEN
+
+        with pytest.raises(CircuitOpen) as exc_info, breaker.call():
+            pytest.fail("call should not be made")
+        assert exc_info.value.status_code == 503
+        assert exc_info.value.wait == 30
+
+    def test_open_on_slow_calls(self):
+        """Prove that slow calls also open the circuit."""
+        breaker = CircuitBreaker("test", minimum_calls=2, slow_call_duration=1)
+        breaker.record(failed=False, duration=2)
+        breaker.record(failed=False, duration=3)
+        assert breaker.state == State.OPEN
+
+    def test_ignore_client_errors(self):
+        """Prove that errors caused by the request (e.g. 400 Bad Request) are not failures."""
+        breaker = CircuitBreaker("test", minimum_calls=2)
+        for _ in range(2):
+            with pytest.raises(ParseError), breaker.call():
+                raise ParseError()
+        assert breaker.state == State.CLOSED
+
+    def test_half_open(self, monkeypatch):
+        """Prove that a limited number of trial calls are made, which close the circuit."""
+        now = 1000.0
+        monkeypatch.setattr("time.monotonic", lambda: now)
+        breaker = CircuitBreaker("test", minimum_calls=1, open_duration=10, trial_calls=2)
+        self._fail(breaker)
+        assert breaker.state == State.OPEN
+
+        now += 10
+        assert breaker.state == State.HALF_OPEN
+        breaker.acquire()
+        breaker.acquire()
+        with pytest.raises(CircuitOpen):
+            breaker.acquire()  # only 2 trial calls
+
+        breaker.record(failed=False, duration=0.1)
+        breaker.record(failed=False, duration=0.1)
+        assert breaker.state == State.CLOSED
+        assert breaker.get_stats() == {
+            "state": "closed",
+            "failure_rate": 0,
+            "slow_call_rate": 0,
+            "opened": 1,
+            "closed": 1,
+            "rejected": 1,
+        }
+
+    def test_half_open_failure(self, monkeypatch):
+        """Prove that a failing trial call opens the circuit again."""
+        now = 1000.0
+        monkeypatch.setattr("time.monotonic", lambda: now)
+        breaker = CircuitBreaker("test", minimum_calls=1, open_duration=10)
+        self._fail(breaker)
+
+        now += 10
+        self._fail(breaker)
+        assert breaker.state == State.OPEN
+
+
+def test_view_fails_fast(api_client, requests_mock, common_headers, settings):
+    """Prove that the view returns a 503 problem+json, without calling the endpoint."""
+    settings.BRP_CIRCUIT_BREAKER = True
+    api_mock = requests_mock.post("/lap/api/brp/personen", status_code=502, text="Bad Gateway")
+    token = build_jwt_token(
+        [
+            "benk-brp-personen-api",
+            "benk-brp-zoekvraag-postcode-huisnummer",
+            "benk-brp-gegevensset-1",
+        ]
+    )
+    url = reverse("brp-personen")
+    statuses = []
+    for _ in range(12):
+        response = api_client.post(
+            url,
+            {"type": "ZoekMetPostcodeEnHuisnummer", "postcode": "1074VE", "huisnummer": 1},
+            headers={"Authorization": f"Bearer {token}", **common_headers},
+        )
+        statuses.append(response.status_code)
+
+    assert statuses == [502] * 10 + [503] * 2
+    assert api_mock.call_count == 10
+    assert response["Content-Type"] == "application/problem+json"
+    assert response["Retry-After"] == "30"
+    assert response.json()["code"] == "circuitOpen"
@@ -0,0 +1,132 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from django.conf import settings
+
+from haal_centraal_proxy.bevragingen import tokens
+from haal_centraal_proxy.bevragingen.client import (
+    AUTHORIZATION_REJECTED_TITLE,
+    BrpClient,
+    get_client,
+)
+
+
+class TestClientRegistry:
+    """Prove that clients are shared within the process."""
+
+    def test_reuse_client(self):
+        """Prove that the same endpoint gives the same client (and connection pool)."""
+        client1 = get_client(settings.BRP_PERSONEN_URL, pool_maxsize=4)
+        client2 = get_client(settings.BRP_PERSONEN_URL, pool_maxsize=4)
+        other = get_client(settings.BRP_BEWONINGEN_URL)
+        assert client1 is client2
+        assert client1 is not other
+
+        adapter = client1._session.get_adapter(settings.BRP_PERSONEN_URL)
+        assert adapter._pool_maxsize == 4
+
+    def test_kwargs_factory(self):
+        """Prove that the settings are only built when the client is constructed."""
+        calls = []
+
+        def get_kwargs():
+            calls.append(1)
+            return {"pool_maxsize": 4}
+
+        client1 = get_client(settings.BRP_PERSONEN_URL, kwargs_factory=get_kwargs)
+        client2 = get_client(settings.BRP_PERSONEN_URL, kwargs_factory=get_kwargs)
+        assert client1 is client2
+        assert len(calls) == 1
+        assert client1._session.get_adapter(settings.BRP_PERSONEN_URL)._pool_maxsize == 4
+
+    def test_reuse_threads(self):
+        """Prove that concurrent threads receive the same client."""
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            clients = set(executor.map(lambda _: get_client(settings.BRP_PERSONEN_URL), range(32)))
+        assert len(clients) == 1
+        assert isinstance(clients.pop(), BrpClient)
+
+
+class TestBrpClient:
+    """Prove that the client handles the OAuth flow."""
+
+    OAUTH_SETTINGS = {
+        "oauth_endpoint_url": "https://auth.example.com/token",
+        "oauth_client_id": "client",
+        "oauth_client_secret": "secret",
+    }
+
+    def test_token_shared(self, requests_mock, tmp_path):
+        """Prove that the OAuth token is retrieved once, and reused by other clients."""
+        oauth_mock = requests_mock.post(
+            "https://auth.example.com/token",
+            json={"token_type": "bearer", "access_token": "secret", "expires_in": 3600},
+        )
+        api_mock = requests_mock.post("https://brp.example.com/personen", json={"personen": []})
+        kwargs = {**self.OAUTH_SETTINGS, "token_file": tmp_path / "token.json"}
+
+        client = BrpClient("https://brp.example.com/personen", **kwargs)
+        client.call({"type": "RaadpleegMetBurgerservicenummer"})
+        client.call({"type": "RaadpleegMetBurgerservicenummer"})
+
+        # Another worker process
+        tokens.clear_token_stores()
+        client2 = BrpClient("https://brp.example.com/personen", **kwargs)
+        client2.call({"type": "RaadpleegMetBurgerservicenummer"})
+
+        assert oauth_mock.call_count == 1
+        assert api_mock.call_count == 3
+        assert api_mock.last_request.headers["Authorization"] == "Bearer secret"
+        assert client.get_stats()["token"] == {"refreshes": 1, "hits": 1}
+        assert client2.get_stats()["token"] == {"hits": 1}
+
+    def test_token_shared_without_file(self, requests_mock):
+        """Prove that clients of different endpoints share the token store of the process."""
+        oauth_mock = requests_mock.post(
+            "https://auth.example.com/token",
+            json={"token_type": "bearer", "access_token": "secret", "expires_in": 3600},
+        )
+        requests_mock.post("https://brp.example.com/personen", json={"personen": []})
+        requests_mock.post("https://brp.example.com/bewoningen", json={"bewoningen": []})
+        kwargs = {**self.OAUTH_SETTINGS, "token_file": None}
+
+        personen = BrpClient("https://brp.example.com/personen", **kwargs)
+        bewoningen = BrpClient("https://brp.example.com/bewoningen", **kwargs)
+        personen.call({"type": "RaadpleegMetBurgerservicenummer"})
+        bewoningen.call({"type": "BewoningMetPeildatum"})
+
+        assert personen._token_store is bewoningen._token_store
+        assert oauth_mock.call_count == 1
+
+    @pytest.mark.parametrize(
+        "rejected_response",
+        [
+            {"status_code": 401, "json": {"title": "Niet correct geauthenticeerd."}},
+            {"status_code": 403, "json": {"title": AUTHORIZATION_REJECTED_TITLE}},
+        ],
+    )
+    def test_token_rejected(self, requests_mock, tmp_path, rejected_response):
+        """Prove that a rejected token is replaced, and the request is replayed."""
+        oauth_mock = requests_mock.post(
+            "https://auth.example.com/token",
+            [
+                {"json": {"token_type": "bearer", "access_token": "old", "expires_in": 3600}},
+                {"json": {"token_type": "bearer", "access_token": "new", "expires_in": 3600}},
+            ],
+        )
+        api_mock = requests_mock.post(
+            "https://brp.example.com/personen",
+            [
+                {**rejected_response, "headers": {"content-type": "application/problem+json"}},
+                {"json": {"personen": []}},
+            ],
+        )
+        client = BrpClient("https://brp.example.com/personen", **self.OAUTH_SETTINGS)
+        response = client.call({"type": "RaadpleegMetBurgerservicenummer"})
+
+        assert response.json() == {"personen": []}
+        assert oauth_mock.call_count == 2
+        assert api_mock.call_count == 2
+        assert api_mock.request_history[0].headers["Authorization"] == "Bearer old"
+        assert api_mock.request_history[1].headers["Authorization"] == "Bearer new"
+        assert client.get_stats()["token"] == {"refreshes": 2, "rejected": 1, "replays": 1}
@@ -0,0 +1,220 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import httpx
+import orjson
+import pytest
+import requests
+from django.urls import reverse
+from rest_framework.test import APIClient
+
+from haal_centraal_proxy.bevragingen.async_client import AsyncBrpClient
+from haal_centraal_proxy.bevragingen.client import BrpClient
+from haal_centraal_proxy.bevragingen.coalescing import SingleFlight, get_flight_key, get_key
+from haal_centraal_proxy.bevragingen.exceptions import BadGateway, DeadlineExceeded
+from tests.utils import build_jwt_token
+
+
+def test_get_key():
+    """Prove that the ordering of the request fields doesn't matter."""
+    assert get_key({"type": "A", "fields": ["naam"]}) == get_key({"fields": ["naam"], "type": "A"})
+    assert get_key({"type": "A", "postcode": "1074VE"}) != get_key({"type": "A"})
+
+    # The request data is not part of the key
+    key = get_key(
+        {"type": "RaadpleegMetBurgerservicenummer", "burgerservicenummer": ["999990755"]}
+    )
+    assert b"999990755" not in key
+    assert len(key) == 32
+
+
+def test_get_flight_key():
+    """Prove that only calls with a similar deadline are shared."""
+    assert get_flight_key(b"key", 3.0) == get_flight_key(b"key", 4.0)
+    assert get_flight_key(b"key", 0.1) == get_flight_key(b"key", 1.0)
+    assert get_flight_key(b"key", 1.0) != get_flight_key(b"key", 5.0)
+    assert get_flight_key(b"key", None) != get_flight_key(b"key", 5.0)
+
+
+class TestSingleFlight:
+    """Prove that concurrent calls are shared."""
+
+    def _run_concurrently(self, single_flight: SingleFlight, fn, count=5, timeout=None):
+        with ThreadPoolExecutor(count) as executor:
+            futures = [
+                executor.submit(single_flight.do, b"key", fn, timeout=timeout)
+                for _ in range(count)
+            ]
+            return [f.exception() or f.result() for f in futures]
+
+    def test_shared_result(self):
+        """Prove that the function is only called once for concurrent calls."""
+        calls = []
+
+        def fn():
+            calls.append(1)
+            time.sleep(0.2)
+            return len(calls)
+
+        single_flight = SingleFlight("test")
+        assert self._run_concurrently(single_flight, fn) == [1] * 5
+        assert len(calls) == 1
+        assert single_flight.counters.as_dict() == {"calls": 1, "hits": 4}
+
+        # Next calls are made again
+        assert single_flight.do(b"key", fn) == 2
+
+    def test_shared_exception(self):
+        """Prove that the waiting callers also receive the error, each as its own object."""
+
+        def fn():
+            time.sleep(0.2)
+            raise BadGateway()
+
+        results = self._run_concurrently(SingleFlight("test"), fn, count=3)
+        assert all(isinstance(result, BadGateway) for result in results)
+        assert len({id(result) for result in results}) == 3
+
+    def test_shared_exception_cause(self):
+        """Prove that the waiting callers keep the original cause (e.g. the HTTP error)."""
+        cause = requests.HTTPError("500 Server Error")
+
+        def fn():
+            time.sleep(0.2)
+            raise BadGateway() from cause
+
+        results = self._run_concurrently(SingleFlight("test"), fn, count=3)
+        assert all(result.__cause__ is cause for result in results)
+
+    def test_timeout(self):
+        """Prove that the waiting callers don't wait longer than their deadline."""
+        single_flight = SingleFlight("test")
+        results = self._run_concurrently(single_flight, lambda: time.sleep(0.5), 2, timeout=0.1)
+        assert results.count(None) == 1
+        assert sum(isinstance(result, DeadlineExceeded) for result in results) == 1
+
+
+def test_sync_client(monkeypatch):
+    """Prove that the client shares the response of identical concurrent calls."""
+    calls = []
+    barrier = threading.Barrier(3)
+
+    def post(hc_request, timeout, stream=False):
+        # Not using requests_mock here, as it doesn't handle calls concurrently.
+        calls.append(hc_request)
+        call = len(calls)
+        time.sleep(0.2)
+        response = requests.Response()
+        response.status_code = 200
+        response._content = orjson.dumps({"personen": [], "call": call})
+        return response
+
+    def call(hc_request):
+        barrier.wait()
+        return client.call(hc_request).json()
+
+    client = BrpClient("http://localhost:5010/personen", coalesce=True)
+    monkeypatch.setattr(client, "_post", post)
+    with ThreadPoolExecutor(3) as executor:
+        results = list(
+            executor.map(
+                call,
+                [
+                    {"type": "RaadpleegMetBurgerservicenummer", "burgerservicenummer": ["1"]},
+                    {"burgerservicenummer": ["1"], "type": "RaadpleegMetBurgerservicenummer"},
+                    {"type": "RaadpleegMetBurgerservicenummer", "burgerservicenummer": ["2"]},
+                ],
+            )
+        )
+
+    assert len(calls) == 2
+    assert results[0] == results[1]
+    assert results[2] != results[0]
+    assert client.get_stats()["coalescing"] == {"calls": 2, "hits": 1}
+
+
+def test_async_client():
+    """Prove that the async client shares the response, also when the first caller is cancelled."""
+    calls = []
+
+    async def handler(request):
+        calls.append(request)
+        await asyncio.sleep(0.2)
+        return httpx.Response(200, json={"personen": []})
+
+    async def main():
+        client = AsyncBrpClient(
+            "http://localhost:5010/personen",
+            transport=httpx.MockTransport(handler),
+            coalesce=True,
+        )
+        hc_request = {"type": "RaadpleegMetBurgerservicenummer", "burgerservicenummer": ["1"]}
+        first = asyncio.create_task(client.call(hc_request))
+        await asyncio.sleep(0.05)
+        second = asyncio.create_task(client.call(hc_request))
+        await asyncio.sleep(0.05)
+        first.cancel()
+        response = await second
+        with pytest.raises(asyncio.CancelledError):
+            await first
+        return client, response
+
+    client, response = asyncio.run(main())
+    assert response.json() == {"personen": []}
+    assert len(calls) == 1
+    assert client.get_stats()["coalescing"] == {"calls": 1, "hits": 1}
+
+
+def test_audit_log_follower(caplog, common_headers, monkeypatch, settings):
+    """Prove that a coalesced request still logs the error response of Haal Centraal."""
+    settings.BRP_COALESCE_REQUESTS = True
+    problem = {
+        "type": "https://datatracker.ietf.org/doc/html/rfc7231#section-6.6.1",
+        "title": "Interne serverfout.",
+        "status": 500,
+        "instance": "/haalcentraal/api/brp/personen",
+        "code": "serverError",
+    }
+    calls = []
+
+    def post(self, hc_request, timeout, stream=False):
+        calls.append(hc_request)
+        time.sleep(0.2)
+        response = requests.Response()
+        response.status_code = 500
+        response.reason = "Internal Server Error"
+        response.url = self.endpoint_url
+        response.headers["Content-Type"] = "application/problem+json"
+        response._content = orjson.dumps(problem)
+        return response
+
+    monkeypatch.setattr(BrpClient, "_post", post)
+    token = build_jwt_token(
+        [
+            "benk-brp-personen-api",
+            "benk-brp-zoekvraag-postcode-huisnummer",
+            "benk-brp-gegevensset-1",
+        ]
+    )
+    barrier = threading.Barrier(2)
+
+    def request(_):
+        api_client = APIClient()
+        barrier.wait()
+        return api_client.post(
+            reverse("brp-personen"),
+            {"type": "ZoekMetPostcodeEnHuisnummer", "postcode": "1074VE", "huisnummer": 1},
+            format="json",
+            headers={"Authorization": f"Bearer {token}", **common_headers},
+        )
+
+    with ThreadPoolExecutor(2) as executor:
+        responses = list(executor.map(request, range(2)))
+
+    assert [response.status_code for response in responses] == [502, 502]
+    assert len(calls) == 1
+    records = [r for r in caplog.records if r.message.startswith("Access granted")]
+    assert len(records) == 2
+    assert all(record.hc_response == problem for record in records)
@@ -0,0 +1,104 @@
+import pytest
+import requests
+from django.urls import reverse
+
+from haal_centraal_proxy.bevragingen.circuitbreaker import CircuitBreaker
+from haal_centraal_proxy.bevragingen.client import BrpClient
+from haal_centraal_proxy.bevragingen.exceptions import DeadlineExceeded
+from tests.utils import build_jwt_token
+
+
+class TestClientDeadline:
+    """Prove that the client respects the deadline of the caller."""
+
+    def test_timeout_shortened(self, requests_mock):
+        """Prove that the timeouts are shortened to the remaining deadline."""
+        api_mock = requests_mock.post("http://localhost:5010/personen", json={"personen": []})
+        client = BrpClient("http://localhost:5010/personen")
+        client.call({"type": "RaadpleegMetBurgerservicenummer"}, timeout=(5, 60), deadline=10)
+
+        connect, read = api_mock.last_request.timeout
+        assert connect == 5
+        assert 9 < read <= 10
+
+    def test_deadline_exceeded(self, requests_mock):
+        """Prove that no call is made once the deadline has passed."""
+        api_mock = requests_mock.post("http://localhost:5010/personen", json={"personen": []})
+        client = BrpClient("http://localhost:5010/personen")
+        with pytest.raises(DeadlineExceeded):
+            client.call({"type": "RaadpleegMetBurgerservicenummer"}, deadline=0)
+        assert api_mock.call_count == 0
+
+    def test_deadline_timeout(self, requests_mock):
+        """Prove that a timeout caused by the deadline doesn't open the circuit breaker."""
+        requests_mock.post("http://localhost:5010/personen", exc=requests.ReadTimeout("timeout"))
+        breaker = CircuitBreaker("test", minimum_calls=1)
+        client = BrpClient("http://localhost:5010/personen", circuit_breaker=breaker)
+        with pytest.raises(DeadlineExceeded):
+            client.call({"type": "RaadpleegMetBurgerservicenummer"}, deadline=1)
+        assert breaker.get_stats()["failure_rate"] == 0
+
+
+class TestViewDeadline:
+    """Prove that the views pass the timeouts to the client."""
+
+    TOKEN_SCOPES = [
+        "benk-brp-personen-api",
+        "benk-brp-zoekvraag-postcode-huisnummer",
+        "benk-brp-gegevensset-1",
+    ]
+
+    def test_request_timeout_header(self, api_client, requests_mock, common_headers):
+        """Prove that the X-Request-Timeout header limits the upstream timeouts."""
+        api_mock = requests_mock.post(
+            "/lap/api/brp/personen", json={"type": "ZoekMetPostcodeEnHuisnummer", "personen": []}
+        )
+        token = build_jwt_token(self.TOKEN_SCOPES)
+        response = api_client.post(
+            reverse("brp-personen"),
+            {"type": "ZoekMetPostcodeEnHuisnummer", "postcode": "1074VE", "huisnummer": 1},
+            headers={
+                "Authorization": f"Bearer {token}",
+                "X-Request-Timeout": "3",
+                **common_headers,
+            },
+        )
+        assert response.status_code == 200, response.data
+
+        connect, read = api_mock.last_request.timeout
+        assert 2 < connect <= 3
+        assert 2 < read <= 3
+
+    def test_read_timeout_per_query_type(self, api_client, requests_mock, common_headers):
+        """Prove that the read timeout is configured per query type."""
+        api_mock = requests_mock.post(
+            "/lap/api/brp/personen", json={"type": "ZoekMetPostcodeEnHuisnummer", "personen": []}
+        )
+        token = build_jwt_token(self.TOKEN_SCOPES)
+        with pytest.MonkeyPatch.context() as mp:
+            mp.setattr(
+                "haal_centraal_proxy.bevragingen.views.personen.BrpPersonenView.read_timeouts",
+                {"ZoekMetPostcodeEnHuisnummer": 15.0},
+            )
+            api_client.post(
+                reverse("brp-personen"),
+                {"type": "ZoekMetPostcodeEnHuisnummer", "postcode": "1074VE", "huisnummer": 1},
+                headers={"Authorization": f"Bearer {token}", **common_headers},
+            )
+
+        assert api_mock.last_request.timeout[1] == 15.0
+
+    def test_invalid_header(self, api_client, common_headers):
+        """Prove that an invalid X-Request-Timeout header is rejected."""
+        token = build_jwt_token(self.TOKEN_SCOPES)
+        response = api_client.post(
+            reverse("brp-personen"),
+            {"type": "ZoekMetPostcodeEnHuisnummer", "postcode": "1074VE", "huisnummer": 1},
+            headers={
+                "Authorization": f"Bearer {token}",
+                "X-Request-Timeout": "soon",
+                **common_headers,
+            },
+        )
+        assert response.status_code == 400
+        assert response.json()["detail"] == "De X-Request-Timeout header is ongeldig: soon."
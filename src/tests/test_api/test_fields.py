@@ -1,7 +1,12 @@
 import pytest
 
-from haal_centraal_proxy.bevragingen import fields
-from haal_centraal_proxy.bevragingen.fields import compact_fields_values, read_dataset_fields_files
+from haal_centraal_proxy.bevragingen import fields, scopes
+from haal_centraal_proxy.bevragingen.fields import (
+    FieldTree,
+    compact_fields_values,
+    get_null_skeleton,
+    read_dataset_fields_files,
+)
 
 
 class TestReadConfiguration:
@@ -21,11 +26,12 @@ class TestReadConfiguration:
         monkeypatch.setattr(fields, "CONFIG_DIR", tmp_path)
         scopes_for_values = read_dataset_fields_files("dataset_fields/role*.txt")
         assert scopes_for_values == {
-            "naam": {"role1"},
-            "adres": {"role1", "role2", "role3"},
-            "woonplaats": {"role1", "role2"},
-            "kinderen": {"role2", "role3"},
+            "naam": scopes.intern_scopes({"role1"}),
+            "adres": scopes.intern_scopes({"role1", "role2", "role3"}),
+            "woonplaats": scopes.intern_scopes({"role1", "role2"}),
+            "kinderen": scopes.intern_scopes({"role2", "role3"}),
         }
+        assert scopes.get_names(scopes_for_values["kinderen"]) == {"role2", "role3"}
 
 
 class TestCompactValues:
@@ -43,3 +49,98 @@ class TestCompactValues:
 
         assert compact_fields_values(["naam", "naamlanger"]) == ["naam", "naamlanger"]
         assert compact_fields_values(["naam.*", "naamlanger"]) == ["naam", "naamlanger"]
+        assert compact_fields_values(["naam*", "naam.voornaam", "naamlanger", "adres"]) == [
+            "naam",
+            "adres",
+        ]
+
+    def test_compact_fields_values_order(self):
+        """Prove that the wildcard fields come first, and the other fields keep their order."""
+        assert compact_fields_values(["adres", "naam.voornaam", "kinderen.*", "naam.*"]) == [
+            "kinderen",
+            "naam",
+            "adres",
+        ]
+        assert compact_fields_values(["naam.", "naam.*"]) == ["naam", "naam."]
+
+
+class TestFieldTree:
+    TREE = FieldTree.build(
+        [
+            "naam",
+            "naam.voornamen",
+            "naam.geslachtsnaam",
+            "adressering.adresregel1",
+            "burgerservicenummer",
+        ]
+    )
+
+    def test_membership(self):
+        """Prove that only listed fields are members, and wildcards need a subtree."""
+        assert list(self.TREE) == [
+            "naam",
+            "naam.voornamen",
+            "naam.geslachtsnaam",
+            "adressering.adresregel1",
+            "burgerservicenummer",
+        ]
+        assert "naam.voornamen" in self.TREE
+        assert "adressering" not in self.TREE
+        assert self.TREE.covers("naam.*")
+        assert self.TREE.covers("burgerservicenummer.*")  # a wildcard on a leaf field
+        assert not self.TREE.covers("adressering.*")  # parent is not a field
+        assert not self.TREE.covers("naam.voornamen.foo")
+
+    def test_expand(self):
+        """Prove that wildcards are expanded to the fields of the tree."""
+        assert self.TREE.expand("naam.*") == ["naam.voornamen", "naam.geslachtsnaam"]
+        assert self.TREE.expand("naam") == ["naam"]
+        assert self.TREE.expand("kinderen.*") == []
+        assert self.TREE.expand("kinderen") == []
+
+    def test_null_skeleton(self):
+        """Prove that the empty object is built for all fields."""
+        assert self.TREE.null_skeleton(array_fields=["adressering"]) == {
+            "naam": {"voornamen": None, "geslachtsnaam": None},
+            "adressering": [],
+            "burgerservicenummer": None,
+        }
+
+
+class TestNullSkeleton:
+    def test_fill(self):
+        """Prove that only the missing fields are inserted, as new objects for each item."""
+        skeleton = get_null_skeleton(
+            ("naam.voornamen", "naam.geslachtsnaam", "kinderen.naam.voornamen", "geslacht"),
+            ("kinderen",),
+        )
+        items = [
+            {"naam": {"voornamen": "Ronald"}, "kinderen": [{"naam": {}}]},
+            {"geslacht": {"code": "M"}},
+            {},
+        ]
+        skeleton.fill(items)
+        assert items == [
+            {
+                "naam": {"voornamen": "Ronald", "geslachtsnaam": None},
+                "kinderen": [{"naam": {"voornamen": None}}],
+                "geslacht": None,
+            },
+            {
+                "naam": {"voornamen": None, "geslachtsnaam": None},
+                "kinderen": [],
+                "geslacht": {"code": "M"},
+            },
+            {"naam": {"voornamen": None, "geslachtsnaam": None}, "kinderen": [], "geslacht": None},
+        ]
+        assert items[1]["naam"] is not items[2]["naam"]
+        assert items[1]["kinderen"] is not items[2]["kinderen"]
+
+        # The skeleton is reused for the same fields.
+        assert (
+            get_null_skeleton(
+                ("naam.voornamen", "naam.geslachtsnaam", "kinderen.naam.voornamen", "geslacht"),
+                ("kinderen",),
+            )
+            is skeleton
+        )
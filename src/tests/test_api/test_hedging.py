@@ -0,0 +1,168 @@
+import asyncio
+import threading
+import time
+
+import httpx
+import orjson
+import requests
+
+from haal_centraal_proxy.bevragingen.async_client import AsyncBrpClient
+from haal_centraal_proxy.bevragingen.bulkhead import Bulkhead
+from haal_centraal_proxy.bevragingen.client import BrpClient
+from haal_centraal_proxy.bevragingen.hedging import HedgingPolicy
+
+
+def _get_policy() -> HedgingPolicy:
+    """A policy that hedges after 50ms."""
+    policy = HedgingPolicy(min_samples=1, min_delay=0.05, budget_ratio=1.0)
+    policy.record(0.01)
+    return policy
+
+
+class TestHedgingPolicy:
+    """Prove that the hedged calls are limited."""
+
+    def test_delay_percentile(self):
+        """Prove that the delay follows the recent latencies."""
+        policy = HedgingPolicy(percentile=0.9, min_samples=10, min_delay=0)
+        for i in range(1, 10):
+            policy.record(i / 10)
+        assert policy.get_delay() is None  # not enough samples
+
+        policy.record(1.0)
+        assert policy.get_delay() == 0.9
+
+    def test_budget(self):
+        """Prove that the budget limits the extra load."""
+        policy = HedgingPolicy(budget_ratio=0.1)
+        assert policy.allow_hedge()
+        assert not policy.allow_hedge()
+
+        for _ in range(10):
+            policy.start()
+        assert policy.allow_hedge()
+        assert policy.get_stats() == {"hedges": 2, "budget_exhausted": 1, "delay": None}
+
+
+class TestHedgedCalls:
+    """Prove that the client uses the first response."""
+
+    def _post_slow_first(self, closed: list, threads: list | None = None, fail=False):
+        """A replacement for the ``_post()`` method, where the first call is slow."""
+        calls = []
+
+        def post(hc_request, timeout, stream=False):
+            # Not using requests_mock here, as it doesn't handle calls concurrently.
+            calls.append(hc_request)
+            call = len(calls)
+            if threads is not None:
+                threads.append(threading.current_thread())
+            if call == 1:
+                time.sleep(0.3)
+                if fail:
+                    raise requests.ReadTimeout("read timeout")
+            response = requests.Response()
+            response.status_code = 200
+            response._content = orjson.dumps({"personen": [], "call": call})
+            response.close = lambda: closed.append(call)
+            return response
+
+        return post
+
+    def test_sync_hedge(self, monkeypatch):
+        """Prove that a slow call is hedged by a second call,
+        whose response is used when the first call fails.
+        """
+        threads = []
+        policy = _get_policy()
+        bulkhead = Bulkhead("test", max_concurrent=2)
+        client = BrpClient(
+            "http://localhost:5010/personen", hedging_policy=policy, bulkhead=bulkhead
+        )
+        monkeypatch.setattr(client, "_post", self._post_slow_first([], threads, fail=True))
+
+        t0 = time.perf_counter()
+        response = client.call({"type": "RaadpleegMetBurgerservicenummer"}, hedge=True)
+        assert time.perf_counter() - t0 < 0.4  # no new attempt after the failure
+        assert response.json() == {"personen": [], "call": 2}
+        assert client.get_stats()["hedging"]["hedge_wins"] == 1
+        assert bulkhead.get_stats() == {"in_flight": 0, "max_in_flight": 2, "queue_depth": 0}
+
+        # Only the hedged call is made by the executor.
+        assert threads[0] is threading.current_thread()
+        assert threads[1] is not threading.current_thread()
+
+    def test_sync_hedge_unused(self, monkeypatch):
+        """Prove that the response of the first call is used when it succeeds.
+        The response of the hedged call is closed, and the latency of the slow call is recorded.
+        """
+        closed = []
+        policy = _get_policy()
+        bulkhead = Bulkhead("test", max_concurrent=2)
+        client = BrpClient(
+            "http://localhost:5010/personen", hedging_policy=policy, bulkhead=bulkhead
+        )
+        monkeypatch.setattr(client, "_post", self._post_slow_first(closed))
+
+        response = client.call({"type": "RaadpleegMetBurgerservicenummer"}, hedge=True)
+        assert response.json() == {"personen": [], "call": 1}
+        assert "hedge_wins" not in client.get_stats()["hedging"]
+        assert bulkhead.get_stats()["max_in_flight"] == 2
+
+        client.close()
+        client._hedging_executor.shutdown(wait=True)
+        assert closed == [2]
+        assert max(policy._latencies) >= 0.3
+        assert bulkhead.get_stats()["in_flight"] == 0
+
+    def test_sync_bulkhead_full(self, monkeypatch):
+        """Prove that no hedged call is made when the bulkhead has no free slot for it."""
+        policy = _get_policy()
+        client = BrpClient(
+            "http://localhost:5010/personen",
+            hedging_policy=policy,
+            bulkhead=Bulkhead("test", max_concurrent=1),
+        )
+        monkeypatch.setattr(client, "_post", self._post_slow_first([]))
+
+        response = client.call({"type": "RaadpleegMetBurgerservicenummer"}, hedge=True)
+        assert response.json() == {"personen": [], "call": 1}
+        assert policy.get_stats() == {"bulkhead_full": 1, "delay": 0.05}
+
+    def test_sync_no_hedge(self, requests_mock):
+        """Prove that calls are not hedged when this isn't requested."""
+        api_mock = requests_mock.post("http://localhost:5010/personen", json={"personen": []})
+        policy = _get_policy()
+        client = BrpClient("http://localhost:5010/personen", hedging_policy=policy)
+        client.call({"type": "ZoekMetPostcodeEnHuisnummer"})
+        assert api_mock.call_count == 1
+        assert policy.get_stats() == {"delay": 0.05}
+
+    def test_async_hedge(self):
+        """Prove that the slow async call is hedged, and cancelled."""
+        calls = []
+        cancelled = []
+
+        async def handler(request):
+            calls.append(request)
+            if len(calls) == 1:
+                try:
+                    await asyncio.sleep(0.5)
+                except asyncio.CancelledError:
+                    cancelled.append(request)
+                    raise
+            return httpx.Response(200, json={"personen": [], "call": len(calls)})
+
+        async def main():
+            client = AsyncBrpClient(
+                "http://localhost:5010/personen",
+                transport=httpx.MockTransport(handler),
+                hedging_policy=_get_policy(),
+            )
+            response = await client.call({"type": "RaadpleegMetBurgerservicenummer"}, hedge=True)
+            await asyncio.sleep(0)  # let the cancellation happen.
+            return response
+
+        response = asyncio.run(main())
+        assert response.json() == {"personen": [], "call": 2}
+        assert len(cancelled) == 1
@@ -1,3 +1,5 @@
+import dataclasses
+
 import pytest
 
 from haal_centraal_proxy.bevragingen.permissions import (
@@ -27,6 +29,41 @@ class TestParameterPolicy:
         assert policy.get_needed_scopes("adres.misc") == {"role-adres"}
         assert policy.get_needed_scopes("foobar") == {"default"}
 
+    def test_wildcards(self):
+        """Prove that the first matching wildcard is used, like the regex patterns did."""
+        policy = ParameterPolicy(
+            scopes_for_values={
+                "adres*": {"role-prefix"},
+                "adres.verblijf.*": {"role-verblijf"},
+                "adres.*": {"role-adres"},
+                "kinderen.*": {"role-kinderen"},
+            },
+            default_scope={"default"},
+        )
+        assert policy.get_needed_scopes("adres.verblijf.straat") == {"role-prefix"}
+        assert policy.get_needed_scopes("kinderen.naam.voornamen") == {"role-kinderen"}
+        assert policy.get_needed_scopes("kinderen.") == {"default"}
+        assert policy.get_needed_scopes("kinderen..") == {"role-kinderen"}
+        assert policy.get_needed_scopes("kinderen") == {"default"}
+
+        policy = ParameterPolicy(
+            scopes_for_values={
+                "adres.verblijf.*": {"role-verblijf"},
+                "adres.*": {"role-adres"},
+            },
+        )
+        assert policy.get_needed_scopes("adres.verblijf.straat") == {"role-verblijf"}
+        assert policy.get_needed_scopes("adres.label") == {"role-adres"}
+
+    def test_compiled_is_immutable(self):
+        """Prove that the compiled lookup tables can't be changed by accident."""
+        compiled = ParameterPolicy(scopes_for_values={"naam": {"role1"}}).compile()
+        assert compiled.get_needed_scopes("naam") == frozenset({"role1"})
+        with pytest.raises(dataclasses.FrozenInstanceError):
+            compiled.default_scope = set()
+        with pytest.raises(TypeError):
+            compiled.exact["naam"] = set()
+
     def test_no_default_scope(self):
         """Prove that a parameter is denied when there is no corresponding value."""
         policy = ParameterPolicy(
@@ -0,0 +1,133 @@
+import pytest
+import requests
+from django.urls import reverse
+
+from haal_centraal_proxy.bevragingen.client import BrpClient
+from haal_centraal_proxy.bevragingen.exceptions import BadGateway, ServiceUnavailable
+from haal_centraal_proxy.bevragingen.retries import RetryBudget, RetryPolicy
+from tests.utils import build_jwt_token
+
+
+class TestRetryPolicy:
+    """Prove that the retries are limited."""
+
+    def test_backoff(self, monkeypatch):
+        """Prove that the delays use full jitter within the exponential backoff."""
+        monkeypatch.setattr("random.uniform", lambda low, high: high)
+        policy = RetryPolicy(5, backoff=0.1, max_backoff=0.3)
+        assert [policy.get_delay(attempt, t0=0) for attempt in range(1, 6)] == [
+            0.1,
+            0.2,
+            0.3,
+            0.3,
+            None,  # attempts exhausted
+        ]
+
+    def test_deadline(self, monkeypatch):
+        """Prove that no retries are made after the deadline."""
+        monkeypatch.setattr("time.perf_counter_ns", lambda: 2_000_000_000)
+        policy = RetryPolicy(3, backoff=0.1, deadline=1.0)
+        assert policy.get_delay(1, t0=0) is None
+        assert policy.get_timeout(t0=1_500_000_000, timeout=(0.2, 60)) == (
+            0.2,
+            pytest.approx(0.5),
+        )
+
+        # The deadline of the caller can be shorter.
+        assert policy.get_timeout(t0=1_500_000_000, timeout=(5, 60), deadline=0.6) == (
+            pytest.approx(0.1),
+            pytest.approx(0.1),
+        )
+        assert policy.get_stats() == {"deadline_exceeded": 1}
+
+    def test_budget(self):
+        """Prove that the budget only allows retries for a fraction of the requests."""
+        budget = RetryBudget(ratio=0.5, min_retries=1)
+        policy = RetryPolicy(3, backoff=0, budget=budget)
+        policy.start()
+        assert policy.get_delay(1, t0=0) == 0
+        assert policy.get_delay(1, t0=0) is None  # budget exhausted
+
+        policy.start()
+        policy.start()
+        assert policy.get_delay(1, t0=0) == 0
+        assert policy.get_stats() == {"retries": 2, "budget_exhausted": 1, "budget": 0}
+
+
+class TestClientRetries:
+    """Prove that the client retries temporary failures."""
+
+    def test_retry_status(self, requests_mock, caplog):
+        """Prove that a 503 from the gateway is retried, and the retries are reported."""
+        api_mock = requests_mock.post(
+            "http://localhost:5010/personen",
+            [
+                {"status_code": 503, "text": "Service Unavailable"},
+                {"json": {"personen": []}},
+            ],
+        )
+        client = BrpClient(
+            "http://localhost:5010/personen", retry_policy=RetryPolicy(3, backoff=0)
+        )
+        response = client.call({"type": "RaadpleegMetBurgerservicenummer"})
+
+        assert response.json() == {"personen": []}
+        assert response.retries == 1
+        assert api_mock.call_count == 2
+        assert "retries: 1" in caplog.messages[-1]
+
+    def test_retry_connection_error(self, requests_mock):
+        """Prove that connection errors are retried, until the attempts are exhausted."""
+        api_mock = requests_mock.post(
+            "http://localhost:5010/personen", exc=requests.ConnectionError("reset")
+        )
+        client = BrpClient(
+            "http://localhost:5010/personen", retry_policy=RetryPolicy(3, backoff=0)
+        )
+        with pytest.raises(ServiceUnavailable) as exc_info:
+            client.call({"type": "RaadpleegMetBurgerservicenummer"})
+
+        assert exc_info.value.retries == 2
+        assert api_mock.call_count == 3
+
+    def test_no_retry(self, requests_mock):
+        """Prove that other errors are not retried."""
+        api_mock = requests_mock.post(
+            "http://localhost:5010/personen", status_code=500, text="Internal Server Error"
+        )
+        client = BrpClient(
+            "http://localhost:5010/personen", retry_policy=RetryPolicy(3, backoff=0)
+        )
+        with pytest.raises(BadGateway) as exc_info:
+            client.call({"type": "RaadpleegMetBurgerservicenummer"})
+
+        assert exc_info.value.retries == 0
+        assert api_mock.call_count == 1
+
+    def test_audit_log(self, api_client, requests_mock, caplog, common_headers, settings):
+        """Prove that the retries are included in the audit log."""
+        settings.BRP_RETRY_ATTEMPTS = 3
+        settings.BRP_RETRY_BACKOFF = 0
+        requests_mock.post(
+            "/lap/api/brp/personen",
+            [
+                {"status_code": 502, "text": "Bad Gateway"},
+                {"json": {"type": "ZoekMetPostcodeEnHuisnummer", "personen": []}},
+            ],
+        )
+        token = build_jwt_token(
+            [
+                "benk-brp-personen-api",
+                "benk-brp-zoekvraag-postcode-huisnummer",
+                "benk-brp-gegevensset-1",
+            ]
+        )
+        response = api_client.post(
+            reverse("brp-personen"),
+            {"type": "ZoekMetPostcodeEnHuisnummer", "postcode": "1074VE", "huisnummer": 1},
+            headers={"Authorization": f"Bearer {token}", **common_headers},
+        )
+        assert response.status_code == 200, response.data
+
+        record = next(r for r in caplog.records if r.message.startswith("Access granted"))
+        assert record.retries == 1
@@ -0,0 +1,16 @@
+from haal_centraal_proxy.bevragingen import scopes
+
+
+def test_masks():
+    """Prove that scope names are given a bit, and can be found back."""
+    mask1 = scopes.intern_scopes(["test-scope1"])
+    mask2 = scopes.intern_scopes(["test-scope1", "test-scope2"])
+    assert mask1 & mask2 == mask1
+    assert scopes.intern_scopes([]) == scopes.NO_SCOPE_NEEDED
+    assert scopes.get_names(mask2) == {"test-scope1", "test-scope2"}
+
+    # Unknown scopes of the user are ignored, and users always have the "no scope" bit.
+    user_mask = scopes.get_mask({"test-scope2", "unknown-scope"})
+    assert user_mask == (mask2 & ~mask1) | scopes.NO_SCOPE_NEEDED
+    assert not user_mask & mask1
+    assert user_mask & scopes.intern_scopes([])
@@ -0,0 +1,49 @@
+import orjson
+import pytest
+
+from haal_centraal_proxy.bevragingen.streaming import ItemScanner, iter_items
+
+RESPONSE = {
+    "type": "ZoekMetPostcodeEnHuisnummer",
+    "_links": {"self": {"href": "/personen", "title": "personen: [1]"}},
+    "personen": [
+        {"naam": {"voornamen": 'Ro"nald', "geslachtsnaam": "Moes"}, "kinderen": [{}, {}]},
+        {"naam": {"geslachtsnaam": "Jansen, van\\"}, "burgerservicenummer": "999993252"},
+    ],
+    "overig": [1, 2],
+}
+
+
+class TestItemScanner:
+    """Prove that the items are found while the data is received."""
+
+    @pytest.mark.parametrize("chunk_size", [1, 3, 16, 10_000])
+    def test_chunks(self, chunk_size):
+        """Prove that items are parsed, regardless where the data is split."""
+        data = orjson.dumps(RESPONSE, option=orjson.OPT_INDENT_2)
+        scanner = ItemScanner("personen")
+        items = []
+        for i in range(0, len(data), chunk_size):
+            items.extend(scanner.feed(data[i : i + chunk_size]))
+
+        assert items == RESPONSE["personen"]
+        assert scanner.close() == {**RESPONSE, "personen": []}
+
+    def test_items_released(self):
+        """Prove that the data of completed items is not kept in memory."""
+        scanner = ItemScanner("personen")
+        scanner.feed(b'{"personen": [{"a": 1}, {"b": ')
+        assert bytes(scanner._buffer) == b' {"b": '
+
+    def test_no_items(self):
+        """Prove that a response without the items field is returned completely."""
+        assert list(iter_items([b'{"personen": null, "bewoningen": [{}]}'], "personen")) == []
+
+        scanner = ItemScanner("personen")
+        assert scanner.feed(b'{"bewoningen": [{"a": "personen"}]}') == []
+        assert scanner.close() == {"bewoningen": [{"a": "personen"}]}
+
+    def test_incomplete(self):
+        """Prove that truncated data is detected."""
+        with pytest.raises(ValueError):
+            list(iter_items([b'{"personen": [{"a": 1}'], "personen"))
@@ -0,0 +1,141 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from haal_centraal_proxy.bevragingen.tokens import TokenRefresher, TokenStore
+
+
+def make_token(expires_in=3600):
+    return {
+        "token_type": "bearer",
+        "access_token": f"token-{time.perf_counter_ns()}",
+        "expires_in": expires_in,
+        "scope": "test",
+    }
+
+
+class TestTokenStore:
+    """Prove that the OAuth token is shared between workers."""
+
+    def test_shared_between_workers(self, tmp_path):
+        """Prove that a second worker (a separate store on the same file) reuses the token."""
+        calls = []
+
+        def fetch():
+            calls.append(1)
+            time.sleep(0.05)  # let other threads pile up.
+            return make_token()
+
+        # Each store simulates a worker process.
+        stores = [TokenStore(tmp_path / "token.json", key="test") for _ in range(4)]
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            tokens = list(executor.map(lambda i: stores[i % 4].get_token(fetch), range(16)))
+
+        assert len(calls) == 1
+        assert len({token["access_token"] for token in tokens}) == 1
+        assert sum(store.counters.as_dict().get("refreshes", 0) for store in stores) == 1
+
+        # Different credentials don't share the token
+        other = TokenStore(tmp_path / "token.json", key="other")
+        assert other.read() is None
+
+    def test_get_fresh_token(self, tmp_path):
+        """Prove that the token kept in memory is provided without accessing the file."""
+        store = TokenStore(tmp_path / "token.json", key="test")
+        assert store.get_fresh_token() is None
+
+        token = make_token()
+        store.save(token)
+        (tmp_path / "token.json").unlink()
+        assert store.get_fresh_token()["access_token"] == token["access_token"]
+
+        store.save(make_token(expires_in=store.refresh_margin))  # needs refresh
+        assert store.get_fresh_token() is None
+        assert store.counters.as_dict() == {"hits": 1}
+
+    def test_stale_token_while_refreshing(self, tmp_path):
+        """Prove that a still valid token is used while another worker refreshes it."""
+        store = TokenStore(tmp_path / "token.json", key="test")
+        old_token = make_token(expires_in=store.refresh_margin)  # needs refresh
+        store.save(old_token)
+
+        other = TokenStore(tmp_path / "token.json", key="test")
+        with other._lock(blocking=True):
+            token = store.get_token(fetch=pytest.fail)
+
+        assert token["access_token"] == old_token["access_token"]
+        assert store.counters.as_dict() == {"stale_hits": 1}
+
+    def test_refresh_failure(self, tmp_path):
+        """Prove that refresh errors are only raised when the token can't be used anymore."""
+
+        def fetch():
+            raise OSError("connection failed")
+
+        store = TokenStore(tmp_path / "token.json", key="test")
+        store.save(make_token(expires_in=store.refresh_margin))
+        assert store.get_token(fetch)
+        assert store.counters.as_dict() == {"refresh_errors": 1}
+
+        store.save(make_token(expires_in=0))
+        with pytest.raises(OSError):
+            store.get_token(fetch)
+
+    def test_symlinks_not_followed(self, tmp_path):
+        """Prove that symlinks placed by another user are not followed."""
+        other = tmp_path / "other.json"
+        TokenStore(other, key="test").save(make_token())
+        (tmp_path / "private").mkdir(mode=0o700)
+        path = tmp_path / "private" / "token.json"
+        path.symlink_to(other)
+        (tmp_path / "private" / "token.json.lock").symlink_to(tmp_path / "victim")
+
+        store = TokenStore(path, key="test")
+        assert store.read() is None
+        with pytest.raises(OSError), store._lock(blocking=True):
+            pass
+        assert not (tmp_path / "victim").exists()
+
+        # Saving replaces the symlink, not the file it points to.
+        store.save(make_token())
+        assert not path.is_symlink()
+        assert path.stat().st_mode & 0o777 == 0o600
+        assert store.read()["access_token"] != TokenStore(other, key="test").read()["access_token"]
+        assert sorted(p.name for p in path.parent.iterdir()) == ["token.json", "token.json.lock"]
+
+
+class TestTokenRefresher:
+    """Prove that the token is renewed before requests need it."""
+
+    def test_background_renewal(self, tmp_path, monkeypatch):
+        """Prove that the token is renewed before expiry, and failures are retried."""
+        monkeypatch.setattr(TokenRefresher, "jitter", 0)
+        monkeypatch.setattr(TokenRefresher, "retry_delay", 0.01)
+        failures = [OSError("connection failed")]
+
+        def fetch():
+            if failures:
+                raise failures.pop()
+            return make_token()
+
+        store = TokenStore(tmp_path / "token.json", key="test")
+        old_token = make_token(expires_in=store.refresh_margin + 0.1)
+        store.save(old_token)
+        store.start_refresher(fetch)
+        try:
+            for _ in range(100):
+                if store.counters.as_dict().get("background_renewals"):
+                    break
+                time.sleep(0.01)
+        finally:
+            store.stop_refresher()
+
+        assert store.counters.as_dict() == {
+            "background_errors": 1,
+            "background_renewals": 1,
+            "refreshes": 1,
+        }
+        token = store.read()
+        assert token["access_token"] != old_token["access_token"]
+        assert store.is_fresh(token)
@@ -0,0 +1,244 @@
+import datetime
+import ssl
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import httpx
+import orjson
+import pytest
+import requests
+from cryptography import x509
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import ec
+from cryptography.x509.oid import NameOID
+from requests.adapters import HTTPAdapter
+
+from haal_centraal_proxy.bevragingen.client import BrpClient
+from haal_centraal_proxy.bevragingen.transports import (
+    ConnectionStats,
+    HTTP2Adapter,
+    TLSAdapter,
+    get_ssl_context,
+)
+
+
+@pytest.fixture
+def tls_server(tmp_path):
+    """Run a local HTTPS server, with a self-signed certificate in a CA folder."""
+    key = ec.generate_private_key(ec.SECP256R1())
+    name = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, "localhost")])
+    now = datetime.datetime.now(datetime.UTC)
+    cert = (
+        x509.CertificateBuilder()
+        .subject_name(name)
+        .issuer_name(name)
+        .public_key(key.public_key())
+        .serial_number(x509.random_serial_number())
+        .not_valid_before(now - datetime.timedelta(days=1))
+        .not_valid_after(now + datetime.timedelta(days=1))
+        .add_extension(x509.SubjectAlternativeName([x509.DNSName("localhost")]), critical=False)
+        .add_extension(x509.BasicConstraints(ca=True, path_length=None), critical=True)
+        .sign(key, hashes.SHA256())
+    )
+    ca_dir = tmp_path / "ca"
+    ca_dir.mkdir()
+    (ca_dir / "localhost.crt").write_bytes(cert.public_bytes(serialization.Encoding.PEM))
+    key_file = tmp_path / "localhost.key"
+    key_file.write_bytes(
+        key.private_bytes(
+            serialization.Encoding.PEM,
+            serialization.PrivateFormat.PKCS8,
+            serialization.NoEncryption(),
+        )
+    )
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            self.rfile.read(int(self.headers["Content-Length"]))
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", "2")
+            self.send_header("Connection", "close")  # each call needs a new connection.
+            self.end_headers()
+            self.wfile.write(b"{}")
+
+        def log_message(self, *args):
+            pass
+
+    server_context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+    server_context.load_cert_chain(ca_dir / "localhost.crt", key_file)
+    server = ThreadingHTTPServer(("localhost", 0), Handler)
+    server.socket = server_context.wrap_socket(server.socket, server_side=True)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"https://localhost:{server.server_port}", ca_dir
+    server.shutdown()
+    server.server_close()
+
+
+class TestTLSAdapter:
+    """Prove that the connections share a single SSL context."""
+
+    def test_shared_ssl_context(self, tmp_path):
+        """Prove that the certificates are loaded once per process."""
+        client1 = BrpClient("https://localhost:8443/personen", ca_dir=tmp_path)
+        client2 = BrpClient("https://localhost:8443/bewoningen", ca_dir=tmp_path)
+        adapter = client1._session.get_adapter("https://localhost:8443/personen")
+        assert isinstance(adapter, TLSAdapter)
+        assert adapter.ssl_context is get_ssl_context(None, None, tmp_path)
+        assert client2._ssl_context is adapter.ssl_context
+
+    def test_other_settings_denied(self, tmp_path, monkeypatch):
+        """Prove that a request can't silently use other certificates than the SSL context."""
+        client = BrpClient("https://localhost:8443/personen", ca_dir=tmp_path)
+        url = "https://localhost:8443/personen"
+        with pytest.raises(ValueError, match="verify=False"):
+            client._session.post(url, json={}, verify=False)
+        with pytest.raises(ValueError, match="cert="):
+            client._session.post(url, json={}, cert=str(tmp_path / "client.crt"))
+
+        # The CA bundle is changed after the SSL context was created.
+        monkeypatch.setenv("REQUESTS_CA_BUNDLE", str(tmp_path / "other.pem"))
+        with pytest.raises(ValueError, match="other.pem"):
+            client._session.post(url, json={})
+
+    def test_session_resumption(self, tls_server):
+        """Prove that new connections resume the TLS session of the previous connection."""
+        server_url, ca_dir = tls_server
+        client = BrpClient(f"{server_url}/personen", ca_dir=ca_dir)
+        for _ in range(3):
+            response = client._session.post(f"{server_url}/personen", json={}, timeout=5)
+            assert response.json() == {}
+
+        stats = client.get_stats()["tls"]
+        assert stats["handshakes"] == 3
+        assert stats["resumed"] == 2
+        assert stats["handshake_time_avg"] > 0
+
+
+class TestHTTP2Adapter:
+    """Prove that the HTTP/2 transport works as a drop-in replacement for requests."""
+
+    def test_mounted_for_endpoint(self):
+        """Prove that only the endpoint uses HTTP/2, the OAuth calls use the default adapter."""
+        client = BrpClient(
+            "https://brp.example.com/personen",
+            oauth_endpoint_url="https://auth.example.com/token",
+            oauth_client_id="client",
+            oauth_client_secret="secret",
+            http2=True,
+        )
+        session = client._session
+        assert isinstance(session.get_adapter("https://brp.example.com/personen"), HTTP2Adapter)
+        assert isinstance(session.get_adapter("https://auth.example.com/token"), HTTPAdapter)
+        assert client.get_stats()["connections"] == {
+            "in_flight": 0,
+            "max_in_flight": 0,
+            "streams_per_connection": 0,
+        }
+
+    def test_send(self):
+        """Prove that the session headers are passed, and the response is translated."""
+        requests_seen = []
+
+        def handler(request: httpx.Request):
+            requests_seen.append(request)
+            return httpx.Response(
+                200, json={"personen": []}, headers={"Content-Type": "application/json"}
+            )
+
+        session = requests.Session()
+        adapter = HTTP2Adapter(transport=httpx.MockTransport(handler))
+        session.mount("https://brp.example.com/", adapter)
+        response = session.post(
+            "https://brp.example.com/personen",
+            json={"type": "RaadpleegMetBurgerservicenummer"},
+            headers={"Authorization": "Bearer secret"},
+            timeout=(5, 60),
+        )
+
+        assert response.status_code == 200
+        assert response.reason == "OK"
+        assert response.json() == {"personen": []}
+        assert response.headers["content-type"] == "application/json"
+
+        request = requests_seen[0]
+        assert request.headers["Authorization"] == "Bearer secret"
+        assert orjson.loads(request.content) == {"type": "RaadpleegMetBurgerservicenummer"}
+        assert request.extensions["timeout"] == {
+            "connect": 5,
+            "read": 60,
+            "write": 60,
+            "pool": 60,
+        }
+        assert adapter.stats.as_dict()["max_in_flight"] == 1
+
+    def test_stream(self):
+        """Prove that stream=True leaves the body to be read incrementally."""
+        chunks_sent = []
+
+        def body():
+            for i in range(3):
+                chunks_sent.append(i)
+                yield b'{"burgerservicenummer": "99999%d"}\n' % i
+            raise httpx.ReadError("connection reset")
+
+        def handler(request: httpx.Request):
+            return httpx.Response(200, content=body())
+
+        session = requests.Session()
+        session.mount("https://", HTTP2Adapter(transport=httpx.MockTransport(handler)))
+        response = session.post("https://brp.example.com/personen", json={}, stream=True)
+        assert chunks_sent == []
+
+        chunks = response.iter_content(chunk_size=None)
+        assert orjson.loads(next(chunks)) == {"burgerservicenummer": "999990"}
+        assert chunks_sent == [0]
+        with pytest.raises(requests.exceptions.ChunkedEncodingError):
+            list(chunks)
+        assert chunks_sent == [0, 1, 2]
+        response.close()
+
+    def test_other_settings_denied(self):
+        """Prove that verify/cert settings of the request can't bypass the shared SSL context."""
+        session = requests.Session()
+        session.mount("https://", HTTP2Adapter(transport=httpx.MockTransport(pytest.fail)))
+        with pytest.raises(ValueError, match="verify=False"):
+            session.post("https://brp.example.com/personen", json={}, verify=False)
+        with pytest.raises(ValueError, match="cert="):
+            session.post("https://brp.example.com/personen", json={}, cert="other.pem")
+
+    @pytest.mark.parametrize(
+        ["exception", "expected"],
+        [
+            (httpx.ConnectTimeout("timeout"), requests.ConnectTimeout),
+            (httpx.ReadTimeout("timeout"), requests.ReadTimeout),
+            (httpx.ConnectError("refused"), requests.ConnectionError),
+        ],
+    )
+    def test_errors(self, exception, expected):
+        """Prove that httpx errors become the errors the client expects from requests."""
+
+        def handler(request: httpx.Request):
+            raise exception
+
+        session = requests.Session()
+        session.mount("https://", HTTP2Adapter(transport=httpx.MockTransport(handler)))
+        with pytest.raises(expected):
+            session.post("https://brp.example.com/personen", json={})
+
+
+def test_connection_stats():
+    """Prove that the trace events are counted as streams per connection."""
+    stats = ConnectionStats()
+    stats.trace("connection.connect_tcp.complete", {})
+    for _ in range(5):
+        stats.trace("http2.send_request_headers.started", {})
+
+    assert stats.as_dict() == {
+        "connections": 1,
+        "http2_streams": 5,
+        "in_flight": 0,
+        "max_in_flight": 0,
+        "streams_per_connection": 5.0,
+    }
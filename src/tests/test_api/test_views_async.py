@@ -0,0 +1,271 @@
+import asyncio
+
+import httpx
+import orjson
+import pytest
+from django.urls import path
+
+from haal_centraal_proxy.bevragingen import views
+from haal_centraal_proxy.bevragingen.async_client import AsyncBrpClient
+from haal_centraal_proxy.bevragingen.authentication import JWTAuthentication
+from haal_centraal_proxy.bevragingen.bulkhead import get_bulkhead
+from haal_centraal_proxy.bevragingen.circuitbreaker import get_circuit_breaker
+from haal_centraal_proxy.bevragingen.views import base
+from tests.utils import build_jwt_token
+
+urlpatterns = [
+    path("v1/personen", views.BrpPersonenAsyncView.as_view(), name="brp-personen"),
+    path("v1/personen/batch", views.BrpPersonenAsyncBatchView.as_view(), name="brp-batch"),
+    path("health/personen", views.BrpPersonenAsyncHealthView.as_view(), name="brp-health"),
+]
+
+RESPONSE_BSN = {
+    "type": "RaadpleegMetBurgerservicenummer",
+    "personen": [{"burgerservicenummer": "999993367", "naam": {"voornamen": "Ronald"}}],
+}
+
+
+@pytest.fixture
+def upstream(monkeypatch) -> list[httpx.Request]:
+    """Mock the Haal Centraal endpoint for the async client."""
+    requests = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        requests.append(request)
+        hc_request = orjson.loads(request.content)
+        if hc_request["type"] == "healthcheck":
+            return httpx.Response(
+                400,
+                json={
+                    "title": "Foute parameter",
+                    "detail": "De foutieve parameter(s) zijn: type.",
+                },
+                headers={"content-type": "application/problem+json"},
+            )
+        return httpx.Response(200, json=RESPONSE_BSN)
+
+    # The clients are still retrieved from the registry of the event loop,
+    # only the transport is replaced.
+    get_client_kwargs = base.AsyncClientMixin.get_client_kwargs
+    monkeypatch.setattr(
+        base.AsyncClientMixin,
+        "get_client_kwargs",
+        lambda self: {**get_client_kwargs(self), "transport": httpx.MockTransport(handler)},
+    )
+    return requests
+
+
+@pytest.mark.urls(__name__)
+class TestAsyncViews:
+    """Prove that the async views behave the same as the sync views."""
+
+    def test_view_is_async(self):
+        """Prove that Django will run the view as coroutine."""
+        assert views.BrpPersonenAsyncView.view_is_async
+        assert views.BrpPersonenAsyncHealthView.view_is_async
+        assert views.BrpPersonenAsyncBatchView.view_is_async
+        assert not views.BrpPersonenView.view_is_async
+
+    def test_checks_in_thread(self, api_client, upstream, common_headers, monkeypatch):
+        """Prove that the authentication and permission checks don't block the event loop."""
+        on_event_loop = []
+        authenticate = JWTAuthentication.authenticate
+
+        def _authenticate(self, request):
+            try:
+                asyncio.get_running_loop()
+            except RuntimeError:
+                on_event_loop.append(False)
+            else:
+                on_event_loop.append(True)
+            return authenticate(self, request)
+
+        monkeypatch.setattr(JWTAuthentication, "authenticate", _authenticate)
+        token = build_jwt_token(
+            ["benk-brp-personen-api", "benk-brp-zoekvraag-bsn", "benk-brp-gegevensset-1"]
+        )
+        response = api_client.post(
+            "/v1/personen",
+            {"type": "RaadpleegMetBurgerservicenummer", "burgerservicenummer": ["999993367"]},
+            headers={"Authorization": f"Bearer {token}", **common_headers},
+        )
+        assert response.status_code == 200, response.data
+        assert on_event_loop == [False]
+
+    def test_bsn_search(self, api_client, upstream, common_headers, caplog):
+        """Prove that the request is validated, transformed and logged like the sync view."""
+        token = build_jwt_token(
+            ["benk-brp-personen-api", "benk-brp-zoekvraag-bsn", "benk-brp-gegevensset-1"]
+        )
+        response = api_client.post(
+            "/v1/personen",
+            {"type": "RaadpleegMetBurgerservicenummer", "burgerservicenummer": ["999993367"]},
+            headers={"Authorization": f"Bearer {token}", **common_headers},
+        )
+        assert response.status_code == 200, response.data
+        assert response.json() == RESPONSE_BSN
+        assert (
+            response["Cache-Control"] == "max-age=0, no-cache, no-store, must-revalidate, private"
+        )
+
+        # Fields parameter is added, like the sync view does.
+        hc_request = orjson.loads(upstream[0].content)
+        assert hc_request["fields"]
+        assert hc_request["gemeenteVanInschrijving"] == "0363"
+        assert any(
+            m.endswith("burgerservicenummer=999993367") for m in caplog.messages
+        ), caplog.messages
+
+    def test_split_bsn_list(self, api_client, upstream, common_headers):
+        """Prove that large lists of BSN's are split into concurrent calls."""
+        token = build_jwt_token(
+            ["benk-brp-personen-api", "benk-brp-zoekvraag-bsn", "benk-brp-gegevensset-1"]
+        )
+        response = api_client.post(
+            "/v1/personen",
+            {
+                "type": "RaadpleegMetBurgerservicenummer",
+                "burgerservicenummer": [f"{i:09d}" for i in range(25)],
+            },
+            headers={"Authorization": f"Bearer {token}", **common_headers},
+        )
+        assert response.status_code == 200, response.data
+        assert len(upstream) == 2
+        assert len(response.json()["personen"]) == 2  # one person per mocked response
+
+    def test_batch(self, api_client, upstream, common_headers):
+        """Prove that the async batch view performs each query."""
+        token = build_jwt_token(
+            ["benk-brp-personen-api", "benk-brp-zoekvraag-bsn", "benk-brp-gegevensset-1"]
+        )
+        response = api_client.post(
+            "/v1/personen/batch",
+            [
+                {"type": "RaadpleegMetBurgerservicenummer", "burgerservicenummer": ["999993367"]},
+                {"type": "ZoekMetPostcodeEnHuisnummer", "postcode": "1074VE", "huisnummer": 1},
+            ],
+            headers={"Authorization": f"Bearer {token}", **common_headers},
+        )
+        assert response.status_code == 200, response.data
+        results = response.json()["results"]
+        assert results[0] == {"status": 200, "response": RESPONSE_BSN}
+        assert results[1]["status"] == 403
+        assert len(upstream) == 1
+
+    @pytest.mark.filterwarnings("ignore:StreamingHttpResponse must consume")
+    def test_ndjson(self, api_client, upstream, common_headers):
+        """Prove that the async view streams the items of the response."""
+        token = build_jwt_token(
+            ["benk-brp-personen-api", "benk-brp-zoekvraag-bsn", "benk-brp-gegevensset-1"]
+        )
+        response = api_client.post(
+            "/v1/personen?_format=ndjson",
+            {"type": "RaadpleegMetBurgerservicenummer", "burgerservicenummer": ["999993367"]},
+            headers={"Authorization": f"Bearer {token}", **common_headers},
+        )
+        assert response.status_code == 200
+        assert response.is_async
+        lines = b"".join(response).splitlines()  # consumes the async iterator
+        assert [orjson.loads(line) for line in lines] == RESPONSE_BSN["personen"]
+
+    @pytest.mark.filterwarnings("ignore:StreamingHttpResponse must consume")
+    def test_batch_ndjson(self, api_client, upstream, common_headers):
+        """Prove that the async batch view can stream the results."""
+        token = build_jwt_token(
+            ["benk-brp-personen-api", "benk-brp-zoekvraag-bsn", "benk-brp-gegevensset-1"]
+        )
+        query = {"type": "RaadpleegMetBurgerservicenummer", "burgerservicenummer": ["999993367"]}
+        response = api_client.post(
+            "/v1/personen/batch?_format=ndjson",
+            [query, query],
+            headers={"Authorization": f"Bearer {token}", **common_headers},
+        )
+        assert response.status_code == 200
+        assert response.is_async
+        lines = b"".join(response).splitlines()  # consumes the async iterator
+        assert [orjson.loads(line) for line in lines] == [
+            {"status": 200, "response": RESPONSE_BSN}
+        ] * 2
+
+    @pytest.mark.filterwarnings("ignore:StreamingHttpResponse must consume")
+    def test_ndjson_broken_stream(self, api_client, caplog, common_headers, monkeypatch, settings):
+        """Prove that a connection that breaks while streaming is logged as a failed call,
+        and the circuit breaker records the failure afterwards.
+        """
+        settings.BRP_BULKHEAD = True
+        settings.BRP_CIRCUIT_BREAKER = True
+
+        async def body():
+            yield b'{"type": "RaadpleegMetBurgerservicenummer", "personen": ['
+            raise httpx.ReadError("connection reset by peer")
+
+        get_client_kwargs = base.AsyncClientMixin.get_client_kwargs
+        transport = httpx.MockTransport(lambda request: httpx.Response(200, content=body()))
+        monkeypatch.setattr(
+            base.AsyncClientMixin,
+            "get_client_kwargs",
+            lambda self: {**get_client_kwargs(self), "transport": transport},
+        )
+        token = build_jwt_token(
+            ["benk-brp-personen-api", "benk-brp-zoekvraag-bsn", "benk-brp-gegevensset-1"]
+        )
+        response = api_client.post(
+            "/v1/personen?_format=ndjson",
+            {"type": "RaadpleegMetBurgerservicenummer", "burgerservicenummer": ["999993367"]},
+            headers={"Authorization": f"Bearer {token}", **common_headers},
+        )
+        assert response.status_code == 200
+        with pytest.raises(httpx.ReadError):
+            b"".join(response)
+
+        endpoint_url = views.BrpPersonenAsyncView.endpoint_url
+        assert get_bulkhead(endpoint_url).get_stats()["in_flight"] == 0
+        assert get_circuit_breaker(endpoint_url).get_stats()["failure_rate"] == 1
+        records = [r for r in caplog.records if r.message.startswith("Access granted")]
+        assert len(records) == 1
+        assert "connection reset by peer" in records[0].exception
+
+    def test_permission_denied(self, api_client, upstream, common_headers):
+        """Prove that the permission checks still happen."""
+        token = build_jwt_token(["benk-brp-personen-api", "benk-brp-gegevensset-1"])
+        response = api_client.post(
+            "/v1/personen",
+            {"type": "RaadpleegMetBurgerservicenummer", "burgerservicenummer": ["999993367"]},
+            headers={"Authorization": f"Bearer {token}", **common_headers},
+        )
+        assert response.status_code == 403, response.data
+        assert response.json()["code"] == "permissionDenied"
+        assert not upstream
+
+    def test_health(self, api_client, upstream):
+        """Prove that the health check works."""
+        response = api_client.get("/health/personen")
+        assert response.status_code == 200, response.data
+        assert response.json()["success"] is True
+
+
+class TestAsyncBrpClient:
+    """Prove that the async client translates errors like the sync client."""
+
+    @pytest.mark.parametrize(
+        ["status_code", "expected_status"],
+        [(401, 502), (500, 502), (404, 404)],
+    )
+    def test_errors(self, status_code, expected_status):
+        """Prove that errors are translated into the same exceptions."""
+
+        def handler(request):
+            return httpx.Response(
+                status_code,
+                json={"title": "error", "detail": "error"},
+                headers={"content-type": "application/problem+json"},
+            )
+
+        client = AsyncBrpClient(
+            "http://localhost:5010/personen", transport=httpx.MockTransport(handler)
+        )
+        with pytest.raises(Exception) as exc_info:
+            asyncio.run(client.call({"type": "RaadpleegMetBurgerservicenummer"}))
+
+        assert exc_info.value.status_code == expected_status
+        assert exc_info.value.__cause__.response.status_code == status_code
@@ -0,0 +1,110 @@
+import orjson
+from django.urls import reverse
+
+from tests.utils import build_jwt_token
+
+RESPONSE_POSTCODE = {
+    "type": "ZoekMetPostcodeEnHuisnummer",
+    "personen": [{"naam": {"geslachtsnaam": "Moes"}, "burgerservicenummer": "999993240"}],
+}
+
+
+class TestBatchView:
+    """Prove that the batch view handles each query like a separate request."""
+
+    def test_batch(self, api_client, requests_mock, caplog, common_headers):
+        """Prove that each query has its own result, error and audit logging."""
+        api_mock = requests_mock.post("/lap/api/brp/personen", json=RESPONSE_POSTCODE)
+        token = build_jwt_token(
+            [
+                "benk-brp-personen-api",
+                "benk-brp-zoekvraag-postcode-huisnummer",
+                "benk-brp-gegevensset-1",
+            ]
+        )
+        response = api_client.post(
+            reverse("brp-personen-batch"),
+            [
+                {"type": "ZoekMetPostcodeEnHuisnummer", "postcode": "1074VE", "huisnummer": 1},
+                {"type": "RaadpleegMetBurgerservicenummer", "burgerservicenummer": ["1"]},
+                {"type": "ZoekMetPostcodeEnHuisnummer", "postcode": "1074VE", "huisnummer": 2},
+            ],
+            headers={"Authorization": f"Bearer {token}", **common_headers},
+        )
+        assert response.status_code == 200, response.data
+        results = response.json()["results"]
+        assert [result["status"] for result in results] == [200, 403, 200]
+        assert results[0]["response"] == RESPONSE_POSTCODE
+        assert results[1]["error"]["code"] == "permissionDenied"
+        assert results[1]["error"]["detail"] == (
+            "U bent niet geautoriseerd voor type = RaadpleegMetBurgerservicenummer."
+        )
+        assert api_mock.call_count == 2
+
+        # Each query is logged separately
+        granted = [r for r in caplog.records if r.message.startswith("Access granted")]
+        denied = [r for r in caplog.records if r.message.startswith("Denied access")]
+        assert sorted(r.request["huisnummer"] for r in granted) == [1, 2]
+        assert {r.query_type for r in granted} == {"ZoekMetPostcodeEnHuisnummer"}
+        assert [r.query_type for r in denied] == ["RaadpleegMetBurgerservicenummer"]
+
+    def test_remote_error(self, api_client, requests_mock, common_headers):
+        """Prove that a failing call only fails that query."""
+        requests_mock.post(
+            "/lap/api/brp/personen",
+            [
+                {"json": RESPONSE_POSTCODE},
+                {
+                    "status_code": 400,
+                    "json": {"title": "Foute parameter", "detail": "De foutieve parameter(s)."},
+                    "headers": {"content-type": "application/problem+json"},
+                },
+            ],
+        )
+        token = build_jwt_token(
+            [
+                "benk-brp-personen-api",
+                "benk-brp-zoekvraag-postcode-huisnummer",
+                "benk-brp-gegevensset-1",
+            ]
+        )
+        query = {"type": "ZoekMetPostcodeEnHuisnummer", "postcode": "1074VE", "huisnummer": 1}
+        response = api_client.post(
+            reverse("brp-personen-batch"),
+            [query, {**query, "huisnummer": 2}],
+            headers={"Authorization": f"Bearer {token}", **common_headers},
+        )
+        assert response.status_code == 200, response.data
+        assert sorted(result["status"] for result in response.json()["results"]) == [200, 400]
+
+    def test_ndjson(self, api_client, requests_mock, common_headers):
+        """Prove that ?_format=ndjson streams each result as a separate line."""
+        requests_mock.post("/lap/api/brp/personen", json=RESPONSE_POSTCODE)
+        token = build_jwt_token(
+            [
+                "benk-brp-personen-api",
+                "benk-brp-zoekvraag-postcode-huisnummer",
+                "benk-brp-gegevensset-1",
+            ]
+        )
+        query = {"type": "ZoekMetPostcodeEnHuisnummer", "postcode": "1074VE", "huisnummer": 1}
+        response = api_client.post(
+            reverse("brp-personen-batch") + "?_format=ndjson",
+            [query, {"type": "RaadpleegMetBurgerservicenummer", "burgerservicenummer": ["1"]}],
+            headers={"Authorization": f"Bearer {token}", **common_headers},
+        )
+        assert response.status_code == 200
+        lines = [orjson.loads(line) for line in b"".join(response.streaming_content).splitlines()]
+        assert [line["status"] for line in lines] == [200, 403]
+        assert lines[0]["response"] == RESPONSE_POSTCODE
+
+    def test_invalid_batch(self, api_client, common_headers):
+        """Prove that the request should contain a list of queries."""
+        token = build_jwt_token(["benk-brp-personen-api"])
+        response = api_client.post(
+            reverse("brp-personen-batch"),
+            {"type": "ZoekMetPostcodeEnHuisnummer"},
+            headers={"Authorization": f"Bearer {token}", **common_headers},
+        )
+        assert response.status_code == 400, response.data
+        assert response.json()["detail"] == "Het verzoek moet een lijst met zoekvragen bevatten."
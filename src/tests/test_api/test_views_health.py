@@ -29,4 +29,8 @@ class TestHealthCheck:
         assert response.json() == {
             "success": True,
             "response": self.RESPONSE_HEALTHCHECK,
+            "stats": {
+                "cache": {"entries": 0, "size": 0},
+                "authorization_profiles": {"hits": 0, "misses": 0, "hit_rate": 0, "size": 0},
+            },
         }
@@ -1,8 +1,12 @@
+import io
 from copy import deepcopy
 
+import orjson
 import pytest
 from django.urls import reverse
 
+from haal_centraal_proxy.bevragingen.bulkhead import get_bulkhead
+from haal_centraal_proxy.bevragingen.circuitbreaker import get_circuit_breaker
 from haal_centraal_proxy.bevragingen.fields import read_dataset_fields_files
 from haal_centraal_proxy.bevragingen.permissions import ParameterPolicy
 from haal_centraal_proxy.bevragingen.views.base import SCOPE_ENCRYPT_BSN
@@ -11,6 +15,7 @@ from haal_centraal_proxy.bevragingen.views.personen import (
     SCOPE_INCLUDE_DECEASED,
     SCOPE_NATIONWIDE,
     BrpPersonenView,
+    get_authorization_profile_stats,
 )
 from tests.utils import build_jwt_token
 
@@ -583,6 +588,29 @@ class TestBrpPersonenView:
             ],
         }
 
+    def test_transform_cached_profile(self):
+        """Prove that the authorization profile is reused for the same scopes and type."""
+        hc_requests = []
+        for user_scopes in (
+            {"benk-brp-zoekvraag-bsn", "benk-brp-gegevensset-1"},
+            {"benk-brp-gegevensset-1", "benk-brp-zoekvraag-bsn"},
+        ):
+            view = BrpPersonenView()
+            view.user_scopes = user_scopes
+            hc_request = {"type": "RaadpleegMetBurgerservicenummer"}
+            view.transform_request(hc_request)
+            hc_requests.append(hc_request)
+
+        # The fields list is not shared, as the identifier fields are appended to it.
+        assert hc_requests[0] == hc_requests[1]
+        assert hc_requests[0]["fields"] is not hc_requests[1]["fields"]
+        assert get_authorization_profile_stats() == {
+            "hits": 1,
+            "misses": 1,
+            "hit_rate": 0.5,
+            "size": 1,
+        }
+
     def test_transform_missing_sets(self, api_client, common_headers):
         """Prove that not having access to a set is handled gracefully."""
         url = reverse("brp-personen")
@@ -620,7 +648,10 @@ class TestBrpPersonenView:
             "/lap/api/brp/personen",
             json={
                 "type": "ZoekMetPostcodeEnHuisnummer",
-                "personen": [person1, person2],
+                "personen": [
+                    {**person1, "burgerservicenummer": "999993240"},
+                    {**person2, "burgerservicenummer": "999993252"},
+                ],
             },
             headers={"content-type": "application/json"},
         )
@@ -655,6 +686,13 @@ class TestBrpPersonenView:
                 m.startswith("Removed 1 persons from response") for m in caplog.messages
             ), caplog.messages
 
+        # Hidden persons and removed identifiers are still logged.
+        for bsn in ("999993240", "999993252"):
+            assert (
+                "User text@example.com retrieved using 'personen.ZoekMetPostcodeEnHuisnummer':"
+                f" aNummer=? burgerservicenummer={bsn}"
+            ) in caplog.messages
+
     @pytest.mark.parametrize("can_see_bsn", [True, False])
     def test_log_retrieved_bsns(
         self, api_client, requests_mock, caplog, monkeypatch, can_see_bsn, common_headers
@@ -947,3 +985,267 @@ class TestBrpPersonenView:
         assert any(
             m.startswith(access_denied_message) and SCOPE_ENCRYPT_BSN in m for m in log_messages
         )
+
+    def test_split_bsn_list(self, api_client, requests_mock, caplog, common_headers):
+        """Prove that large lists of BSN's are split into multiple calls,
+        and the persons are returned and logged as if it was a single call.
+        """
+
+        def _get_personen(request, context):
+            return {
+                "type": "RaadpleegMetBurgerservicenummer",
+                "personen": [
+                    {
+                        "burgerservicenummer": bsn,
+                        "geheimhoudingPersoonsgegevens": 1 if bsn == "000000021" else 0,
+                    }
+                    for bsn in request.json()["burgerservicenummer"]
+                ],
+            }
+
+        api_mock = requests_mock.post("/lap/api/brp/personen", json=_get_personen)
+        bsns = [f"{i:09d}" for i in range(45)]
+        token = build_jwt_token(
+            ["benk-brp-personen-api", "benk-brp-zoekvraag-bsn", "benk-brp-gegevensset-1"]
+        )
+        response = api_client.post(
+            reverse("brp-personen"),
+            {
+                "type": "RaadpleegMetBurgerservicenummer",
+                "burgerservicenummer": bsns,
+                "fields": ["burgerservicenummer"],
+            },
+            headers={"Authorization": f"Bearer {token}", **common_headers},
+        )
+        assert response.status_code == 200, response.data
+
+        assert sorted(len(r.json()["burgerservicenummer"]) for r in api_mock.request_history) == [
+            5,
+            20,
+            20,
+        ]
+        expected = [bsn for bsn in bsns if bsn != "000000021"]  # confidential person is hidden
+        assert [p["burgerservicenummer"] for p in response.json()["personen"]] == expected
+
+        access_logs = [m for m in caplog.messages if m.startswith("Access granted")]
+        retrieved_logs = [m for m in caplog.messages if " retrieved using " in m]
+        assert len(access_logs) == 1
+        assert len(retrieved_logs) == 45
+
+    def test_split_bsn_list_ndjson(self, api_client, requests_mock, common_headers):
+        """Prove that the persons of a split request are also written as separate lines."""
+
+        def _get_personen(request, context):
+            bsns = request.json()["burgerservicenummer"]
+            return {"personen": [{"burgerservicenummer": bsn} for bsn in bsns]}
+
+        requests_mock.post("/lap/api/brp/personen", json=_get_personen)
+        bsns = [f"{i:09d}" for i in range(25)]
+        token = build_jwt_token(
+            ["benk-brp-personen-api", "benk-brp-zoekvraag-bsn", "benk-brp-gegevensset-1"]
+        )
+        response = api_client.post(
+            reverse("brp-personen") + "?_format=ndjson",
+            {
+                "type": "RaadpleegMetBurgerservicenummer",
+                "burgerservicenummer": bsns,
+                "fields": ["burgerservicenummer"],
+            },
+            headers={"Authorization": f"Bearer {token}", **common_headers},
+        )
+        assert response.status_code == 200
+        assert response["Content-Type"] == "application/x-ndjson"
+        lines = b"".join(response.streaming_content).splitlines()
+        assert [orjson.loads(line)["burgerservicenummer"] for line in lines] == bsns
+
+    def test_split_bsn_list_partial_failure(
+        self, api_client, requests_mock, caplog, common_headers
+    ):
+        """Prove that the persons of the successful calls are still logged,
+        when the call for another part of the list failed.
+        """
+
+        def _get_personen(request, context):
+            bsns = request.json()["burgerservicenummer"]
+            if "000000020" in bsns:
+                context.status_code = 500
+                return {"title": "Interne server fout.", "status": 500}
+            return {"personen": [{"burgerservicenummer": bsn} for bsn in bsns]}
+
+        requests_mock.post("/lap/api/brp/personen", json=_get_personen)
+        token = build_jwt_token(
+            ["benk-brp-personen-api", "benk-brp-zoekvraag-bsn", "benk-brp-gegevensset-1"]
+        )
+        response = api_client.post(
+            reverse("brp-personen"),
+            {
+                "type": "RaadpleegMetBurgerservicenummer",
+                "burgerservicenummer": [f"{i:09d}" for i in range(25)],
+                "fields": ["burgerservicenummer"],
+            },
+            headers={"Authorization": f"Bearer {token}", **common_headers},
+        )
+        assert response.status_code == 502, response.data
+
+        access_logs = [m for m in caplog.messages if m.startswith("Access granted")]
+        retrieved_logs = [m for m in caplog.messages if " retrieved using " in m]
+        assert len(access_logs) == 1
+        assert "error returned" in access_logs[0]
+        assert len(retrieved_logs) == 20
+        assert retrieved_logs[0].endswith("burgerservicenummer=000000000")
+
+    def test_split_bsn_list_too_long(self, api_client, requests_mock, common_headers, settings):
+        """Prove that the number of BSN's is limited, as every 20 BSN's take a separate call."""
+        settings.BRP_PERSONEN_MAX_BSN = 40
+        api_mock = requests_mock.post("/lap/api/brp/personen", json={"personen": []})
+        token = build_jwt_token(
+            ["benk-brp-personen-api", "benk-brp-zoekvraag-bsn", "benk-brp-gegevensset-1"]
+        )
+        response = api_client.post(
+            reverse("brp-personen"),
+            {
+                "type": "RaadpleegMetBurgerservicenummer",
+                "burgerservicenummer": [f"{i:09d}" for i in range(41)],
+            },
+            headers={"Authorization": f"Bearer {token}", **common_headers},
+        )
+        assert response.status_code == 400, response.data
+        assert response.json()["invalidParams"][0]["code"] == "maxItems"
+        assert not api_mock.called
+
+    def test_ndjson(self, api_client, requests_mock, common_headers):
+        """Prove that ?_format=ndjson streams each person as a separate line."""
+        requests_mock.post(
+            "/lap/api/brp/personen",
+            json={
+                "type": "ZoekMetPostcodeEnHuisnummer",
+                "personen": [
+                    {"naam": {"geslachtsnaam": "Moes"}, "burgerservicenummer": "999993240"},
+                    {"naam": {"geslachtsnaam": "Jansen"}, "burgerservicenummer": "999993252"},
+                ],
+            },
+        )
+        token = build_jwt_token(
+            [
+                "benk-brp-personen-api",
+                "benk-brp-zoekvraag-postcode-huisnummer",
+                "benk-brp-gegevensset-1",
+            ]
+        )
+        response = api_client.post(
+            reverse("brp-personen") + "?_format=ndjson",
+            {"type": "ZoekMetPostcodeEnHuisnummer", "postcode": "1074VE", "huisnummer": 1},
+            headers={"Authorization": f"Bearer {token}", **common_headers},
+        )
+        assert response.status_code == 200
+        assert response.streaming
+        assert response["Content-Type"] == "application/x-ndjson"
+        assert b"".join(response.streaming_content).splitlines() == [
+            b'{"naam":{"geslachtsnaam":"Moes"},"burgerservicenummer":"999993240"}',
+            b'{"naam":{"geslachtsnaam":"Jansen"},"burgerservicenummer":"999993252"}',
+        ]
+
+    def test_ndjson_log_retrieved_bsns(self, api_client, requests_mock, caplog, common_headers):
+        """Prove that streamed persons are still logged, and inserted identifiers are removed."""
+        requests_mock.post(
+            "/lap/api/brp/personen",
+            json={
+                "type": "ZoekMetPostcodeEnHuisnummer",
+                "personen": [
+                    {"naam": {"geslachtsnaam": "Moes"}, "burgerservicenummer": "999993240"},
+                    {"naam": {"geslachtsnaam": "Jansen"}, "burgerservicenummer": "999993252"},
+                ],
+            },
+        )
+        token = build_jwt_token(
+            [
+                "benk-brp-personen-api",
+                "benk-brp-zoekvraag-postcode-huisnummer",
+                "benk-brp-gegevensset-1",
+            ]
+        )
+        response = api_client.post(
+            reverse("brp-personen") + "?_format=ndjson",
+            {
+                "type": "ZoekMetPostcodeEnHuisnummer",
+                "postcode": "1074VE",
+                "huisnummer": 1,
+                "fields": ["naam.geslachtsnaam"],
+            },
+            headers={"Authorization": f"Bearer {token}", **common_headers},
+        )
+        assert response.status_code == 200
+        assert b"".join(response.streaming_content).splitlines() == [
+            b'{"naam":{"geslachtsnaam":"Moes"}}',
+            b'{"naam":{"geslachtsnaam":"Jansen"}}',
+        ]
+        for bsn in ("999993240", "999993252"):
+            assert (
+                "User text@example.com retrieved using 'personen.ZoekMetPostcodeEnHuisnummer':"
+                f" aNummer=? burgerservicenummer={bsn}"
+            ) in caplog.messages
+
+    def test_ndjson_broken_stream(
+        self, api_client, requests_mock, caplog, common_headers, settings
+    ):
+        """Prove that a connection that breaks while streaming is logged as a failed call,
+        and the bulkhead and circuit breaker only see the outcome afterwards.
+        """
+        settings.BRP_BULKHEAD = True
+        settings.BRP_CIRCUIT_BREAKER = True
+
+        class BrokenBody(io.RawIOBase):
+            def __init__(self):
+                self.chunks = [
+                    b'{"type": "ZoekMetPostcodeEnHuisnummer", "personen": [',
+                    b'{"naam": {"geslachtsnaam": "Moes"}, "burgerservicenummer": "999993240"},',
+                ]
+
+            def readable(self):
+                return True
+
+            def readinto(self, buffer):
+                if not self.chunks:
+                    raise ConnectionResetError("connection reset by peer")
+                chunk = self.chunks.pop(0)
+                buffer[: len(chunk)] = chunk
+                return len(chunk)
+
+        requests_mock.post("/lap/api/brp/personen", body=BrokenBody())
+        token = build_jwt_token(
+            [
+                "benk-brp-personen-api",
+                "benk-brp-zoekvraag-postcode-huisnummer",
+                "benk-brp-gegevensset-1",
+            ]
+        )
+        response = api_client.post(
+            reverse("brp-personen") + "?_format=ndjson",
+            {"type": "ZoekMetPostcodeEnHuisnummer", "postcode": "1074VE", "huisnummer": 1},
+            headers={"Authorization": f"Bearer {token}", **common_headers},
+        )
+        assert response.status_code == 200
+        bulkhead = get_bulkhead(BrpPersonenView.endpoint_url)
+        circuit_breaker = get_circuit_breaker(BrpPersonenView.endpoint_url)
+        assert bulkhead.get_stats()["in_flight"] == 1  # still reading the body
+
+        with pytest.raises(OSError):
+            b"".join(response.streaming_content)
+
+        assert bulkhead.get_stats()["in_flight"] == 0
+        assert circuit_breaker.get_stats()["failure_rate"] == 1
+        records = [r for r in caplog.records if r.message.startswith("Access granted")]
+        assert len(records) == 1
+        assert "connection reset by peer" in records[0].exception
+
+    def test_ndjson_error(self, api_client, common_headers):
+        """Prove that errors are still returned as problem+json with ?_format=ndjson."""
+        token = build_jwt_token(["benk-brp-personen-api", "benk-brp-gegevensset-1"])
+        response = api_client.post(
+            reverse("brp-personen") + "?_format=ndjson",
+            {"type": "ZoekMetPostcodeEnHuisnummer", "postcode": "1074VE", "huisnummer": 1},
+            headers={"Authorization": f"Bearer {token}", **common_headers},
+        )
+        assert response.status_code == 403
+        assert response["Content-Type"] == "application/problem+json"
+        assert response.json()["code"] == "permissionDenied"
@@ -118,7 +118,7 @@ class TestBrpVerblijfplaatshistorieView:
 
         # Create an encrypted BSN with the correlation id as salt to use in the request
         encrypted_bsn = encryption.encrypt("999993240", salt=common_headers["X-Correlation-ID"])
-        assert encrypted_bsn.startswith("gAAAAABo")
+        assert encrypted_bsn.startswith("gAAAAA")
 
         response = api_client.post(
             url,
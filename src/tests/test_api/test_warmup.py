@@ -0,0 +1,149 @@
+import asyncio
+import logging
+
+import httpx
+import pytest
+import requests
+import requests_mock as rm
+from django.urls import path, reverse
+
+from haal_centraal_proxy.bevragingen import urls, views, warmup
+from haal_centraal_proxy.bevragingen.client import BrpClient
+from haal_centraal_proxy.bevragingen.views import base
+
+
+@pytest.fixture
+def async_views(monkeypatch) -> list[httpx.Request]:
+    """Use the async views, with a mocked transport for their clients."""
+    requests = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        requests.append(request)
+        return httpx.Response(400, json={"title": "Foute parameter"})
+
+    get_client_kwargs = base.AsyncClientMixin.get_client_kwargs
+    monkeypatch.setattr(
+        base.AsyncClientMixin,
+        "get_client_kwargs",
+        lambda self: {**get_client_kwargs(self), "transport": httpx.MockTransport(handler)},
+    )
+    monkeypatch.setattr(
+        urls,
+        "urlpatterns",
+        [
+            path("personen", views.BrpPersonenAsyncView.as_view()),
+            path("bewoningen", views.BrpBewoningenAsyncView.as_view()),
+        ],
+    )
+    return requests
+
+
+class TestWarmup:
+    """Prove that a worker can be prepared before it handles requests."""
+
+    def test_warm_up(self, requests_mock):
+        """Prove that connections are opened for each endpoint."""
+        api_mock = requests_mock.post(rm.ANY, status_code=400)
+        status = warmup.warm_up(connections=2)
+        assert status.ready
+        assert status.errors == {}
+
+        # 2 connections for each of the 3 endpoints.
+        assert [request.json() for request in api_mock.request_history] == [
+            {"type": "healthcheck"}
+        ] * 6
+
+    def test_warm_up_failed(self, requests_mock):
+        """Prove that an unreachable endpoint doesn't keep the worker from handling requests."""
+        requests_mock.post(rm.ANY, exc=requests.ConnectionError("Connection refused"))
+        status = warmup.warm_up(connections=1)
+        assert status.ready
+        assert len(status.errors) == 3
+
+    def test_warm_up_unexpected_error(self, monkeypatch):
+        """Prove that any error still marks the worker as ready."""
+
+        def _fail(*args, **kwargs):
+            raise ValueError("Invalid token response")
+
+        monkeypatch.setattr(BrpClient, "warm_up", _fail)
+        status = warmup.warm_up(connections=1)
+        assert status.ready
+        assert status.duration is not None
+        assert set(status.errors.values()) == {"Invalid token response"}
+
+    def test_warm_up_no_connections(self, requests_mock):
+        """Prove that at least one connection is opened when the setting is 0."""
+        api_mock = requests_mock.post(rm.ANY, status_code=400)
+        status = warmup.warm_up(connections=0)
+        assert status.ready
+        assert status.errors == {}
+        assert api_mock.call_count == 3
+
+    @pytest.mark.parametrize("enabled", [True, False])
+    def test_readiness(self, api_client, settings, requests_mock, enabled):
+        """Prove that the readiness endpoint waits for the warm-up."""
+        settings.BRP_WARMUP = enabled
+        url = reverse("brp-ready")
+        response = api_client.get(url)
+        assert response.status_code == (503 if enabled else 200)
+        assert response.json() == {"ready": not enabled}
+
+        requests_mock.post(rm.ANY, status_code=400)
+        warmup.warm_up(connections=1)
+        response = api_client.get(url)
+        assert response.status_code == 200
+        assert response.json()["ready"]
+
+
+class TestAsyncWarmup:
+    """Prove that the async clients are warmed up for the event loop that handles requests."""
+
+    def test_awarm_up(self, async_views):
+        """Prove that the connections are opened by the clients of the running event loop."""
+
+        async def main():
+            status = await warmup.awarm_up(connections=2)
+            client = views.BrpPersonenAsyncView().get_client()
+            return status, client
+
+        status, client = asyncio.run(main())
+        assert status.ready
+        assert status.errors == {}
+        assert len(async_views) == 4  # 2 connections for each of the 2 endpoints.
+        assert not client._async_session.is_closed
+
+    def test_schedule_in_event_loop(self, async_views, settings):
+        """Prove that the warm-up runs in the event loop of the ASGI server that loads the app."""
+        settings.BRP_WARMUP = True
+
+        async def main():
+            warmup.schedule_warm_up()
+            assert not warmup.get_status()["ready"]
+            await warmup._task
+            return warmup.get_status()
+
+        assert asyncio.run(main())["ready"]
+        assert len(async_views) == 4
+
+    def test_warm_up_without_event_loop(self, async_views, caplog):
+        """Prove that without the event loop, the async clients are still prepared,
+        and it's logged that their connections are not reused.
+        """
+        clients = []
+        get_client = base.AsyncClientMixin.get_client
+
+        def _get_client(self):
+            clients.append(get_client(self))
+            return clients[-1]
+
+        with pytest.MonkeyPatch.context() as monkeypatch:
+            monkeypatch.setattr(base.AsyncClientMixin, "get_client", _get_client)
+            with caplog.at_level(logging.WARNING):
+                status = warmup.warm_up(connections=1)
+
+        assert status.ready
+        assert status.errors == {}
+        assert len(async_views) == 2
+        assert "Warm-up of async views runs outside the event loop" in caplog.text
+        assert all(client._async_session.is_closed for client in clients)